@@ -1,21 +1,56 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
+import queue
 import shutil
+import threading
+from itertools import islice
 from pathlib import Path
 
 from deadlock_core import DeadlockCore
-from csv_loader import load_csv
+from csv_loader import iter_operations, load_trace, pooled_trace_error
+from csv_export import DELTA_EXTENSIONS
+from delta_store import DeltaLogger
+from graph_view import GraphView
+from replay import TraceReplayer
+from timeline import build_timeline
 
 # Get the directory where this script is located
 SCRIPT_DIR = Path(__file__).parent
 INPUT_DIR = SCRIPT_DIR / "input"
 
+# The lists only show this many rows; use the filter to find the rest
+MAX_ROWS = 500
+# Operations between progress updates / cancel checks of a background load
+PROGRESS_EVERY = 20000
+
+
+class _Cancelled(Exception):
+    pass
+
 
 class DeadlockVisualizer:
-    def __init__(self, core, file_path=None):
+    def __init__(self, core, file_path=None, cache_dir=None):
         self.core = core
         self.file_path = file_path
+        # Loads keep a compiled copy of the trace here; None: parse each time
+        self.cache_dir = cache_dir
+        self.replayer = None
+
+        # Background job state (one job at a time)
+        self._job_queue = None
+        self._job_cancel = None
+        self._job_done = None
+
+        # Rows currently shown, so a refresh only touches what changed
+        self._process_rows = []
+        self._resource_rows = []
+
+        # Wait-for graph window, while it is open
+        self.graph_view = None
+
+        # Deadlock intervals of the loaded trace, built on first use
+        self.timeline = None
 
         self.root = tk.Tk()
         self.root.title("Deadlock Visualization")
@@ -33,21 +68,76 @@ class DeadlockVisualizer:
         file_frame = ttk.LabelFrame(main_frame, text="Load CSV File", padding=10)
         file_frame.pack(fill=tk.X, pady=10)
 
-        ttk.Button(
+        self.input_btn = ttk.Button(
             file_frame,
             text="Choose from Input Folder",
             command=self._load_from_input
-        ).pack(side=tk.LEFT, padx=5)
+        )
+        self.input_btn.pack(side=tk.LEFT, padx=5)
 
-        ttk.Button(
+        self.computer_btn = ttk.Button(
             file_frame,
             text="Choose from Computer",
             command=self._load_from_computer
-        ).pack(side=tk.LEFT, padx=5)
+        )
+        self.computer_btn.pack(side=tk.LEFT, padx=5)
 
         self.file_label = ttk.Label(file_frame, text="No file loaded", foreground="gray")
         self.file_label.pack(side=tk.LEFT, padx=20)
 
+        # Step slider: scrub through the loaded trace
+        step_frame = ttk.Frame(main_frame)
+        step_frame.pack(fill=tk.X)
+
+        self.step_scale = tk.Scale(
+            step_frame,
+            from_=0,
+            to=0,
+            orient=tk.HORIZONTAL,
+            showvalue=False,
+            state=tk.DISABLED,
+            command=self._on_step_change
+        )
+        self.step_scale.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.step_label = ttk.Label(step_frame, text="Step: -", width=40)
+        self.step_label.pack(side=tk.LEFT, padx=10)
+
+        # Progress of background load/detection
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.pack(fill=tk.X, pady=5)
+
+        self.progress = ttk.Progressbar(progress_frame, mode="determinate", maximum=100)
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.progress_label = ttk.Label(progress_frame, text="", width=30)
+        self.progress_label.pack(side=tk.LEFT, padx=10)
+
+        self.cancel_btn = ttk.Button(
+            progress_frame,
+            text="Cancel",
+            state=tk.DISABLED,
+            command=self._cancel_job
+        )
+        self.cancel_btn.pack(side=tk.LEFT)
+
+        # Filter for the process/resource lists
+        filter_frame = ttk.Frame(main_frame)
+        filter_frame.pack(fill=tk.X)
+
+        ttk.Label(filter_frame, text="Filter:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *_: self._refresh_views())
+        ttk.Entry(filter_frame, textvariable=self.filter_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+        self.blocked_only = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            filter_frame,
+            text="Waiting only",
+            variable=self.blocked_only,
+            command=self._refresh_views
+        ).pack(side=tk.LEFT)
+
         # Separator
         ttk.Separator(main_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
 
@@ -60,12 +150,18 @@ class DeadlockVisualizer:
         
         ttk.Label(left_frame, text="Processes", font=("Arial", 12, "bold")).pack(anchor=tk.W)
 
+        self.process_count = ttk.Label(left_frame, text="", foreground="gray")
+        self.process_count.pack(anchor=tk.W)
+
         self.process_list = tk.Listbox(left_frame, height=12)
         self.process_list.pack(fill=tk.BOTH, expand=True, pady=5)
 
       
         ttk.Label(left_frame, text="Resources", font=("Arial", 12, "bold")).pack(anchor=tk.W)
 
+        self.resource_count = ttk.Label(left_frame, text="", foreground="gray")
+        self.resource_count.pack(anchor=tk.W)
+
         self.resource_list = tk.Listbox(left_frame, height=12)
         self.resource_list.pack(fill=tk.BOTH, expand=True, pady=5)
 
@@ -84,12 +180,12 @@ class DeadlockVisualizer:
         button_frame = ttk.Frame(right_frame)
         button_frame.pack(pady=10)
 
-        detect_btn = ttk.Button(
+        self.detect_btn = ttk.Button(
             button_frame,
             text="Detect Deadlock",
             command=self._detect_deadlock
         )
-        detect_btn.pack(side=tk.LEFT, padx=5)
+        self.detect_btn.pack(side=tk.LEFT, padx=5)
 
         export_btn = ttk.Button(
             button_frame,
@@ -98,6 +194,20 @@ class DeadlockVisualizer:
         )
         export_btn.pack(side=tk.LEFT, padx=5)
 
+        graph_btn = ttk.Button(
+            button_frame,
+            text="Graph View",
+            command=self._open_graph_view
+        )
+        graph_btn.pack(side=tk.LEFT, padx=5)
+
+        self.timeline_btn = ttk.Button(
+            button_frame,
+            text="Deadlock Timeline",
+            command=self._show_timeline
+        )
+        self.timeline_btn.pack(side=tk.LEFT, padx=5)
+
         refresh_btn = ttk.Button(
             right_frame,
             text="Refresh View",
@@ -157,32 +267,147 @@ class DeadlockVisualizer:
             self._load_csv_file(file_path)
 
     def _load_csv_file(self, file_path):
-        """Load and apply CSV file"""
+        """Load and apply CSV file on a worker thread"""
+        file_name = Path(file_path).name
+        cache_dir = self.cache_dir
+        self._start_job(
+            f"Loading {file_name}",
+            lambda progress, cancel: _load_trace(file_path, progress, cancel, cache_dir),
+            lambda replayer: self._on_loaded(file_path, replayer),
+            "Failed to load file"
+        )
+
+    def _on_loaded(self, file_path, replayer):
+        # The previous state is only replaced once the whole file is valid.
+        # The replayer keeps the packed operations and snapshots for the
+        # step slider.
+        self.replayer = replayer
+        self.core = replayer.core
+        self.timeline = None
+
+        total = len(replayer)
+        self.step_scale.config(state=tk.NORMAL, to=total)
+        self.step_scale.set(total)
+        self._update_step_label(total)
+
+        # Update file label
+        self.file_path = file_path
+        file_name = Path(file_path).name
+        self.file_label.config(text=f"Loaded: {file_name}", foreground="green")
+
+        # Refresh UI
+        self._refresh_views()
+
+        messagebox.showinfo("Success", f"File loaded successfully: {file_name}")
+
+    def _start_job(self, title, work, on_done, error_title):
+        """Run work(progress, cancel) on a worker thread.
+
+        The worker only talks to Tk through a queue that the main thread
+        drains with root.after, so the window stays responsive.
+        """
+        if self._job_queue is not None:
+            messagebox.showwarning("Busy", "Please wait for the current task to finish")
+            return
+
+        jobs = queue.Queue()
+        cancel = threading.Event()
+
+        def progress(fraction, text):
+            jobs.put(("progress", fraction, text))
+
+        def run():
+            try:
+                jobs.put(("done", work(progress, cancel)))
+            except _Cancelled:
+                jobs.put(("cancelled",))
+            except Exception as e:
+                jobs.put(("error", e))
+
+        self._job_queue = jobs
+        self._job_cancel = cancel
+        self._job_done = (on_done, error_title)
+        self._set_busy(True, title)
+
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(50, self._poll_job)
+
+    def _poll_job(self):
+        jobs = self._job_queue
+        if jobs is None:
+            return
+
         try:
-            ops = load_csv(file_path)
-            
-            if not ops:
-                messagebox.showwarning("Empty File", "CSV file is empty or invalid")
+            while True:
+                message = jobs.get_nowait()
+                kind = message[0]
+
+                if kind == "progress":
+                    self._show_progress(message[1], message[2])
+                    continue
+
+                on_done, error_title = self._job_done
+                self._job_queue = self._job_cancel = self._job_done = None
+                self._set_busy(False, "")
+
+                if kind == "done":
+                    on_done(message[1])
+                elif kind == "error":
+                    messagebox.showerror("Error", f"{error_title}:\n{str(message[1])}")
+                else:
+                    self.progress_label.config(text="Cancelled")
                 return
-            
-            # Clear previous data
-            self.core = DeadlockCore()
-            
-            # Apply operations
-            _apply_operations(self.core, ops)
-            
-            # Update file label
-            self.file_path = file_path
-            file_name = Path(file_path).name
-            self.file_label.config(text=f"Loaded: {file_name}", foreground="green")
-            
-            # Refresh UI
-            self._refresh_views()
-            
-            messagebox.showinfo("Success", f"File loaded successfully: {file_name}")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load file:\n{str(e)}")
+        except queue.Empty:
+            pass
+
+        self.root.after(50, self._poll_job)
+
+    def _cancel_job(self):
+        if self._job_cancel is not None:
+            self._job_cancel.set()
+
+    def _set_busy(self, busy, text):
+        state = tk.DISABLED if busy else tk.NORMAL
+        for button in (self.input_btn, self.computer_btn, self.detect_btn, self.timeline_btn):
+            button.config(state=state)
+        self.cancel_btn.config(state=tk.NORMAL if busy else tk.DISABLED)
+
+        if self.replayer is not None:
+            self.step_scale.config(state=state)
+
+        self.progress.stop()
+        self.progress.config(mode="determinate", value=0)
+        self.progress_label.config(text=text)
+
+    def _show_progress(self, fraction, text):
+        if fraction is None:
+            if str(self.progress.cget("mode")) != "indeterminate":
+                self.progress.config(mode="indeterminate")
+                self.progress.start(20)
+        else:
+            self.progress.stop()
+            self.progress.config(mode="determinate", value=fraction * 100)
+        self.progress_label.config(text=text)
+
+    def _on_step_change(self, value):
+        if self.replayer is None:
+            return
+
+        step = int(float(value))
+        if step == self.replayer.step:
+            return
+
+        self.core = self.replayer.seek(step)
+        self._update_step_label(step)
+        self._refresh_views()
+
+    def _update_step_label(self, step):
+        total = len(self.replayer)
+        text = f"Step: {step} / {total}"
+        if step:
+            op = self.replayer.operation(step)
+            text += f"  ({op['process']} {op['action']} {op['resource']})"
+        self.step_label.config(text=text)
 
     def _export_result(self):
         """Export result.csv to a location chosen by user"""
@@ -198,11 +423,21 @@ class DeadlockVisualizer:
         save_path = filedialog.asksaveasfilename(
             title="Export Result CSV",
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            filetypes=[("CSV files", "*.csv"), ("SQLite delta store", "*.db"),
+                       ("All files", "*.*")],
             initialfile="result.csv"
         )
-        
-        if save_path:
+
+        if save_path and save_path.endswith(DELTA_EXTENSIONS) and self.replayer is not None:
+            # Re-run the loaded trace into an indexed delta store
+            self._start_job(
+                f"Exporting {Path(save_path).name}",
+                lambda progress, cancel: _export_delta_store(self.replayer, save_path,
+                                                             progress, cancel),
+                lambda _: messagebox.showinfo("Success", f"Result exported to:\n{save_path}"),
+                "Failed to export file"
+            )
+        elif save_path:
             try:
                 shutil.copy(str(result_file), save_path)
                 messagebox.showinfo("Success", f"Result exported to:\n{save_path}")
@@ -210,28 +445,129 @@ class DeadlockVisualizer:
                 messagebox.showerror("Error", f"Failed to export file:\n{str(e)}")
 
     def _refresh_views(self):
-        self.process_list.delete(0, tk.END)
-        self.resource_list.delete(0, tk.END)
+        needle = self.filter_var.get().strip().lower()
+        waiting_only = self.blocked_only.get()
 
-        for p in self.core.processes.values():
+        processes = self.core.processes.values()
+        if needle:
+            processes = (p for p in processes if needle in p.name.lower())
+        if waiting_only:
+            processes = (p for p in processes if p.waiting_for is not None)
+
+        process_rows = []
+        for p in islice(processes, MAX_ROWS):
             holding = ", ".join(r.name for r in p.holding) or "None"
             waiting = p.waiting_for.name if p.waiting_for else "None"
-            self.process_list.insert(
-                tk.END,
-                f"{p.name} | Holding: {holding} | Waiting: {waiting}"
-            )
+            process_rows.append(f"{p.name} | Holding: {holding} | Waiting: {waiting}")
 
-        for r in self.core.resources.values():
+        resources = self.core.resources.values()
+        if needle:
+            resources = (r for r in resources if needle in r.name.lower())
+
+        resource_rows = []
+        for r in islice(resources, MAX_ROWS):
             allocated = r.allocated_to.name if r.allocated_to else "None"
-            self.resource_list.insert(
-                tk.END,
-                f"{r.name} | Allocated to: {allocated}"
-            )
+            resource_rows.append(f"{r.name} | Allocated to: {allocated}")
+
+        _update_rows(self.process_list, self._process_rows, process_rows)
+        _update_rows(self.resource_list, self._resource_rows, resource_rows)
+        self._process_rows = process_rows
+        self._resource_rows = resource_rows
+
+        self.process_count.config(text=_count_text(len(process_rows), len(self.core.processes)))
+        self.resource_count.config(text=_count_text(len(resource_rows), len(self.core.resources)))
 
         self._update_deadlock_panel(None)
 
+        if self.graph_view is not None:
+            self.graph_view.set_graph(self.core.wait_for_graph())
+
+    def _open_graph_view(self):
+        if self.graph_view is not None:
+            self.graph_view.lift()
+            return
+
+        def closed():
+            self.graph_view = None
+
+        self.graph_view = GraphView(self.root, on_close=closed)
+        self.graph_view.set_graph(self.core.wait_for_graph())
+
+    def _show_timeline(self):
+        if self.replayer is None:
+            messagebox.showwarning("No Trace", "Please load a case first.")
+            return
+        if self.timeline is not None:
+            self._open_timeline_window()
+            return
+
+        replayer = self.replayer
+
+        def done(timeline):
+            if replayer is self.replayer:
+                self.timeline = timeline
+                self._open_timeline_window()
+
+        self._start_job(
+            "Indexing deadlocks",
+            lambda progress, cancel: _build_timeline(replayer, progress, cancel),
+            done,
+            "Failed to index deadlocks"
+        )
+
+    def _open_timeline_window(self):
+        timeline = self.timeline
+        window = tk.Toplevel(self.root)
+        window.title("Deadlock Timeline")
+        window.geometry("700x400")
+
+        top = ttk.Frame(window, padding=5)
+        top.pack(fill=tk.X)
+        open_only = tk.BooleanVar(value=False)
+        count = ttk.Label(top, text="", foreground="gray")
+
+        columns = ("cycle", "formed", "closed_by", "resolved")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for column, title, width in zip(columns, ("Cycle", "Formed", "Closed by", "Resolved"),
+                                        (300, 70, 220, 70)):
+            tree.heading(column, text=title)
+            tree.column(column, width=width, stretch=column == "cycle")
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        def fill():
+            if open_only.get():
+                intervals = timeline.active_at(self.replayer.step)
+            else:
+                intervals = timeline.intervals
+            tree.delete(*tree.get_children())
+            for d in islice(intervals, MAX_ROWS):
+                resolved = d.resolved_step if d.resolved_step is not None else "never"
+                tree.insert("", tk.END, values=(" -> ".join(d.members), d.formed_step,
+                                                " ".join(d.closed_by), resolved))
+            count.config(text=_count_text(min(len(intervals), MAX_ROWS), len(intervals)))
+
+        def go_to_formed(_event):
+            selection = tree.selection()
+            if selection and self._job_queue is None:
+                self.step_scale.set(int(tree.set(selection[0], "formed")))
+
+        ttk.Checkbutton(top, text="Open at current step only", variable=open_only,
+                        command=fill).pack(side=tk.LEFT)
+        ttk.Button(top, text="Refresh", command=fill).pack(side=tk.LEFT, padx=5)
+        count.pack(side=tk.LEFT, padx=10)
+        tree.bind("<Double-1>", go_to_formed)
+        fill()
+
     def _detect_deadlock(self):
-        cycle = self.core.detect_deadlock()
+        core = self.core
+        self._start_job(
+            "Detecting deadlock",
+            lambda progress, cancel: core.detect_deadlock(),
+            self._on_detected,
+            "Deadlock detection failed"
+        )
+
+    def _on_detected(self, cycle):
         self._update_deadlock_panel(cycle)
 
         if cycle:
@@ -267,34 +603,103 @@ class DeadlockVisualizer:
         self.root.mainloop()
 
 
-def _apply_operations(core, operations):
-    """Apply operations (list of dicts) to a DeadlockCore instance.
+def _load_trace(file_path, progress, cancel, cache_dir=None):
+    """Worker side of a GUI load: parse the trace (or compile and reuse
+    it under `cache_dir`), then replay with progress"""
+    def parsed(count):
+        if cancel.is_set():
+            raise _Cancelled()
+        progress(None, f"Parsed {count} operations")
+
+    def operations():
+        for count, op in enumerate(iter_operations(file_path), 1):
+            if "count" in op:
+                raise pooled_trace_error()
+            if count % PROGRESS_EVERY == 0:
+                parsed(count)
+            yield op
+
+    progress(None, "Reading trace")
+    trace = None
+    if cache_dir is not None:
+        try:
+            # The replayer keeps the mapped arrays; the CSV is only parsed
+            # again when it changed since the last load
+            trace = load_trace(file_path, cache_dir, progress=parsed)
+        except OSError:
+            pass    # no usable cache directory: parse into memory instead
+        else:
+            # DeadlockCore has one instance per resource; counts would be dropped
+            if trace.counts is not None:
+                trace.close()
+                raise pooled_trace_error()
+    if trace is None:
+        trace = operations()
+    # snapshot_every=None: snapshots widen with the state and stay within
+    # the replayer's memory budget, however large the trace
+    replayer = TraceReplayer(trace, DeadlockCore(), snapshot_every=None)
+
+    total = len(replayer)
+    for step in range(PROGRESS_EVERY, total, PROGRESS_EVERY):
+        if cancel.is_set():
+            raise _Cancelled()
+        replayer.seek(step)
+        progress(step / total, f"Replayed {step} / {total}")
+
+    replayer.replay_all()
+    return replayer
+
+
+def _build_timeline(replayer, progress, cancel):
+    """Worker side of the timeline: one pass over the loaded trace"""
+    total = len(replayer)
+
+    def batches():
+        for start in range(0, total, PROGRESS_EVERY):
+            if cancel.is_set():
+                raise _Cancelled()
+            stop = min(start + PROGRESS_EVERY, total)
+            yield (replayer.names, replayer.codes[start:stop],
+                   replayer.process_ids[start:stop], replayer.resource_ids[start:stop])
+            progress(stop / total, f"Indexed {stop} / {total}")
+
+    return build_timeline(batches())
+
+
+def _export_delta_store(replayer, save_path, progress, cancel):
+    """Worker side of a .db export: replay the trace into a DeltaLogger.
+
+    Uses its own core, so the state shown in the window is not touched.
     """
-    for op in operations:
-        process = op["process"]
-        action = op["action"]
-        resource = op["resource"]
-
-        
-        if process not in core.processes:
-            core.create_process(process)
-        if resource not in core.resources:
-            core.create_resource(resource)
-
-        if action in ("request", "hold"):
-            core.request_resource(process, resource)
-        elif action == "release":
-           
-            r = core.resources[resource]
-            p = core.processes[process]
-            if r in p.holding:
-                p.holding.remove(r)
-            if r.allocated_to == p:
-                r.allocated_to = None
-           
-            for proc in core.processes.values():
-                if proc.waiting_for == r:
-                    proc.waiting_for = None
+    core = DeadlockCore()
+    total = len(replayer)
+    with DeltaLogger(core, save_path) as logger:
+        for start in range(0, total, PROGRESS_EVERY):
+            if cancel.is_set():
+                raise _Cancelled()
+            stop = min(start + PROGRESS_EVERY, total)
+            core.apply_batch(replayer.names, replayer.codes, replayer.process_ids,
+                             replayer.resource_ids, start, stop, on_step=logger.log_step)
+            progress(stop / total, f"Exported {stop} / {total}")
+
+
+def _update_rows(listbox, old_rows, new_rows):
+    """Update a Listbox in place, touching only rows that changed"""
+    for i, (old, new) in enumerate(zip(old_rows, new_rows)):
+        if old != new:
+            listbox.delete(i)
+            listbox.insert(i, new)
+
+    if len(old_rows) > len(new_rows):
+        listbox.delete(len(new_rows), tk.END)
+    elif len(new_rows) > len(old_rows):
+        listbox.insert(tk.END, *new_rows[len(old_rows):])
+
+
+def _count_text(shown, total):
+    if shown == MAX_ROWS and shown < total:
+        return f"Showing first {shown} of {total} (use the filter)"
+    return f"Showing {shown} of {total}"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""Headless batch analysis of many traces on a process pool.
+
+    python batch.py input/ --workers 8 --output-dir output/batch
+    python batch.py "captures/*.csv" --summary nightly.json
+    python batch.py input/ --metrics batch.prom
+    python batch.py input/ --format sqlite
+
+Every trace gets its own result CSV in the output directory. A trace
+that fails to load or replay is reported as an error in the summary and
+does not stop the batch.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from csv_export import result_logger
+from csv_loader import iter_batches
+from deadlock_core import DeadlockCore
+from deadlock_detector import DeadlockDetector
+
+
+def collect_traces(patterns):
+    """Expand directories and glob patterns into a sorted list of CSV paths"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(glob.glob(os.path.join(pattern, "*.csv")))
+        else:
+            paths.update(glob.glob(pattern))
+    return sorted(os.path.abspath(p) for p in paths if os.path.isfile(p))
+
+
+def analyze_trace(path, output_path, collect_metrics=False, cache_dir=None):
+    """Replay one trace into output_path and summarize it.
+
+    With collect_metrics the summary gets a "metrics" entry (see
+    metrics.Metrics.to_dict) for this trace only. `cache_dir` is passed
+    on to csv_loader.iter_batches.
+    """
+    if collect_metrics:
+        registry = metrics.enable()
+        registry.reset()     # pool workers are reused across traces
+    summary = {
+        "file": path,
+        "result": output_path,
+        "status": "ok",
+        "error": None,
+        "steps": 0,
+        "deadlock": False,
+        "cycle": [],
+        "first_deadlock_step": None,
+        "first_deadlock": [],
+        "replay_s": 0.0,
+        "detect_s": 0.0,
+    }
+
+    core = DeadlockCore()
+    start = time.perf_counter()
+    try:
+        with result_logger(core, output_path) as logger:
+            for batch in iter_batches(path, cache_dir=cache_dir):
+                core.apply_batch(*batch, on_step=logger.log_step)
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = f"{type(e).__name__}: {e}"
+        if collect_metrics:
+            summary["metrics"] = metrics.active.to_dict()
+        return summary
+    finally:
+        summary["replay_s"] = time.perf_counter() - start
+
+    summary["steps"] = logger.step
+    summary["first_deadlock_step"] = logger.first_deadlock_step
+    summary["first_deadlock"] = logger.first_deadlock
+
+    start = time.perf_counter()
+    has_deadlock, cycle = DeadlockDetector(core).detect_deadlock()
+    summary["detect_s"] = time.perf_counter() - start
+    summary["deadlock"] = has_deadlock
+    summary["cycle"] = cycle
+    if collect_metrics:
+        summary["metrics"] = metrics.active.to_dict()
+    return summary
+
+
+def _result_path(path, output_dir, used, extension=".csv"):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    name = f"{stem}.result{extension}"
+    n = 1
+    while name in used:
+        n += 1
+        name = f"{stem}.{n}.result{extension}"
+    used.add(name)
+    return os.path.join(output_dir, name)
+
+
+def run_batch(paths, output_dir, workers=None, collect_metrics=False, extension=".csv",
+              cache_dir=None):
+    """Analyze every trace in `paths` and return the aggregated summary.
+
+    With collect_metrics the per-trace metrics are merged into
+    summary["metrics"] (a metrics.Metrics) and dropped from the traces.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    used = set()
+    jobs = [(path, _result_path(path, output_dir, used, extension)) for path in paths]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_trace, path, out, collect_metrics, cache_dir)
+                   for path, out in jobs]
+        traces = []
+        for (path, out), future in zip(jobs, futures):
+            try:
+                traces.append(future.result())
+            except Exception as e:
+                # e.g. a worker that died; keep going with the other traces
+                traces.append({"file": path, "result": out, "status": "error",
+                               "error": f"{type(e).__name__}: {e}"})
+
+    summary = {
+        "traces": traces,
+        "total": len(traces),
+        "errors": sum(1 for t in traces if t["status"] == "error"),
+        "deadlocked": sum(1 for t in traces if t.get("deadlock")),
+        "wall_s": time.perf_counter() - start,
+    }
+    if collect_metrics:
+        merged = metrics.Metrics()
+        for t in traces:
+            if "metrics" in t:
+                merged.merge(t.pop("metrics"))
+        summary["metrics"] = merged
+    return summary
+
+
+def print_summary(summary, file=sys.stdout):
+    for t in summary["traces"]:
+        name = os.path.basename(t["file"])
+        if t["status"] == "error":
+            print(f"{name}: ERROR {t['error']}", file=file)
+        elif t["deadlock"]:
+            print(f"{name}: DEADLOCK {' -> '.join(t['cycle'])} "
+                  f"(first at step {t['first_deadlock_step']}, {t['steps']} steps)", file=file)
+        else:
+            first = t["first_deadlock_step"]
+            note = f", deadlocked earlier at step {first}" if first else ""
+            print(f"{name}: no deadlock ({t['steps']} steps{note})", file=file)
+
+    print(f"\n{summary['total']} traces, {summary['deadlocked']} deadlocked, "
+          f"{summary['errors']} errors in {summary['wall_s']:.2f}s", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of traces")
+    parser.add_argument("inputs", nargs="+", help="directories or glob patterns")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--output-dir", default="output/batch")
+    parser.add_argument("--summary", help="write the aggregated summary as JSON")
+    parser.add_argument("--format", choices=("csv", "sqlite"), default="csv",
+                        help="result files: full-state CSV rows or an indexed delta store")
+    parser.add_argument("--metrics", help="write merged metrics (.prom for Prometheus text, else JSON)")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="keep compiled copies of the traces in DIR for the next run")
+    args = parser.parse_args(argv)
+
+    paths = collect_traces(args.inputs)
+    if not paths:
+        print("No CSV files found.", file=sys.stderr)
+        return 1
+
+    extension = ".db" if args.format == "sqlite" else ".csv"
+    summary = run_batch(paths, args.output_dir, args.workers, bool(args.metrics), extension,
+                        args.cache_dir)
+    print_summary(summary)
+
+    if args.metrics:
+        metrics.write(summary.pop("metrics"), args.metrics)
+
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,431 @@
+"""Benchmarks on synthetic traces.
+
+Trace shapes:
+    ring      groups of processes that each hold one resource and then
+              request the next one, closing a cycle; then everything is
+              released
+    chain     long wait chains, built from the far end so every new wait
+              edge follows the whole chain behind it (worst case for the
+              incremental cycle check)
+    random    random request/release mix over a shared pool
+    release   mostly-release workload (80% releases)
+
+For every shape and size this measures CSV load, replay, per-step
+detection (with latency percentiles), CSVLogger throughput and peak
+replay memory. Results are written as JSON; --compare reports slowdowns
+against an earlier run.
+
+    python benchmark.py --sizes 1000 10000 100000 --output bench.json
+
+--startup measures the cold start of `main.py analyze` on a small trace
+instead, and lists any heavy module (tkinter, NumPy, ...) it imported.
+
+--replay-memory replays each size through TraceReplayer and fails if its
+snapshots hold more than their budget, in entries or in bytes.
+"""
+import argparse
+import csv
+import functools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from compact_core import CompactDeadlockCore
+from csv_export import CSVLogger
+from csv_loader import iter_batches, iter_operations
+from deadlock_core import DeadlockCore
+from replay import SNAPSHOT_BUDGET, TraceReplayer
+
+ENGINES = {
+    "core": DeadlockCore,
+    "compact": CompactDeadlockCore,
+    # Avoidance mode: cycle-closing requests are refused
+    "avoid": functools.partial(DeadlockCore, avoidance="reject"),
+}
+
+
+def ring_trace(n_ops, ring_size=8, seed=0):
+    ops = 0
+    base = 0
+    while True:
+        members = range(base, base + ring_size)
+        steps = (
+            [(f"P{i}", "request", f"R{i}") for i in members]
+            + [(f"P{i}", "request", f"R{base + (i - base + 1) % ring_size}") for i in members]
+            + [(f"P{i}", "release", f"R{i}") for i in members]
+        )
+        for process, action, resource in steps:
+            if ops == n_ops:
+                return
+            yield {"process": process, "action": action, "resource": resource}
+            ops += 1
+        base += ring_size
+
+
+def chain_trace(n_ops, chain_length=1000, seed=0):
+    ops = 0
+    base = 0
+    while True:
+        members = range(base, base + chain_length)
+        steps = [(f"P{i}", "request", f"R{i}") for i in members]
+        # P(i) waits for R(i+1); add the edges from the end of the chain
+        steps += [(f"P{i}", "request", f"R{i + 1}") for i in reversed(members[:-1])]
+        steps += [(f"P{i}", "release", f"R{i}") for i in members]
+        for process, action, resource in steps:
+            if ops == n_ops:
+                return
+            yield {"process": process, "action": action, "resource": resource}
+            ops += 1
+        base += chain_length
+
+
+def random_trace(n_ops, release_ratio=0.5, seed=0):
+    rnd = random.Random(seed)
+    pool = max(8, int(n_ops ** 0.5))
+    for _ in range(n_ops):
+        action = "release" if rnd.random() < release_ratio else "request"
+        yield {
+            "process": f"P{rnd.randrange(pool)}",
+            "action": action,
+            "resource": f"R{rnd.randrange(pool)}",
+        }
+
+
+def release_trace(n_ops, seed=0):
+    return random_trace(n_ops, release_ratio=0.8, seed=seed)
+
+
+SHAPES = {
+    "ring": ring_trace,
+    "chain": chain_trace,
+    "random": random_trace,
+    "release": release_trace,
+}
+
+
+def write_trace(ops, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["process", "action", "resource"])
+        for op in ops:
+            writer.writerow([op["process"], op["action"], op["resource"]])
+
+
+def replay(core, operations, on_step=None):
+    for op in operations:
+        process = op["process"]
+        resource = op["resource"]
+
+        if process not in core.processes:
+            core.create_process(process)
+        if resource not in core.resources:
+            core.create_resource(resource)
+
+        if op["action"] == "release":
+            core.release_resource(process, resource)
+        else:
+            core.request_resource(process, resource)
+
+        if on_step is not None:
+            on_step(process, op["action"], resource)
+
+
+def percentiles(samples, points=(50, 90, 99, 99.9)):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    result = {f"p{p:g}": ordered[min(last, int(round(p / 100 * last)))] for p in points}
+    result["max"] = ordered[-1]
+    return result
+
+
+def run_case(shape, n_ops, engine="core", workdir=None, seed=0):
+    core_cls = ENGINES[engine]
+    trace_path = os.path.join(workdir, f"{shape}_{n_ops}.csv")
+    write_trace(SHAPES[shape](n_ops, seed=seed), trace_path)
+    ops = list(iter_operations(trace_path))
+    result = {"shape": shape, "n_ops": n_ops, "engine": engine}
+
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_operations(trace_path))
+    result["load_s"] = time.perf_counter() - start
+    result["load_ops_per_s"] = count / result["load_s"]
+
+    start = time.perf_counter()
+    replay(core_cls(), ops)
+    result["replay_s"] = time.perf_counter() - start
+    result["replay_ops_per_s"] = n_ops / result["replay_s"]
+
+    # Same operations through apply_batch, encoded beforehand
+    batches = list(iter_batches(trace_path, cache_dir=None))    # temp file: no cache
+    core = core_cls()
+    start = time.perf_counter()
+    for batch in batches:
+        core.apply_batch(*batch)
+    result["batch_replay_s"] = time.perf_counter() - start
+    result["batch_replay_ops_per_s"] = n_ops / result["batch_replay_s"]
+
+    core = core_cls()
+    latencies = []
+    clock = time.perf_counter
+
+    def detect(*_):
+        t0 = clock()
+        core.detect_deadlock()
+        latencies.append(clock() - t0)
+
+    start = clock()
+    replay(core, ops, detect)
+    result["detect_replay_s"] = clock() - start
+    result["detect_latency_s"] = percentiles(latencies)
+
+    core = core_cls()
+    output_path = os.path.join(workdir, f"{shape}_{n_ops}_result.csv")
+    start = time.perf_counter()
+    with CSVLogger(core, output_path) as logger:
+        replay(core, ops, logger.log_step)
+    result["logged_s"] = time.perf_counter() - start
+    result["logged_rows_per_s"] = n_ops / result["logged_s"]
+    result["result_bytes"] = os.path.getsize(output_path)
+
+    tracemalloc.start()
+    replay(core_cls(), ops)
+    result["replay_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result
+
+
+def run_suite(shapes, sizes, engine="core", seed=0):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for shape in shapes:
+            for n_ops in sizes:
+                result = run_case(shape, n_ops, engine, workdir, seed)
+                print(
+                    f"{shape:8} {n_ops:>9} ops  "
+                    f"load {result['load_ops_per_s']:>10.0f} ops/s  "
+                    f"replay {result['replay_ops_per_s']:>10.0f} ops/s  "
+                    f"batch {result['batch_replay_ops_per_s']:>10.0f} ops/s  "
+                    f"detect p99 {result['detect_latency_s'].get('p99', 0) * 1e6:8.1f} us  "
+                    f"log {result['logged_rows_per_s']:>9.0f} rows/s  "
+                    f"peak {result['replay_peak_bytes'] / 1e6:7.1f} MB",
+                    file=sys.stderr,
+                )
+                results.append(result)
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": engine,
+        "seed": seed,
+        "results": results,
+    }
+
+
+# Modules that `main.py analyze` should not need at start-up
+HEAVY_MODULES = ("tkinter", "numpy", "GUI", "visualization", "sqlite3", "asyncio",
+                 "multiprocessing", "concurrent.futures", "benchmark", "monitor")
+
+
+def startup_time(runs=10, n_ops=100):
+    """Median wall time of a fresh `main.py analyze --quiet` process.
+
+    Returns {"python_s", "analyze_s", "heavy_modules"}; python_s is a bare
+    interpreter start, for reference.
+    """
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    with tempfile.TemporaryDirectory() as workdir:
+        trace_path = os.path.join(workdir, "trace.csv")
+        write_trace(ring_trace(n_ops), trace_path)
+        analyze = [sys.executable, main_path, "analyze", trace_path, "--quiet",
+                   "--output", os.path.join(workdir, "result.csv")]
+
+        def median_run(command):
+            times = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+                times.append(time.perf_counter() - start)
+            return statistics.median(times)
+
+        python_s = median_run([sys.executable, "-c", "pass"])
+        analyze_s = median_run(analyze)
+
+        # Same command in-process, then see what it pulled in
+        probe = (
+            "import runpy, sys\n"
+            f"sys.argv = {analyze[1:]!r}\n"
+            "try:\n"
+            "    runpy.run_path(sys.argv[0], run_name='__main__')\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            f"print('heavy:', *(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+        )
+        output = subprocess.run([sys.executable, "-c", probe], check=True,
+                                capture_output=True, text=True).stdout
+        heavy = output.splitlines()[-1].split()[1:]
+
+    return {"python_s": python_s, "analyze_s": analyze_s, "heavy_modules": heavy}
+
+
+# Upper bound on what one snapshot entry (a process or resource) may cost
+SNAPSHOT_ENTRY_BYTES = 128
+
+
+def replay_memory(shape, n_ops, budget=SNAPSHOT_BUDGET, seed=0):
+    """Memory held by TraceReplayer snapshots after replaying a whole trace.
+
+    The same trace is replayed with no snapshots besides step 0; the
+    difference in traced memory is what the snapshots cost.
+    """
+    ops = list(SHAPES[shape](n_ops, seed=seed))
+    held = {}
+    for name, limit in (("snapshots", budget), ("plain", 0)):
+        replayer = TraceReplayer(ops, snapshot_budget=limit)
+        tracemalloc.start()
+        replayer.replay_all()
+        held[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        if name == "snapshots":
+            entries = replayer.snapshot_entries
+            snapshots = len(replayer.snapshot_steps)
+            start = time.perf_counter()
+            replayer.seek(n_ops // 2 + 1)
+            seek_s = time.perf_counter() - start
+        del replayer
+
+    snapshot_bytes = held["snapshots"] - held["plain"]
+    return {
+        "shape": shape,
+        "n_ops": n_ops,
+        "budget": budget,
+        "snapshots": snapshots,
+        "snapshot_entries": entries,
+        "snapshot_bytes": snapshot_bytes,
+        "seek_s": seek_s,
+        "ok": entries <= budget and snapshot_bytes <= budget * SNAPSHOT_ENTRY_BYTES,
+    }
+
+
+def _case_key(result, report):
+    # Older reports only name the engine once, at the top
+    return result.get("engine", report.get("engine")), result["shape"], result["n_ops"]
+
+
+def compare(current, baseline, threshold=0.2):
+    """Return the cases where throughput dropped by more than `threshold`.
+
+    Cases are matched on engine, shape and size. Raises ValueError when
+    the two runs have no case in common, e.g. a compact run against a
+    core run.
+    """
+    old = {_case_key(r, baseline): r for r in baseline["results"]}
+    matched = 0
+    regressions = []
+    for r in current["results"]:
+        engine = _case_key(r, current)[0]
+        before = old.get(_case_key(r, current))
+        if before is None:
+            continue
+        matched += 1
+        for key in ("load_ops_per_s", "replay_ops_per_s", "batch_replay_ops_per_s",
+                    "logged_rows_per_s"):
+            if key in before and r[key] < before[key] * (1 - threshold):
+                regressions.append({
+                    "engine": engine,
+                    "shape": r["shape"],
+                    "n_ops": r["n_ops"],
+                    "metric": key,
+                    "before": before[key],
+                    "after": r[key],
+                })
+    if current["results"] and not matched:
+        raise ValueError(
+            f"no case in common: engines {_engines(current)} vs {_engines(baseline)}"
+        )
+    return regressions
+
+
+def _engines(report):
+    return ", ".join(sorted({str(_case_key(r, report)[0]) for r in report["results"]})) or "none"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the deadlock engines")
+    parser.add_argument("--shapes", nargs="+", choices=sorted(SHAPES), default=sorted(SHAPES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="core")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--startup", action="store_true",
+                        help="measure the cold start of `main.py analyze` instead")
+    parser.add_argument("--replay-memory", action="store_true",
+                        help="check that TraceReplayer snapshots stay within their budget")
+    parser.add_argument("--snapshot-budget", type=int, default=SNAPSHOT_BUDGET)
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        result = startup_time()
+        print(f"python  {result['python_s'] * 1000:7.1f} ms (bare interpreter)")
+        print(f"analyze {result['analyze_s'] * 1000:7.1f} ms")
+        if result["heavy_modules"]:
+            print("heavy modules imported:", ", ".join(result["heavy_modules"]))
+            return 1
+        return 0
+
+    if args.replay_memory:
+        failed = 0
+        for shape in args.shapes:
+            for n_ops in args.sizes:
+                r = replay_memory(shape, n_ops, args.snapshot_budget, args.seed)
+                print(
+                    f"{shape:8} {n_ops:>9} ops  {r['snapshots']:>4} snapshots  "
+                    f"{r['snapshot_entries']:>9} entries  "
+                    f"{r['snapshot_bytes'] / 1e6:7.1f} MB  seek {r['seek_s']:6.3f} s"
+                    + ("" if r["ok"] else "  OVER BUDGET")
+                )
+                failed += not r["ok"]
+        return 1 if failed else 0
+
+    report = run_suite(args.shapes, args.sizes, args.engine, args.seed)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(report, baseline, args.threshold)
+        except ValueError as e:
+            print(f"Cannot compare with {args.compare}: {e}", file=sys.stderr)
+            return 1
+        for r in regressions:
+            print(
+                f"REGRESSION {r['engine']} {r['shape']} {r['n_ops']} {r['metric']}: "
+                f"{r['before']:.0f} -> {r['after']:.0f}",
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
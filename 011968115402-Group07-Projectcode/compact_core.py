@@ -0,0 +1,504 @@
+"""Memory-compact alternative to DeadlockCore.
+
+Process and resource names are interned to integer IDs once. All state
+lives in flat ``array('i')`` columns indexed by ID (-1 means "none"):
+
+    owner[r]                     process holding resource r
+    waiting[p]                   resource process p waits for
+    held_head[p], held_tail[p]   resources held by p, linked through
+    res_next[r], res_prev[r]     (acquisition order, O(1) add/remove)
+    wait_head[r], wait_tail[r]   FIFO of processes waiting for r, linked
+    proc_next[p], proc_prev[p]   through the waiters
+    cycle_id[p]                  deadlock cycle p belongs to
+
+``processes`` and ``resources`` are read-only mappings that hand out small
+``__slots__`` views, so DeadlockDetector, CSVLogger and the GUI work on
+this core unchanged.
+
+Measured on CPython 3.11: 1M processes and 1M resources are created,
+and each process requests one resource. Names are built beforehand, and
+stdout goes to /dev/null. Memory is what tracemalloc still holds
+afterwards.
+
+    DeadlockCore          ~470 MB, ~6.8 s
+    CompactDeadlockCore   ~180 MB, ~4.5 s
+
+Most of what is left is the name table: the two name -> ID dicts and
+the name lists. The int columns cost 4 bytes per slot. NumPy is not
+needed; array('i') already gives flat int storage.
+"""
+from array import array
+from collections.abc import Mapping
+
+from csv_loader import ACTIONS, OP_RELEASE
+from events import (ACQUIRED, DEADLOCK_FORMED, DEADLOCK_RESOLVED, RELEASED,
+                    UNBLOCKED, WAITING, EventEmitter)
+
+NONE = -1
+
+
+class ProcessView:
+    __slots__ = ("_core", "_id")
+
+    def __init__(self, core, pid):
+        self._core = core
+        self._id = pid
+
+    @property
+    def name(self):
+        return self._core._proc_names[self._id]
+
+    @property
+    def holding(self):
+        core = self._core
+        held = []
+        r = core._held_head[self._id]
+        while r != NONE:
+            held.append(ResourceView(core, r))
+            r = core._res_next[r]
+        return held
+
+    @property
+    def waiting_for(self):
+        r = self._core._waiting[self._id]
+        return ResourceView(self._core, r) if r != NONE else None
+
+    def __eq__(self, other):
+        return (isinstance(other, ProcessView)
+                and other._core is self._core and other._id == self._id)
+
+    def __hash__(self):
+        return hash((ProcessView, self._id))
+
+    def __repr__(self):
+        holding_names = [r.name for r in self.holding]
+        waiting = self.waiting_for.name if self.waiting_for else None
+        return f"Process({self.name}, holding={holding_names}, waiting_for={waiting})"
+
+
+class ResourceView:
+    __slots__ = ("_core", "_id")
+
+    def __init__(self, core, rid):
+        self._core = core
+        self._id = rid
+
+    @property
+    def name(self):
+        return self._core._res_names[self._id]
+
+    @property
+    def allocated_to(self):
+        p = self._core._owner[self._id]
+        return ProcessView(self._core, p) if p != NONE else None
+
+    def __eq__(self, other):
+        return (isinstance(other, ResourceView)
+                and other._core is self._core and other._id == self._id)
+
+    def __hash__(self):
+        return hash((ResourceView, self._id))
+
+    def __repr__(self):
+        owner = self.allocated_to.name if self.allocated_to else None
+        return f"Resource({self.name}, allocated_to={owner})"
+
+
+class _Table(Mapping):
+    """Read-only name -> view mapping over one of the ID tables"""
+    __slots__ = ("_core", "_ids", "_view")
+
+    def __init__(self, core, ids, view):
+        self._core = core
+        self._ids = ids
+        self._view = view
+
+    def __getitem__(self, name):
+        return self._view(self._core, self._ids[name])
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class CompactDeadlockCore(EventEmitter):
+    def __init__(self, handoff=False):
+        self.handoff = handoff
+
+        self._proc_names = []
+        self._proc_ids = {}
+        self._res_names = []
+        self._res_ids = {}
+
+        # Per-process columns
+        self._waiting = array("i")
+        self._held_head = array("i")
+        self._held_tail = array("i")
+        self._proc_next = array("i")
+        self._proc_prev = array("i")
+        self._cycle_id = array("i")
+
+        # Per-resource columns
+        self._owner = array("i")
+        self._res_next = array("i")
+        self._res_prev = array("i")
+        self._wait_head = array("i")
+        self._wait_tail = array("i")
+
+        self._cycles = {}       # cycle id -> tuple of process ids
+        self._next_cycle = 0
+
+        # Bumped by every mutation; read-only queries are cached against it
+        self.generation = 0
+        self._cache = {}
+
+        self.processes = _Table(self, self._proc_ids, ProcessView)
+        self.resources = _Table(self, self._res_ids, ResourceView)
+
+    def create_process(self, name):
+        if name in self._proc_ids:
+            return
+        self.generation += 1
+        self._proc_ids[name] = len(self._proc_names)
+        self._proc_names.append(name)
+        for column in (self._waiting, self._held_head, self._held_tail,
+                       self._proc_next, self._proc_prev, self._cycle_id):
+            column.append(NONE)
+
+    def create_resource(self, name):
+        if name in self._res_ids:
+            return
+        self.generation += 1
+        self._res_ids[name] = len(self._res_names)
+        self._res_names.append(name)
+        for column in (self._owner, self._res_next, self._res_prev,
+                       self._wait_head, self._wait_tail):
+            column.append(NONE)
+
+    def request_resource(self, process_name, resource_name):
+        p = self._proc_ids[process_name]
+        r = self._res_ids[resource_name]
+        self.generation += 1
+
+        if self._owner[r] == NONE:
+            self._grant(p, r)
+        else:
+            changed = self._waiting[p] != r
+            if changed:
+                self._stop_waiting(p)
+                self._waiting[p] = r
+                self._enqueue(r, p)
+            if self._handlers:
+                self._emit(WAITING, process_name, resource_name,
+                           self._proc_names[self._owner[r]])
+            if changed:
+                self._check_cycle(p)
+
+    def release_resource(self, process_name, resource_name):
+        p = self._proc_ids.get(process_name)
+        r = self._res_ids.get(resource_name)
+        if p is None or r is None:
+            return
+        self.generation += 1
+
+        freed = self._owner[r] == p
+        if freed:
+            self._unlink_held(p, r)
+            self._owner[r] = NONE
+            if self._handlers:
+                self._emit(RELEASED, process_name, resource_name)
+
+        if self.handoff:
+            if freed:
+                self._hand_off(r)
+            elif self._waiting[p] == r:
+                # A waiter releasing the resource only withdraws its own claim
+                self._stop_waiting(p)
+            return
+
+        # Drop every waiter's claim, like DeadlockCore
+        w = self._wait_head[r]
+        self._wait_head[r] = self._wait_tail[r] = NONE
+        while w != NONE:
+            nxt = self._proc_next[w]
+            self._proc_next[w] = self._proc_prev[w] = NONE
+            self._waiting[w] = NONE
+            self._break_cycle(w)
+            if self._handlers:
+                self._emit(UNBLOCKED, self._proc_names[w], resource_name)
+            w = nxt
+
+    def apply_batch(self, names, codes, process_ids, resource_ids,
+                    start=0, stop=None, on_step=None):
+        """Apply pre-encoded operations; same contract as
+        DeadlockCore.apply_batch"""
+        if stop is None:
+            stop = len(codes)
+        proc_ids = self._proc_ids
+        res_ids = self._res_ids
+
+        for i in range(start, stop):
+            process_name = names[process_ids[i]]
+            resource_name = names[resource_ids[i]]
+
+            if process_name not in proc_ids:
+                self.create_process(process_name)
+            if resource_name not in res_ids:
+                self.create_resource(resource_name)
+
+            code = codes[i]
+            if code == OP_RELEASE:
+                self.release_resource(process_name, resource_name)
+            else:
+                self.request_resource(process_name, resource_name)
+
+            if on_step is not None:
+                on_step(process_name, ACTIONS[code], resource_name)
+
+    def _cached(self, key, compute):
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == self.generation:
+            return entry[1]
+        result = compute()
+        self._cache[key] = (self.generation, result)
+        return result
+
+    def detect_deadlock(self):
+        """Return the deadlocked processes, same answer as DeadlockDetector.
+
+        The result is cached until the next mutation; do not modify it.
+        """
+        if not self._cycles:
+            return []
+        return self._cached("deadlock", self._find_deadlocked)
+
+    def deadlock_cycles(self):
+        """Return every current cycle in wait order, from its smallest member"""
+        return self._cached("cycles", self._list_cycles)
+
+    def wait_for_graph(self):
+        """Return the wait-for graph as {waiter: [holder]}, sorted by waiter"""
+        return self._cached("graph", self._build_graph)
+
+    def _build_graph(self):
+        names = self._proc_names
+        waiting = self._waiting
+        owner = self._owner
+        edges = {names[p]: names[owner[r]] for p, r in enumerate(waiting) if r != NONE}
+        return {waiter: [edges[waiter]] for waiter in sorted(edges)}
+
+    def _list_cycles(self):
+        names = self._proc_names
+        cycles = []
+        for cycle in self._cycles.values():
+            cycle = [names[p] for p in cycle]
+            i = cycle.index(min(cycle))
+            cycles.append(cycle[i:] + cycle[:i])
+        cycles.sort()
+        return cycles
+
+    def _find_deadlocked(self):
+        waiting = self._waiting
+        owner = self._owner
+        blocked = set()
+        for cycle in self._cycles.values():
+            blocked.update(cycle)
+
+        # Walk the edges backwards: the waiters of p are the waiters of
+        # every resource p holds
+        stack = list(blocked)
+        while stack:
+            p = stack.pop()
+            r = self._held_head[p]
+            while r != NONE:
+                w = self._wait_head[r]
+                while w != NONE:
+                    if w not in blocked:
+                        blocked.add(w)
+                        stack.append(w)
+                    w = self._proc_next[w]
+                r = self._res_next[r]
+
+        names = self._proc_names
+        p = min(blocked, key=names.__getitem__)
+        path = {p}
+        while True:
+            p = owner[waiting[p]]
+            if p in path:
+                break
+            path.add(p)
+
+        return sorted(names[p] for p in path)
+
+    def show_state(self):
+        print("\n PROCESS STATE ")
+        for p in self.processes.values():
+            print(p)
+
+        print("\n RESOURCE STATE")
+        for r in self.resources.values():
+            print(r)
+
+    def snapshot(self):
+        """Return the current state: copies of the int columns and of the
+        name lists (the names themselves are shared, not copied).
+        """
+        columns = tuple(array("i", column) for column in self._columns())
+        return (tuple(self._proc_names), tuple(self._res_names), columns,
+                dict(self._cycles), self._next_cycle)
+
+    def restore(self, snapshot):
+        """Replace the current state with one taken by snapshot().
+
+        No events are emitted.
+        """
+        proc_names, res_names, columns, cycles, next_cycle = snapshot
+        self.generation += 1
+
+        _restore_names(self._proc_names, self._proc_ids, proc_names)
+        _restore_names(self._res_names, self._res_ids, res_names)
+
+        for column, saved in zip(self._columns(), columns):
+            column[:] = saved
+
+        self._cycles = dict(cycles)
+        self._next_cycle = next_cycle
+
+    def _columns(self):
+        return (self._waiting, self._held_head, self._held_tail,
+                self._proc_next, self._proc_prev, self._cycle_id,
+                self._owner, self._res_next, self._res_prev,
+                self._wait_head, self._wait_tail)
+
+    def _grant(self, p, r):
+        self._owner[r] = p
+        tail = self._held_tail[p]
+        self._res_prev[r] = tail
+        self._res_next[r] = NONE
+        if tail == NONE:
+            self._held_head[p] = r
+        else:
+            self._res_next[tail] = r
+        self._held_tail[p] = r
+        if self._handlers:
+            self._emit(ACQUIRED, self._proc_names[p], self._res_names[r])
+
+    def _unlink_held(self, p, r):
+        prev = self._res_prev[r]
+        nxt = self._res_next[r]
+        if prev == NONE:
+            self._held_head[p] = nxt
+        else:
+            self._res_next[prev] = nxt
+        if nxt == NONE:
+            self._held_tail[p] = prev
+        else:
+            self._res_prev[nxt] = prev
+        self._res_next[r] = self._res_prev[r] = NONE
+
+    def _enqueue(self, r, p):
+        tail = self._wait_tail[r]
+        self._proc_prev[p] = tail
+        self._proc_next[p] = NONE
+        if tail == NONE:
+            self._wait_head[r] = p
+        else:
+            self._proc_next[tail] = p
+        self._wait_tail[r] = p
+
+    def _stop_waiting(self, p, notify=True):
+        r = self._waiting[p]
+        if r == NONE:
+            return
+
+        prev = self._proc_prev[p]
+        nxt = self._proc_next[p]
+        if prev == NONE:
+            self._wait_head[r] = nxt
+        else:
+            self._proc_next[prev] = nxt
+        if nxt == NONE:
+            self._wait_tail[r] = prev
+        else:
+            self._proc_prev[nxt] = prev
+        self._proc_next[p] = self._proc_prev[p] = NONE
+
+        self._waiting[p] = NONE
+        self._break_cycle(p)
+        if notify and self._handlers:
+            self._emit(UNBLOCKED, self._proc_names[p], self._res_names[r])
+
+    def _hand_off(self, r):
+        """Give a freed resource to its oldest waiter"""
+        p = self._wait_head[r]
+        if p == NONE:
+            return
+
+        self._stop_waiting(p, notify=False)
+        self._grant(p, r)
+
+        # The remaining waiters now wait for the new holder
+        w = self._wait_head[r]
+        while w != NONE:
+            self._break_cycle(w)
+            self._check_cycle(w)
+            w = self._proc_next[w]
+
+    def _check_cycle(self, p):
+        """Follow the holder chain from p's new wait edge"""
+        waiting = self._waiting
+        owner = self._owner
+        cycle_id = self._cycle_id
+
+        path = [p]
+        node = owner[waiting[p]]
+        while node != p:
+            if cycle_id[node] != NONE:
+                # The chain runs into a cycle that does not include p
+                return
+            r = waiting[node]
+            if r == NONE:
+                return
+            path.append(node)
+            node = owner[r]
+
+        cid = self._next_cycle
+        self._next_cycle += 1
+        self._cycles[cid] = tuple(path)
+        for node in path:
+            cycle_id[node] = cid
+        if self._handlers:
+            self._emit(DEADLOCK_FORMED, tuple(self._proc_names[n] for n in path))
+
+    def _break_cycle(self, p):
+        cid = self._cycle_id[p]
+        if cid == NONE:
+            return
+        cycle = self._cycles.pop(cid)
+        for node in cycle:
+            self._cycle_id[node] = NONE
+        if self._handlers:
+            self._emit(DEADLOCK_RESOLVED, tuple(self._proc_names[n] for n in cycle))
+
+
+def _restore_names(names, ids, saved):
+    # Names are only ever appended, so a saved table usually shares a
+    # prefix with the current one and only the tail needs fixing
+    keep = 0
+    for current, wanted in zip(names, saved):
+        if current != wanted:
+            break
+        keep += 1
+
+    for name in names[keep:]:
+        del ids[name]
+    del names[keep:]
+
+    for name in saved[keep:]:
+        ids[name] = len(names)
+        names.append(name)
@@ -1,29 +1,50 @@
 import csv
 import os
+import time
+
+import metrics
 
 
 class CSVLogger:
-    def __init__(self, core):
+    """Write one result row per step through a single open file handle.
+
+    Rows are buffered and written every `flush_rows` rows or, if
+    `flush_interval` (seconds) is set, once that much time has passed.
+    Use it as a context manager (or call close()) so the last rows are
+    flushed, also when the replay fails half-way.
+    """
+
+    def __init__(self, core, output_path=None, flush_rows=1000, flush_interval=None):
         self.core = core
         self.step = 0
+        self.first_deadlock_step = None
+        self.first_deadlock = []
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+
+        if output_path is None:
+            base_dir = os.path.dirname(os.path.abspath(__file__))
+            output_path = os.path.join(base_dir, "output", "result.csv")
 
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        output_dir = os.path.join(base_dir, "output")
+        self.output_path = os.fspath(output_path)
+        output_dir = os.path.dirname(os.path.abspath(self.output_path))
         os.makedirs(output_dir, exist_ok=True)
 
-        self.output_path = os.path.join(output_dir, "result.csv")
+        self._file = open(self.output_path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self._bytes_counted = 0
 
-        with open(self.output_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "Step",
-                "Process",
-                "Action",
-                "Resource",
-                "Holding",
-                "Waiting_For",
-                "Deadlock"
-            ])
+        self._writer.writerow([
+            "Step",
+            "Process",
+            "Action",
+            "Resource",
+            "Holding",
+            "Waiting_For",
+            "Deadlock"
+        ])
 
     def log_step(self, process_name, action, resource_name):
         self.step += 1
@@ -35,15 +56,64 @@ class CSVLogger:
 
         cycle = self.core.detect_deadlock()
         deadlock = " -> ".join(cycle) if cycle else "No"
+        if cycle and self.first_deadlock_step is None:
+            self.first_deadlock_step = self.step
+            self.first_deadlock = cycle
+
+        self._rows.append([
+            self.step,
+            process_name,
+            action,
+            resource_name,
+            holding,
+            waiting,
+            deadlock
+        ])
+
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+        elif (self.flush_interval is not None
+                and time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._file.closed:
+            return
+        m = metrics.active
+        if self._rows:
+            if m is not None:
+                m.inc("deadlock_logger_rows_total", len(self._rows))
+            self._writer.writerows(self._rows)
+            self._rows.clear()
+        self._file.flush()
+        if m is not None:
+            # Text files can tell() cheaply right after a flush
+            position = self._file.tell()
+            m.inc("deadlock_logger_bytes_total", position - self._bytes_counted)
+            self._bytes_counted = position
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# Result paths with these extensions are written by delta_store.DeltaLogger
+DELTA_EXTENSIONS = (".db", ".sqlite")
+
 
-        with open(self.output_path, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                self.step,
-                process_name,
-                action,
-                resource_name,
-                holding,
-                waiting,
-                deadlock
-            ])
+def result_logger(core, output_path=None):
+    """DeltaLogger for .db/.sqlite paths, CSVLogger otherwise"""
+    if output_path is not None and os.fspath(output_path).endswith(DELTA_EXTENSIONS):
+        from delta_store import DeltaLogger     # sqlite3 only when it is used
+        return DeltaLogger(core, output_path)
+    return CSVLogger(core, output_path)
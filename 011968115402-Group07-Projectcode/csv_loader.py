@@ -1,16 +1,43 @@
 import csv
+import mmap
 import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+import metrics
 
 REQUIRED_COLUMNS = {"process", "action", "resource"}
 VALID_ACTIONS = {"request", "hold", "release"}
+COUNT_COLUMN = "count"   # optional: number of instances, default 1
+
+# Op codes used by compiled traces (index into ACTIONS)
+ACTIONS = ("request", "hold", "release")
+OP_REQUEST, OP_HOLD, OP_RELEASE = range(3)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+# Compiled traces are keyed by source path, so old ones are evicted by size
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# magic, source size, source mtime_ns, ops, names, names blob length, flags
+_TRACE_MAGIC = b"DLTRACE1" + (b"L" if sys.byteorder == "little" else b"B")
+_TRACE_HEADER = struct.Struct("<9sxxxQqQQQI")
+_FLAG_COUNT = 1
+
+# Rows compile_trace buffers before writing its columns out
+_SPOOL_ROWS = 16384
 
 
 class CSVFormatError(Exception):
     pass
 
 
-def load_csv(file_path="input/input.csv"):
+def _resolve_path(file_path):
     # If file_path is relative, resolve it relative to this script's directory
+    file_path = os.fspath(file_path)
     if not os.path.isabs(file_path):
         script_dir = os.path.dirname(os.path.abspath(__file__))
         file_path = os.path.join(script_dir, file_path)
@@ -18,9 +45,31 @@ def load_csv(file_path="input/input.csv"):
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
-    data = []
+    return file_path
+
+
+def iter_operations(source="input/input.csv", numbered=False):
+    """Validate and yield operations one at a time.
+
+    `source` can be a file path, an open text file, or "-" for stdin.
+    The header is checked right away; row errors are raised while
+    iterating, with the same line numbers as load_csv. Only one row is
+    held in memory at a time. With `numbered`, (line number, operation)
+    pairs are yielded, so callers can report their own errors by line.
+    """
+    return _read_rows(*_open_reader(source), numbered=numbered)
+
 
-    with open(file_path, newline="", encoding="utf-8") as csvfile:
+def _open_reader(source):
+    if source == "-":
+        csvfile, owned = sys.stdin, False
+    elif hasattr(source, "read"):
+        csvfile, owned = source, False
+    else:
+        csvfile = open(_resolve_path(source), newline="", encoding="utf-8")
+        owned = True
+
+    try:
         reader = csv.DictReader(csvfile)
 
         # Validate CSV header
@@ -28,7 +77,20 @@ def load_csv(file_path="input/input.csv"):
             raise CSVFormatError(
                 f"CSV is missing required columns. Required: {REQUIRED_COLUMNS}"
             )
+    except BaseException:
+        if owned:
+            csvfile.close()
+        raise
+
+    with_count = COUNT_COLUMN in reader.fieldnames
+    return reader, csvfile, owned, with_count
+
 
+def _read_rows(reader, csvfile, owned, with_count, numbered=False):
+    count = 0
+    line_num = 1
+
+    try:
         # Read and validate each row
         for line_num, row in enumerate(reader, start=2):
             # Skip empty rows or rows with None values
@@ -44,20 +106,355 @@ def load_csv(file_path="input/input.csv"):
                 continue
 
             if action not in VALID_ACTIONS:
+                _count_error()
                 raise CSVFormatError(
                     f"Line {line_num}: invalid action '{action}'"
                 )
 
-            data.append({
+            op = {
                 "process": process,
                 "action": action,
                 "resource": resource
-            })
+            }
+
+            if with_count:
+                op["count"] = _parse_count(row.get(COUNT_COLUMN), line_num)
 
-    if not data:
+            count += 1
+            yield (line_num, op) if numbered else op
+    except (csv.Error, UnicodeDecodeError) as e:
+        _count_error()
+        raise CSVFormatError(f"Line {line_num + 1}: {e}") from e
+    finally:
+        if owned:
+            csvfile.close()
+        # Counted once at the end, not per row
+        m = metrics.active
+        if m is not None:
+            m.inc("deadlock_csv_rows_total", count)
+
+    if not count:
         raise CSVFormatError("CSV file is empty")
 
-    return data
+
+def pooled_trace_error():
+    """Error for a trace with a count column read by a single-instance core"""
+    _count_error()
+    return CSVFormatError(
+        f"CSV has a '{COUNT_COLUMN}' column: pooled resources are only "
+        f"analyzed by 'main.py analyze --pools'"
+    )
+
+
+def _count_error():
+    m = metrics.active
+    if m is not None:
+        m.inc("deadlock_csv_errors_total")
+
+
+def _parse_count(value, line_num):
+    value = (value or "").strip()
+    if not value:
+        return 1
+    try:
+        units = int(value)
+    except ValueError:
+        units = 0
+    if units < 1:
+        _count_error()
+        raise CSVFormatError(f"Line {line_num}: invalid count '{value}'")
+    return units
+
+
+def load_csv(file_path="input/input.csv"):
+    return list(iter_operations(file_path))
+
+
+def iter_batches(source="input/input.csv", size=4096, cache_dir=None):
+    """Stream a trace as pre-encoded batches for DeadlockCore.apply_batch.
+
+    Yields (names, codes, process_ids, resource_ids) for every `size`
+    rows. `names` is one table shared by all batches that only grows, so
+    IDs stay valid from batch to batch. The header is checked right away,
+    as in iter_operations.
+
+    With a `cache_dir`, a file path goes through load_trace instead, so it
+    is only parsed again when it changes. If the cache cannot be written
+    (read-only directory, full disk), the file is streamed as without one.
+
+    The batches carry no counts, so a trace with a count column is
+    rejected up front (see MultiInstanceCore) instead of being replayed
+    as if every request were for one unit.
+    """
+    if cache_dir is not None and source != "-" and not hasattr(source, "read"):
+        try:
+            trace = load_trace(source, cache_dir)
+        except OSError:
+            pass    # no usable cache; a missing file is reported below
+        else:
+            if trace.counts is not None:
+                trace.close()
+                raise pooled_trace_error()
+            return _trace_batches(trace, size)
+
+    reader, csvfile, owned, with_count = _open_reader(source)
+    if with_count:
+        if owned:
+            csvfile.close()
+        raise pooled_trace_error()
+    return _encode_batches(_read_rows(reader, csvfile, owned, with_count), size)
+
+
+def _trace_batches(trace, size):
+    # Copies, not slices: a slice of the mapping would keep close() from
+    # unmapping it while the caller still holds the last batch
+    with trace:
+        for start in range(0, len(trace), size):
+            stop = min(start + size, len(trace))
+            codes, processes, resources = array("B"), array("i"), array("i")
+            codes.frombytes(trace.codes[start:stop])
+            processes.frombytes(trace.processes[start:stop].cast("B"))
+            resources.frombytes(trace.resources[start:stop].cast("B"))
+            yield trace.names, codes, processes, resources
+
+
+def _encode_batches(operations, size):
+    ids = {}
+    names = []
+    code_of = {action: code for code, action in enumerate(ACTIONS)}
+    codes, processes, resources = array("B"), array("i"), array("i")
+
+    for op in operations:
+        for name, column in ((op["process"], processes), (op["resource"], resources)):
+            i = ids.get(name)
+            if i is None:
+                i = ids[name] = len(names)
+                names.append(name)
+            column.append(i)
+        codes.append(code_of[op["action"]])
+
+        if len(codes) == size:
+            yield names, codes, processes, resources
+            codes, processes, resources = array("B"), array("i"), array("i")
+
+    if codes:
+        yield names, codes, processes, resources
+
+
+class CompiledTrace:
+    """A trace compiled to packed arrays and memory-mapped from the cache.
+
+    `names` is the interned name table shared by processes and resources.
+    `codes` (op codes), `processes` and `resources` (indexes into names)
+    and `counts` (or None) are memoryviews over the mapped file, so
+    opening a trace does not parse anything. Iterating yields the same
+    dicts as iter_operations.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buf = memoryview(self._mmap)
+        (_, self.source_size, self.source_mtime_ns, n_ops, n_names,
+         names_len, flags) = _TRACE_HEADER.unpack_from(buf)
+
+        offset = _TRACE_HEADER.size
+        blob = bytes(buf[offset:offset + names_len])
+        self.names = blob.decode("utf-8").split("\0") if n_names else []
+        offset = _align(offset + names_len)
+
+        self.codes = buf[offset:offset + n_ops]
+        offset = _align(offset + n_ops)
+        self.processes = buf[offset:offset + 4 * n_ops].cast("i")
+        offset += 4 * n_ops
+        self.resources = buf[offset:offset + 4 * n_ops].cast("i")
+        offset += 4 * n_ops
+        self.counts = buf[offset:offset + 4 * n_ops].cast("i") if flags & _FLAG_COUNT else None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        names = self.names
+        for i, code in enumerate(self.codes):
+            op = {
+                "process": names[self.processes[i]],
+                "action": ACTIONS[code],
+                "resource": names[self.resources[i]]
+            }
+            if self.counts is not None:
+                op["count"] = self.counts[i]
+            yield op
+
+    def close(self):
+        for view in (self.codes, self.processes, self.resources, self.counts):
+            if view is not None:
+                view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _align(offset):
+    return (offset + 3) & ~3
+
+
+def _cache_path(file_path, cache_dir):
+    import hashlib      # only the binary cache needs it; keeps start-up quick
+
+    key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.trace")
+
+
+def compile_trace(file_path, cache_path, progress=None):
+    """Parse and validate a CSV trace once and write it in packed form.
+
+    Columns are spooled to temporary files every _SPOOL_ROWS rows, so
+    only the name table is held in memory. progress(rows) is called at
+    each spool; an exception from it (e.g. a cancel) aborts the compile
+    and leaves no cache file behind.
+    """
+    stat = os.stat(file_path)
+    ids = {}
+    code_of = {action: code for code, action in enumerate(ACTIONS)}
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(cache_dir, exist_ok=True)
+
+    reader, csvfile, owned, with_count = _open_reader(file_path)
+    codes, processes, resources, counts = array("B"), array("i"), array("i"), array("i")
+    columns = [codes, processes, resources] + ([counts] if with_count else [])
+    spools = [tempfile.TemporaryFile(dir=cache_dir) for _ in columns]
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        n_ops = 0
+        for op in _read_rows(reader, csvfile, owned, with_count):
+            codes.append(code_of[op["action"]])
+            processes.append(ids.setdefault(op["process"], len(ids)))
+            resources.append(ids.setdefault(op["resource"], len(ids)))
+            if with_count:
+                counts.append(op["count"])
+            if len(codes) == _SPOOL_ROWS:
+                n_ops += _spool(columns, spools)
+                if progress is not None:
+                    progress(n_ops)
+        n_ops += _spool(columns, spools)
+
+        blob = "\0".join(ids).encode("utf-8")
+        header = _TRACE_HEADER.pack(
+            _TRACE_MAGIC, stat.st_size, stat.st_mtime_ns, n_ops, len(ids),
+            len(blob), _FLAG_COUNT if with_count else 0
+        )
+
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(blob)
+            for i, spool in enumerate(spools):
+                if i < 2:
+                    # codes and processes start 4-byte aligned
+                    f.write(bytes(_align(f.tell()) - f.tell()))
+                spool.seek(0)
+                shutil.copyfileobj(spool, f)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+def _spool(columns, spools):
+    n = len(columns[0])
+    for column, spool in zip(columns, spools):
+        column.tofile(spool)
+        del column[:]
+    return n
+
+
+def load_trace(file_path, cache_dir=DEFAULT_CACHE_DIR, max_bytes=CACHE_MAX_BYTES, progress=None):
+    """Open a trace through the binary cache, compiling it when needed.
+
+    The cached copy is reused while the source file keeps the same size
+    and modification time; otherwise it is rebuilt. After a compile the
+    least recently used traces are removed until the cache directory
+    holds at most `max_bytes` (None: no limit). `progress` is passed on
+    to compile_trace.
+    """
+    file_path = _resolve_path(file_path)
+    cache_path = _cache_path(file_path, cache_dir)
+    stat = os.stat(file_path)
+
+    m = metrics.active
+    if _cache_is_fresh(cache_path, stat):
+        if m is not None:
+            m.inc("deadlock_trace_cache_total", labels=(("result", "hit"),))
+        try:
+            os.utime(cache_path)    # last use, for eviction
+        except OSError:
+            pass
+        return CompiledTrace(cache_path)
+
+    start = time.perf_counter()
+    compile_trace(file_path, cache_path, progress)
+    if m is not None:
+        m.inc("deadlock_trace_cache_total", labels=(("result", "miss"),))
+        m.observe("deadlock_trace_compile_seconds", time.perf_counter() - start)
+    if max_bytes is not None:
+        evict_cache(cache_dir, max_bytes, keep=cache_path)
+    return CompiledTrace(cache_path)
+
+
+def evict_cache(cache_dir=DEFAULT_CACHE_DIR, max_bytes=CACHE_MAX_BYTES, keep=None):
+    """Remove the least recently used compiled traces until the rest take
+    at most max_bytes. `keep` is never removed. Returns the paths removed."""
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".trace") and entry.path != keep:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.exists(keep):
+        total += os.path.getsize(keep)
+
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed.append(path)
+    return removed
+
+
+def _cache_is_fresh(cache_path, stat):
+    try:
+        with open(cache_path, "rb") as f:
+            header = f.read(_TRACE_HEADER.size)
+    except OSError:
+        return False
+    if len(header) != _TRACE_HEADER.size:
+        return False
+
+    magic, size, mtime_ns = _TRACE_HEADER.unpack(header)[:3]
+    return magic == _TRACE_MAGIC and size == stat.st_size and mtime_ns == stat.st_mtime_ns
+
+
 ##test cases
 # if __name__ == "__main__":
 #     try:
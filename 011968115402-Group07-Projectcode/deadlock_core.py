@@ -1,3 +1,25 @@
+import time
+
+import metrics
+from csv_loader import ACTIONS, OP_RELEASE, OP_REQUEST
+from events import (ACQUIRED, DEADLOCK_FORMED, DEADLOCK_RESOLVED, DEFERRED,
+                    REJECTED, RELEASED, UNBLOCKED, WAITING, EventEmitter)
+
+# Avoidance modes, see DeadlockCore
+REJECT = "reject"
+DEFER = "defer"
+
+# What request_resource() did with a request
+REQUEST_GRANTED = "granted"
+REQUEST_WAITING = "waiting"
+REQUEST_REJECTED = "rejected"
+REQUEST_DEFERRED = "deferred"
+
+# Metric labels, built once; _OP_LABELS[code] for each csv_loader op code
+_OP_LABELS = tuple(((("op", action),) for action in ACTIONS))
+_DETECTOR = (("detector", "core"),)
+
+
 class Resource:
     def __init__(self, name):
         self.name = name
@@ -10,7 +32,7 @@ class Resource:
 class Process:
     def __init__(self, name):
         self.name = name
-        self.holding = []         
+        self.holding = {}         # used as an ordered set: O(1) add/remove
         self.waiting_for = None   
 
     def __repr__(self):
@@ -18,55 +40,435 @@ class Process:
         waiting = self.waiting_for.name if self.waiting_for else None
         return f"Process({self.name}, holding={holding_names}, waiting_for={waiting})"
 
-class DeadlockCore:
-    def __init__(self):
+class DeadlockCore(EventEmitter):
+    def __init__(self, handoff=False, avoidance=None):
         self.processes = {}
         self.resources = {}
 
+        # With handoff=True a released resource goes straight to its first
+        # waiter (FIFO), like a lock manager. Otherwise every waiter's
+        # claim is dropped, which is the original behaviour.
+        self.handoff = handoff
+
+        # Avoidance: with REJECT a request whose wait edge would close a
+        # cycle is refused; with DEFER it is parked and retried once an
+        # edge of that cycle path goes away or the resource is freed.
+        # Either way no deadlock ever forms.
+        if avoidance not in (None, REJECT, DEFER):
+            raise ValueError(f"unknown avoidance mode '{avoidance}'")
+        self.avoidance = avoidance
+
+        # Dynamic topological order of the wait-for graph (Pearce-Kelly):
+        # every edge goes from a lower to a higher position, so an edge
+        # that already fits needs no search, and otherwise only the nodes
+        # between the two positions are looked at. New processes start at
+        # the bottom because they usually join as waiters.
+        self._order = {}
+        self._order_floor = 0
+        self._deferred = {}          # process -> resource, in arrival order
+        self._watch_edges = {}       # process -> deferred processes to retry
+        self._watch_resources = {}   # resource -> deferred processes to retry
+        self._to_retry = []
+        self._retrying = False
+
+        # resource name -> processes waiting for it, in arrival order
+        # (dict used as an ordered set)
+        self._waiters = {}
+
+        # Wait-for graph kept up to date in place: waiter -> holder.
+        # Each process waits for at most one resource, so it has at most
+        # one outgoing edge and a cycle check only follows one chain.
+        self._wait_edges = {}
+        self._waiters_of = {}   # holder -> set of waiter names
+        self._cycle_of = {}     # process -> cycle (tuple) it belongs to
+
+        # Bumped by every mutation; read-only queries are cached against it
+        self.generation = 0
+        self._cache = {}        # query name -> (generation, result)
+
     def create_process(self, name):
+        self.generation += 1
         self.processes[name] = Process(name)
+        if self.avoidance and name not in self._order:
+            self._order_floor -= 1
+            self._order[name] = self._order_floor
 
     def create_resource(self, name):
+        self.generation += 1
         self.resources[name] = Resource(name)
 
-    def request_resource(self, process_name, resource_name):
-        process = self.processes[process_name]
-        resource = self.resources[resource_name]
+    def request_resource(self, process_name, resource_name, op=OP_REQUEST):
+        """Request a resource and return what happened to the request:
+        REQUEST_GRANTED, REQUEST_WAITING, or in avoidance mode
+        REQUEST_REJECTED / REQUEST_DEFERRED.
+
+        `op` is the csv_loader op code the request came from; a hold
+        (OP_HOLD) behaves the same and is only counted apart in metrics.
+        """
+        return self._request(self.processes[process_name], self.resources[resource_name], op)
+
+    def _request(self, process, resource, op=OP_REQUEST):
+        self.generation += 1
+        m = metrics.active
+        if m is not None:
+            m.inc("deadlock_ops_total", labels=_OP_LABELS[op])
+        if self._deferred:
+            # A new request replaces one that was deferred
+            self._deferred.pop(process.name, None)
 
         if resource.allocated_to is None:
-            resource.allocated_to = process
-            process.holding.append(resource)
-            print(f"{process.name} acquired {resource.name}")
+            self._grant(process, resource)
+            status = REQUEST_GRANTED
         else:
-            process.waiting_for = resource
-            print(f"{process.name} is waiting for {resource.name}")
+            changed = process.waiting_for is not resource
+            if changed and self.avoidance:
+                cycle = self._order_edge(process.name, resource.allocated_to.name)
+                if cycle is not None:
+                    return self._refuse(process, resource, cycle)
+            if changed:
+                self._stop_waiting(process)
+                process.waiting_for = resource
+                self._waiters.setdefault(resource.name, {})[process] = None
+            if self._handlers:
+                self._emit(WAITING, process.name, resource.name, resource.allocated_to.name)
+            if changed:
+                self._add_wait_edge(process.name, resource.allocated_to.name)
+            status = REQUEST_WAITING
+
+        if self._to_retry:
+            self._retry_deferred()
+        return status
 
     def release_resource(self, process_name, resource_name):
         process = self.processes.get(process_name)
         resource = self.resources.get(resource_name)
-        if not process or not resource:
-            return
+        if process and resource:
+            self._release(process, resource)
+
+    def _release(self, process, resource):
+        self.generation += 1
+        m = metrics.active
+        if m is not None:
+            m.inc("deadlock_ops_total", labels=_OP_LABELS[OP_RELEASE])
 
-        if resource in process.holding:
-            process.holding.remove(resource)
+        process.holding.pop(resource, None)
 
-        if resource.allocated_to == process:
+        freed = resource.allocated_to == process
+        if freed:
             resource.allocated_to = None
+            if self._handlers:
+                self._emit(RELEASED, process.name, resource.name)
+            if self._watch_resources:
+                self._to_retry.extend(self._watch_resources.pop(resource.name, ()))
 
-        # clear waiting_for for any processes waiting for this resource
-        for proc in self.processes.values():
-            if proc.waiting_for == resource:
+        if self.handoff:
+            if freed:
+                self._hand_off(resource)
+            elif process.waiting_for is resource:
+                # A waiter releasing the resource only withdraws its own claim
+                self._stop_waiting(process)
+        else:
+            # clear waiting_for for any processes waiting for this resource
+            for proc in self._waiters.pop(resource.name, ()):
                 proc.waiting_for = None
+                self._remove_wait_edge(proc.name)
+                if self._handlers:
+                    self._emit(UNBLOCKED, proc.name, resource.name)
 
-    def detect_deadlock(self):
+        if self._to_retry:
+            self._retry_deferred()
+
+    def apply_batch(self, names, codes, process_ids, resource_ids,
+                    start=0, stop=None, on_step=None):
+        """Apply pre-encoded operations in one tight loop.
+
+        `codes` holds csv_loader op codes, `process_ids` / `resource_ids`
+        index into `names` (the layout of CompiledTrace and TraceReplayer;
+        see csv_loader.iter_batches for streams). Operations start..stop
+        are applied, creating processes and resources on first use.
+        on_step(process, action, resource) runs after each one, e.g.
+        CSVLogger.log_step.
+        """
+        if stop is None:
+            stop = len(codes)
+        processes = self.processes
+        resources = self.resources
+        request = self._request
+        release = self._release
+
+        for i in range(start, stop):
+            process_name = names[process_ids[i]]
+            resource_name = names[resource_ids[i]]
+
+            process = processes.get(process_name)
+            if process is None:
+                self.create_process(process_name)
+                process = processes[process_name]
+            resource = resources.get(resource_name)
+            if resource is None:
+                self.create_resource(resource_name)
+                resource = resources[resource_name]
+
+            code = codes[i]
+            if code == OP_RELEASE:
+                release(process, resource)
+            else:
+                request(process, resource, code)
+
+            if on_step is not None:
+                on_step(process_name, ACTIONS[code], resource_name)
+
+    def _grant(self, process, resource):
+        resource.allocated_to = process
+        process.holding[resource] = None
+        if self._handlers:
+            self._emit(ACQUIRED, process.name, resource.name)
+
+    def _stop_waiting(self, process, notify=True):
+        resource = process.waiting_for
+        if resource is None:
+            return
+
+        waiters = self._waiters[resource.name]
+        del waiters[process]
+        if not waiters:
+            del self._waiters[resource.name]
+
+        process.waiting_for = None
+        self._remove_wait_edge(process.name)
+        if notify and self._handlers:
+            self._emit(UNBLOCKED, process.name, resource.name)
+
+    def _hand_off(self, resource):
+        """Give a freed resource to its oldest waiter"""
+        waiters = self._waiters.get(resource.name)
+        if not waiters:
+            return
+
+        nxt = next(iter(waiters))
+        self._stop_waiting(nxt, notify=False)
+        self._grant(nxt, resource)
+
+        # The remaining waiters now wait for the new holder. nxt no longer
+        # waits for anyone, so these edges cannot close a cycle.
+        for proc in self._waiters.get(resource.name, ()):
+            if self.avoidance:
+                self._order_edge(proc.name, nxt.name)
+            self._add_wait_edge(proc.name, nxt.name)
+
+    def _add_wait_edge(self, waiter, holder):
+        """Record waiter -> holder and check only the chain behind it"""
+        self._remove_wait_edge(waiter)
+        self._wait_edges[waiter] = holder
+        self._waiters_of.setdefault(holder, set()).add(waiter)
+
+        m = metrics.active
+        if m is not None:
+            m.inc("deadlock_wait_edges_added_total")
+        if self.avoidance:
+            # _order_edge has already ruled out a cycle
+            return
+
+        path = [waiter]
+        node = holder
+        while node != waiter:
+            if node in self._cycle_of:
+                # The chain runs into a cycle that does not include waiter
+                break
+            nxt = self._wait_edges.get(node)
+            if nxt is None:
+                break
+            path.append(node)
+            node = nxt
+        else:
+            cycle = tuple(path)
+            for name in cycle:
+                self._cycle_of[name] = cycle
+            if self._handlers:
+                self._emit(DEADLOCK_FORMED, cycle)
+
+        if m is not None:
+            m.observe("deadlock_cycle_check_nodes", len(path), buckets=metrics.SIZE_BUCKETS)
+            if node == waiter:
+                m.inc("deadlock_cycles_formed_total")
+
+    def _remove_wait_edge(self, waiter):
+        holder = self._wait_edges.pop(waiter, None)
+        if holder is None:
+            return
+        m = metrics.active
+        if m is not None:
+            m.inc("deadlock_wait_edges_removed_total")
+        if self._watch_edges:
+            self._to_retry.extend(self._watch_edges.pop(waiter, ()))
+
+        waiters = self._waiters_of[holder]
+        waiters.discard(waiter)
+        if not waiters:
+            del self._waiters_of[holder]
+
+        # Removing any edge of a cycle breaks that cycle
+        cycle = self._cycle_of.get(waiter)
+        if cycle:
+            for name in cycle:
+                del self._cycle_of[name]
+            if self._handlers:
+                self._emit(DEADLOCK_RESOLVED, cycle)
+
+    def _order_edge(self, waiter, holder):
+        """Fit waiter -> holder into the topological order.
+
+        Returns None once the order has room for the edge, or the cycle
+        the edge would close (in wait order, from waiter) without
+        changing anything. Only nodes positioned between holder and
+        waiter are visited.
+        """
+        order = self._order
+        upper = order[waiter]
+        lower = order[holder]
+        if upper < lower:
+            return None
+
+        # Forward: the chain out of holder, up to waiter's position.
+        # Positions rise along every edge, so the chain can only reach
+        # waiter before it passes that position.
+        forward = []
+        node = holder
+        while node is not None and order[node] <= upper:
+            if node == waiter:
+                return (waiter, *forward)
+            forward.append(node)
+            node = self._wait_edges.get(node)
+
+        # Backward: everything waiting (transitively) for waiter that sits
+        # above holder's position
+        backward = [waiter]
+        stack = [waiter]
+        seen = {waiter}
+        while stack:
+            for w in self._waiters_of.get(stack.pop(), ()):
+                if w not in seen and order[w] > lower:
+                    seen.add(w)
+                    backward.append(w)
+                    stack.append(w)
+
+        # Reuse the same positions: the backward set first, then the chain
+        backward.sort(key=order.__getitem__)
+        nodes = backward + forward
+        for node, position in zip(nodes, sorted(order[n] for n in nodes)):
+            order[node] = position
+        return None
+
+    def _refuse(self, process, resource, cycle):
+        if self.avoidance == REJECT:
+            if self._handlers:
+                self._emit(REJECTED, process.name, resource.name, cycle)
+            return REQUEST_REJECTED
+
+        # Retry when an edge on the cycle path is removed or the resource
+        # is freed; nothing else can make the request safe
+        self._deferred[process.name] = resource.name
+        for name in cycle[1:]:
+            self._watch_edges.setdefault(name, set()).add(process.name)
+        self._watch_resources.setdefault(resource.name, set()).add(process.name)
+        if self._handlers:
+            self._emit(DEFERRED, process.name, resource.name, cycle)
+        return REQUEST_DEFERRED
+
+    def _retry_deferred(self):
+        if self._retrying:
+            return
+        self._retrying = True
         try:
-            from deadlock_detector import DeadlockDetector
-        except Exception:
+            while self._to_retry:
+                due = set(self._to_retry)
+                self._to_retry = []
+                # Oldest deferral first
+                for name in [p for p in self._deferred if p in due]:
+                    resource = self._deferred.pop(name, None)
+                    if resource is not None:
+                        self.request_resource(name, resource)
+        finally:
+            self._retrying = False
+
+    @property
+    def deferred(self):
+        """Deferred requests as {process: resource}, oldest first"""
+        return dict(self._deferred)
+
+    def _cached(self, key, compute):
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == self.generation:
+            return entry[1]
+        result = compute()
+        self._cache[key] = (self.generation, result)
+        return result
+
+    def detect_deadlock(self):
+        """Return the deadlocked processes, same answer as DeadlockDetector.
+
+        The result is cached until the next mutation; do not modify it.
+        """
+        m = metrics.active
+        if m is not None:
+            start = time.perf_counter()
+            result = self._cached("deadlock", self._find_deadlocked) if self._cycle_of else []
+            m.observe("deadlock_detect_seconds", time.perf_counter() - start, labels=_DETECTOR)
+            return result
+
+        if not self._cycle_of:
             return []
+        return self._cached("deadlock", self._find_deadlocked)
 
-        detector = DeadlockDetector(self)
-        has_deadlock, processes = detector.detect_deadlock()
-        return processes if has_deadlock else []
+    def deadlock_cycles(self):
+        """Return every current cycle in wait order, from its smallest member"""
+        return self._cached("cycles", self._list_cycles)
+
+    def wait_for_graph(self):
+        """Return the wait-for graph as {waiter: [holder]}, sorted by waiter.
+
+        Same shape as DeadlockDetector.build_wait_for_graph, but read from
+        the edges kept in place and cached until the next mutation.
+        """
+        return self._cached("graph", lambda: {
+            waiter: [self._wait_edges[waiter]] for waiter in sorted(self._wait_edges)
+        })
+
+    def _list_cycles(self):
+        cycles = []
+        for cycle in set(self._cycle_of.values()):
+            i = cycle.index(min(cycle))
+            cycles.append(list(cycle[i:] + cycle[:i]))
+        cycles.sort()
+        return cycles
+
+    def _find_deadlocked(self):
+        # DeadlockDetector reports the path from the first process (by name)
+        # whose wait chain ends in a cycle, so collect every such process
+        # by walking the edges backwards from the known cycles.
+        blocked = set(self._cycle_of)
+        stack = list(blocked)
+        while stack:
+            node = stack.pop()
+            for waiter in self._waiters_of.get(node, ()):
+                if waiter not in blocked:
+                    blocked.add(waiter)
+                    stack.append(waiter)
+
+        m = metrics.active
+        if m is not None:
+            m.observe("deadlock_detect_nodes", len(blocked), labels=_DETECTOR,
+                      buckets=metrics.SIZE_BUCKETS)
+
+        node = min(blocked)
+        path = {node}
+        while True:
+            node = self._wait_edges[node]
+            if node in path:
+                break
+            path.add(node)
+
+        return sorted(path)
 
     def show_state(self):
         print("\n PROCESS STATE ")
@@ -77,6 +479,90 @@ class DeadlockCore:
         for r in self.resources.values():
             print(r)
 
+    def snapshot(self):
+        """Return the current state as nested tuples of names.
+
+        Cycles are stored as they are, so restore() does not have to look
+        for them again. Names are shared with the live objects, not copied.
+        """
+        processes = tuple(
+            (p.name, tuple(r.name for r in p.holding),
+             p.waiting_for.name if p.waiting_for else None)
+            for p in self.processes.values()
+        )
+        waiters = tuple(
+            (name, tuple(p.name for p in queue))
+            for name, queue in self._waiters.items()
+        )
+        cycles = tuple(set(self._cycle_of.values()))
+        return tuple(self.resources), processes, waiters, cycles
+
+    def restore(self, snapshot):
+        """Replace the current state with one taken by snapshot().
+
+        No events are emitted. Deferred requests are dropped.
+        """
+        resource_names, processes, waiters, cycles = snapshot
+        if cycles and self.avoidance:
+            raise ValueError("cannot restore a deadlocked snapshot in avoidance mode")
+        self.generation += 1
+
+        self.resources = {name: Resource(name) for name in resource_names}
+        self.processes = {}
+        self._wait_edges = {}
+        self._waiters_of = {}
+        self._cycle_of = {}
+
+        for name, holding, _ in processes:
+            process = Process(name)
+            for resource_name in holding:
+                resource = self.resources[resource_name]
+                resource.allocated_to = process
+                process.holding[resource] = None
+            self.processes[name] = process
+
+        for name, _, waiting in processes:
+            if waiting is not None:
+                resource = self.resources[waiting]
+                self.processes[name].waiting_for = resource
+                holder = resource.allocated_to.name
+                self._wait_edges[name] = holder
+                self._waiters_of.setdefault(holder, set()).add(name)
+
+        self._waiters = {
+            name: {self.processes[p]: None for p in queue}
+            for name, queue in waiters
+        }
+
+        for cycle in cycles:
+            for name in cycle:
+                self._cycle_of[name] = cycle
+
+        self._deferred = {}
+        self._watch_edges = {}
+        self._watch_resources = {}
+        self._to_retry = []
+        if self.avoidance:
+            self._rebuild_order()
+
+    def _rebuild_order(self):
+        # Deeper waiters first: position = rank by distance to the end of
+        # the chain, highest distance lowest
+        depth = {}
+        for name in self.processes:
+            chain = []
+            node = name
+            while node is not None and node not in depth:
+                chain.append(node)
+                node = self._wait_edges.get(node)
+            d = depth[node] if node is not None else -1
+            for n in reversed(chain):
+                d += 1
+                depth[n] = d
+        ranked = sorted(self.processes, key=lambda n: -depth[n])
+        self._order = {name: -i for i, name in enumerate(reversed(ranked), 1)}
+        self._order_floor = -len(ranked)
+
 if __name__ == "__main__":
     core = DeadlockCore()
 
@@ -1,52 +1,173 @@
-from collections import defaultdict
-
-class DeadlockDetector:
-    def __init__(self, core):
-        self.core = core
-    
-    def build_wait_for_graph(self):
-        """Build wait-for graph: node A -> node B means A waits for B"""
-        graph = defaultdict(list)
-
-        # Sort process names để đảm bảo thứ tự nhất quán
-        for process_name in sorted(self.core.processes.keys()):
-            process = self.core.processes[process_name]
-            if process.waiting_for:
-                holder = process.waiting_for.allocated_to
-                if holder:
-                    graph[process.name].append(holder.name)
-
-        return graph
-
-    def detect_deadlock(self):
-        """Detect cycle in wait-for graph using DFS"""
-        graph = self.build_wait_for_graph()
-
-        visited = set()
-        rec_stack = set()  # Recursion stack để track cycle
-        cycle_nodes = set()
-
-        def dfs(node):
-            visited.add(node)
-            rec_stack.add(node)
-
-            for neighbor in sorted(graph[node]):  # Sort để đảm bảo thứ tự nhất quán
-                if neighbor not in visited:
-                    if dfs(neighbor):
-                        cycle_nodes.add(node)
-                        return True
-                elif neighbor in rec_stack:
-                    # Found cycle
-                    cycle_nodes.add(node)
-                    return True
-
-            rec_stack.remove(node)
-            return False
-
-        # Xử lý các node theo thứ tự nhất quán
-        for node in sorted(graph.keys()):
-            if node not in visited:
-                if dfs(node):
-                    return True, sorted(list(cycle_nodes))
-
-        return False, []
+import time
+from collections import defaultdict
+
+import metrics
+
+_DETECTOR = (("detector", "reference"),)
+
+
+def find_deadlock_cycles(graph):
+    """Find every deadlocked group in a wait-for graph in one linear pass.
+
+    Iterative Tarjan SCC, so long wait chains cannot hit the recursion
+    limit. `graph` maps a node to the list of nodes it waits for. Each
+    group is a strongly connected component with more than one node, or a
+    node waiting for itself. Groups are listed in cycle order starting at
+    their smallest member; a component that is not a simple cycle (only
+    possible with several outgoing edges per node) is listed sorted.
+    """
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    groups = []
+    counter = 0
+
+    for root in graph:
+        if root in index:
+            continue
+
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+
+        while work:
+            node, neighbors = work[-1]
+            for neighbor in neighbors:
+                if neighbor not in index:
+                    index[neighbor] = low[neighbor] = counter
+                    counter += 1
+                    stack.append(neighbor)
+                    on_stack.add(neighbor)
+                    work.append((neighbor, iter(graph.get(neighbor, ()))))
+                    break
+                if neighbor in on_stack and index[neighbor] < low[node]:
+                    low[node] = index[neighbor]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[node] < low[parent]:
+                        low[parent] = low[node]
+
+                if low[node] == index[node]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        members.append(member)
+                        if member == node:
+                            break
+
+                    if len(members) > 1 or node in graph.get(node, ()):
+                        groups.append(_cycle_order(graph, members))
+
+    groups.sort()
+    return groups
+
+
+def _cycle_order(graph, members):
+    """Order an SCC along its cycle, starting from the smallest member"""
+    member_set = set(members)
+    start = min(members)
+    order = [start]
+    node = start
+
+    while True:
+        successors = [n for n in graph.get(node, ()) if n in member_set]
+        if len(successors) != 1:
+            return sorted(members)
+        node = successors[0]
+        if node == start:
+            break
+        order.append(node)
+
+    if len(order) != len(members):
+        return sorted(members)
+    return order
+
+
+def first_deadlock(graph, visited=None):
+    """DFS from each node in sorted order; stop at the first cycle found.
+
+    Returns (root, path) where path is every node on the DFS path from
+    root when the cycle closed, sorted, or None without a cycle.
+    `visited` (a set) collects the nodes seen, if given.
+    """
+    if visited is None:
+        visited = set()
+    rec_stack = set()  # Path of the current DFS, to track cycles
+
+    # Xử lý các node theo thứ tự nhất quán
+    for root in sorted(graph.keys()):
+        if root in visited:
+            continue
+
+        visited.add(root)
+        rec_stack.add(root)
+        stack = [(root, iter(graph[root]))]
+
+        # Explicit stack instead of recursion, so long chains are fine
+        while stack:
+            node, neighbors = stack[-1]
+            for neighbor in neighbors:
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    rec_stack.add(neighbor)
+                    stack.append((neighbor, iter(graph.get(neighbor, ()))))
+                    break
+                if neighbor in rec_stack:
+                    # Found cycle: report every node on the current path
+                    return root, sorted(n for n, _ in stack)
+            else:
+                stack.pop()
+                rec_stack.discard(node)
+
+    return None
+
+
+class DeadlockDetector:
+    def __init__(self, core):
+        self.core = core
+        self._visited = 0       # nodes visited by the last detection
+    
+    def build_wait_for_graph(self):
+        """Build wait-for graph: node A -> node B means A waits for B"""
+        graph = defaultdict(list)
+
+        # Sort process names để đảm bảo thứ tự nhất quán
+        for process_name in sorted(self.core.processes.keys()):
+            process = self.core.processes[process_name]
+            if process.waiting_for:
+                holder = process.waiting_for.allocated_to
+                if holder:
+                    graph[process.name].append(holder.name)
+
+        return graph
+
+    def detect_deadlock(self):
+        """Detect cycle in wait-for graph using DFS"""
+        m = metrics.active
+        if m is None:
+            return self._detect()
+
+        start = time.perf_counter()
+        result = self._detect()
+        m.observe("deadlock_detect_seconds", time.perf_counter() - start, labels=_DETECTOR)
+        m.observe("deadlock_detect_nodes", self._visited, labels=_DETECTOR,
+                  buckets=metrics.SIZE_BUCKETS)
+        return result
+
+    def _detect(self):
+        visited = set()
+        found = first_deadlock(self.build_wait_for_graph(), visited)
+        self._visited = len(visited)
+        if found is None:
+            return False, []
+        return True, found[1]
+
+    def detect_all_deadlocks(self):
+        """Return every deadlocked cycle, each in wait order"""
+        return find_deadlock_cycles(self.build_wait_for_graph())
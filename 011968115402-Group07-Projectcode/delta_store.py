@@ -0,0 +1,426 @@
+"""Delta-encoded, indexed result output in SQLite.
+
+CSVLogger writes the full holding list and a deadlock string on every
+row. DeltaLogger instead records what changed, taken from the core's
+events, so the file grows with the number of state changes and can be
+queried without scanning it.
+
+Steps are stored in chunks of consecutive steps, one row each, as
+zlib-compressed columns (packed little-endian arrays, as in csv_loader's
+compiled traces):
+
+    chunks(first_step, steps, deltas, data)
+        per step:   process, action, resource, number of deltas
+        per delta:  process, resource, kind     acquired / released /
+                                                waiting / unblocked
+    process_chunks(process, chunk)              chunks with deltas of a
+    resource_chunks(resource, chunk)            process / resource
+    deadlocks(cycle, formed_step, resolved_step)
+
+Names are interned; each chunk adds its new names to the `names` table
+as one compressed NUL-separated block. A step is found through the
+first_step key, a process or resource through its chunk list, so a
+query decodes only the chunks it needs. Per-row tables and indexes made
+the file larger than result.csv; chunks cost a few bytes per step.
+
+    with DeltaLogger(core, "output/result.db") as logger:
+        core.apply_batch(..., on_step=logger.log_step)
+
+    store = DeltaStore("output/result.db")
+    store.state_at("P3", 1200)        # (["R1"], "R7")
+    store.contended_steps("R7")       # [(1180, 1305), (2040, None)]
+"""
+import os
+import sqlite3
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from csv_loader import ACTIONS
+from events import ACQUIRED, DEADLOCK_FORMED, DEADLOCK_RESOLVED, RELEASED, UNBLOCKED, WAITING
+
+# Delta kinds as stored
+KINDS = (ACQUIRED, RELEASED, WAITING, UNBLOCKED)
+_ACQUIRED, _RELEASED, _WAITING, _UNBLOCKED = range(4)
+
+_SCHEMA = """
+CREATE TABLE names (first_id INTEGER PRIMARY KEY, data BLOB);
+CREATE TABLE chunks (first_step INTEGER PRIMARY KEY, steps INTEGER, deltas INTEGER, data BLOB);
+CREATE TABLE process_chunks (process INTEGER, chunk INTEGER, PRIMARY KEY (process, chunk))
+    WITHOUT ROWID;
+CREATE TABLE resource_chunks (resource INTEGER, chunk INTEGER, PRIMARY KEY (resource, chunk))
+    WITHOUT ROWID;
+CREATE TABLE deadlocks (id INTEGER PRIMARY KEY, cycle TEXT, formed_step INTEGER,
+                        resolved_step INTEGER);
+"""
+
+# Built on close(), which is faster than keeping it up to date while inserting
+_INDEXES = """
+CREATE INDEX deadlocks_formed ON deadlocks (formed_step);
+"""
+
+# Column types of a chunk, in storage order; the first four have one
+# entry per step, the last three one per delta
+_STEP_COLUMNS = ("i", "B", "i", "i")
+_DELTA_COLUMNS = ("i", "i", "B")
+
+
+def _pack(columns):
+    parts = []
+    for column in columns:
+        if column.itemsize > 1 and sys.byteorder == "big":
+            column = array(column.typecode, column)
+            column.byteswap()
+        parts.append(column.tobytes())
+    return zlib.compress(b"".join(parts))
+
+
+def _unpack(data, n_steps, n_deltas):
+    buf = zlib.decompress(data)
+    columns = []
+    offset = 0
+    for typecodes, length in ((_STEP_COLUMNS, n_steps), (_DELTA_COLUMNS, n_deltas)):
+        for typecode in typecodes:
+            column = array(typecode)
+            size = length * column.itemsize
+            column.frombytes(buf[offset:offset + size])
+            offset += size
+            if column.itemsize > 1 and sys.byteorder == "big":
+                column.byteswap()
+            columns.append(column)
+    return columns
+
+
+class DeltaLogger:
+    """Drop-in alternative to CSVLogger that writes a DeltaStore file.
+
+    Subscribes to the core's events on creation and unsubscribes on
+    close(). Like CSVLogger it tracks first_deadlock_step/first_deadlock.
+    Every `flush_rows` steps are written as one chunk.
+    """
+
+    def __init__(self, core, output_path, flush_rows=10000):
+        self.core = core
+        self.step = 0
+        self.first_deadlock_step = None
+        self.first_deadlock = []
+        self.flush_rows = max(1, flush_rows)
+
+        self.output_path = os.fspath(output_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+        self._db = sqlite3.connect(self.output_path)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.executescript(_SCHEMA)
+
+        self._ids = {}
+        self._new_names = []
+        self._chunk_start = 1       # first step of the buffered chunk
+        self._new_chunk()
+        self._open_cycles = {}      # cycle -> its row in deadlocks
+        self._formed = False
+        self._closed = False
+
+        self._handlers = [
+            (ACQUIRED, lambda p, r: self._delta(p, r, _ACQUIRED)),
+            (RELEASED, lambda p, r: self._delta(p, r, _RELEASED)),
+            (WAITING, lambda p, r, holder: self._delta(p, r, _WAITING)),
+            (UNBLOCKED, lambda p, r: self._delta(p, r, _UNBLOCKED)),
+            (DEADLOCK_FORMED, self._deadlock_formed),
+            (DEADLOCK_RESOLVED, self._deadlock_resolved),
+        ]
+        for event, handler in self._handlers:
+            core.subscribe(event, handler)
+
+    def _new_chunk(self):
+        self._steps = [array(typecode) for typecode in _STEP_COLUMNS]
+        self._deltas = [array(typecode) for typecode in _DELTA_COLUMNS]
+        self._counted = 0           # deltas already assigned to a step
+
+    def _id(self, name):
+        i = self._ids.get(name)
+        if i is None:
+            i = self._ids[name] = len(self._ids)
+            self._new_names.append(name)
+        return i
+
+    def _delta(self, process, resource, kind):
+        # Events arrive while the operation of the next step is applied;
+        # log_step counts them towards it
+        processes, resources, kinds = self._deltas
+        processes.append(self._id(process))
+        resources.append(self._id(resource))
+        kinds.append(kind)
+
+    def _deadlock_formed(self, cycle):
+        self._formed = True
+        cursor = self._db.execute(
+            "INSERT INTO deadlocks (cycle, formed_step) VALUES (?, ?)",
+            (" -> ".join(cycle), self.step + 1),
+        )
+        self._open_cycles[cycle] = cursor.lastrowid
+
+    def _deadlock_resolved(self, cycle):
+        row = self._open_cycles.pop(cycle, None)
+        if row is not None:
+            self._db.execute("UPDATE deadlocks SET resolved_step = ? WHERE id = ?",
+                             (self.step + 1, row))
+
+    def log_step(self, process_name, action, resource_name):
+        self.step += 1
+        processes, actions, resources, counts = self._steps
+        processes.append(self._id(process_name))
+        actions.append(ACTIONS.index(action))
+        resources.append(self._id(resource_name))
+        total = len(self._deltas[2])
+        counts.append(total - self._counted)
+        self._counted = total
+
+        if self._formed and self.first_deadlock_step is None:
+            cycle = self.core.detect_deadlock()
+            if cycle:
+                self.first_deadlock_step = self.step
+                self.first_deadlock = cycle
+            else:
+                self._formed = False    # formed and broken within the step
+
+        if len(counts) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered steps as a chunk"""
+        if self._closed:
+            return
+        db = self._db
+        if self._new_names:
+            db.execute("INSERT INTO names VALUES (?, ?)",
+                       (len(self._ids) - len(self._new_names),
+                        zlib.compress("\0".join(self._new_names).encode("utf-8"))))
+            self._new_names.clear()
+
+        n_steps = len(self._steps[0])
+        if n_steps:
+            # Deltas of a step that is not logged yet go to the next chunk
+            n = self._counted
+            deltas = [column[:n] for column in self._deltas]
+            first = self._chunk_start
+            db.execute("INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                       (first, n_steps, n, _pack(self._steps + deltas)))
+            db.executemany("INSERT INTO process_chunks VALUES (?, ?)",
+                           ((p, first) for p in sorted(set(deltas[0]))))
+            db.executemany("INSERT INTO resource_chunks VALUES (?, ?)",
+                           ((r, first) for r in sorted(set(deltas[1]))))
+
+            pending = [column[n:] for column in self._deltas]
+            self._chunk_start += n_steps
+            self._new_chunk()
+            self._deltas = pending
+        db.commit()
+
+    def close(self):
+        if self._closed:
+            return
+        for event, handler in self._handlers:
+            self.core.unsubscribe(event, handler)
+        self.flush()
+        self._db.executescript(_INDEXES)
+        self._db.commit()
+        self._db.close()
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class _Chunk:
+    """A decoded chunk; ends[i] is where the deltas of its i-th step end"""
+
+    __slots__ = ("first_step", "processes", "actions", "resources", "ends",
+                 "delta_processes", "delta_resources", "kinds")
+
+    def __init__(self, first_step, n_steps, n_deltas, data):
+        self.first_step = first_step
+        (self.processes, self.actions, self.resources, counts,
+         self.delta_processes, self.delta_resources, self.kinds) = _unpack(data, n_steps, n_deltas)
+        self.ends = list(accumulate(counts))
+
+    def __len__(self):
+        return len(self.actions)
+
+    def deltas_until(self, step):
+        """Number of deltas recorded up to and including `step`"""
+        i = step - self.first_step
+        return self.ends[i] if i < len(self.ends) else len(self.kinds)
+
+    def step_of(self, j):
+        return self.first_step + bisect_right(self.ends, j)
+
+
+class DeltaStore:
+    """Read-only queries over a file written by DeltaLogger"""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(f"file:{os.fspath(path)}?mode=ro", uri=True)
+        self._names = None
+        self._ids = None
+        self._chunk = None          # the last chunk decoded
+
+    def _load_names(self):
+        if self._names is None:
+            self._names = []
+            for (data,) in self._db.execute("SELECT data FROM names ORDER BY first_id"):
+                self._names.extend(zlib.decompress(data).decode("utf-8").split("\0"))
+        return self._names
+
+    def _name(self, i):
+        return self._load_names()[i]
+
+    def _id(self, name):
+        if self._ids is None:
+            self._ids = {n: i for i, n in enumerate(self._load_names())}
+        return self._ids.get(name)
+
+    def _load(self, first_step):
+        chunk = self._chunk
+        if chunk is None or chunk.first_step != first_step:
+            row = self._db.execute("SELECT steps, deltas, data FROM chunks WHERE first_step = ?",
+                                   (first_step,)).fetchone()
+            chunk = self._chunk = _Chunk(first_step, *row)
+        return chunk
+
+    def _chunk_at(self, step):
+        row = self._db.execute(
+            "SELECT first_step, steps FROM chunks WHERE first_step <= ? "
+            "ORDER BY first_step DESC LIMIT 1", (step,)
+        ).fetchone()
+        if row is None or step >= row[0] + row[1]:
+            raise IndexError(f"no step {step}")
+        return self._load(row[0])
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def steps(self):
+        return self._db.execute("SELECT COALESCE(SUM(steps), 0) FROM chunks").fetchone()[0]
+
+    def operation(self, step):
+        """The operation applied at `step` (1-based), as a dict"""
+        chunk = self._chunk_at(step)
+        i = step - chunk.first_step
+        return {"process": self._name(chunk.processes[i]), "action": ACTIONS[chunk.actions[i]],
+                "resource": self._name(chunk.resources[i])}
+
+    def changes_at(self, step):
+        """[(process, resource, kind)] recorded while applying `step`"""
+        chunk = self._chunk_at(step)
+        i = step - chunk.first_step
+        start = chunk.ends[i - 1] if i else 0
+        return [(self._name(chunk.delta_processes[j]), self._name(chunk.delta_resources[j]),
+                 KINDS[chunk.kinds[j]])
+                for j in range(start, chunk.ends[i])]
+
+    def state_at(self, process, step):
+        """(holding, waiting_for) of `process` after `step` operations.
+
+        Decodes only the chunks up to `step` in which the process changed.
+        """
+        holding = {}
+        waiting = None
+        pid = self._id(process)
+        if pid is None:
+            return [], None
+
+        chunks = self._db.execute(
+            "SELECT chunk FROM process_chunks WHERE process = ? AND chunk <= ? ORDER BY chunk",
+            (pid, step),
+        ).fetchall()
+        for (first_step,) in chunks:
+            chunk = self._load(first_step)
+            processes = chunk.delta_processes
+            resources = chunk.delta_resources
+            kinds = chunk.kinds
+            for j in range(chunk.deltas_until(step)):
+                if processes[j] != pid:
+                    continue
+                resource = resources[j]
+                kind = kinds[j]
+                if kind == _ACQUIRED:
+                    holding[resource] = None
+                    if waiting == resource:
+                        waiting = None
+                elif kind == _RELEASED:
+                    holding.pop(resource, None)
+                elif kind == _WAITING:
+                    waiting = resource
+                elif waiting == resource:
+                    waiting = None
+
+        return ([self._name(r) for r in holding],
+                self._name(waiting) if waiting is not None else None)
+
+    def contended_steps(self, resource):
+        """Step ranges in which at least one process waited for `resource`.
+
+        Returns [(first, end)], `end` being the step at which the last
+        waiter stopped waiting (exclusive), or None if still waiting.
+        """
+        rid = self._id(resource)
+        if rid is None:
+            return []
+
+        chunks = self._db.execute(
+            "SELECT chunk FROM resource_chunks WHERE resource = ? ORDER BY chunk", (rid,)
+        ).fetchall()
+        waiters = set()
+        ranges = []
+        start = None
+        for (first_step,) in chunks:
+            chunk = self._load(first_step)
+            processes = chunk.delta_processes
+            kinds = chunk.kinds
+            for j, r in enumerate(chunk.delta_resources):
+                if r != rid:
+                    continue
+                kind = kinds[j]
+                if kind == _WAITING:
+                    waiters.add(processes[j])
+                elif kind in (_ACQUIRED, _UNBLOCKED):
+                    waiters.discard(processes[j])
+                else:
+                    continue
+                if waiters and start is None:
+                    start = chunk.step_of(j)
+                elif not waiters and start is not None:
+                    ranges.append((start, chunk.step_of(j)))
+                    start = None
+
+        if start is not None:
+            ranges.append((start, None))
+        return ranges
+
+    def deadlocks(self, since=None, until=None):
+        """[(cycle, formed_step, resolved_step)], resolved_step None if never"""
+        query = "SELECT cycle, formed_step, resolved_step FROM deadlocks"
+        args = []
+        if since is not None or until is not None:
+            query += " WHERE formed_step BETWEEN ? AND ?"
+            args = [since or 0, until if until is not None else self.steps()]
+        query += " ORDER BY formed_step, id"
+        return [(cycle.split(" -> "), formed, resolved)
+                for cycle, formed, resolved in self._db.execute(query, args)]
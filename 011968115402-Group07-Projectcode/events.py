@@ -0,0 +1,107 @@
+"""Event hooks for the deadlock cores.
+
+Subscribers are plain callables:
+
+    acquired(process, resource)
+    waiting(process, resource, holder)
+    released(process, resource)
+    unblocked(process, resource)          a wait was cleared without a grant
+    deadlock_formed(cycle)                cycle is a tuple of process names
+    deadlock_resolved(cycle)              in wait order
+    rejected(process, resource, cycle)    avoidance mode: request refused,
+    deferred(process, resource, cycle)    or parked until it is safe; cycle
+                                          is the one it would have closed
+
+With no subscribers an emit point costs one truthiness check, so the
+cores are quiet and cheap by default. attach_logging() routes events to
+the standard logging module instead of print().
+"""
+import logging
+
+ACQUIRED = "acquired"
+WAITING = "waiting"
+RELEASED = "released"
+UNBLOCKED = "unblocked"
+DEADLOCK_FORMED = "deadlock_formed"
+DEADLOCK_RESOLVED = "deadlock_resolved"
+REJECTED = "rejected"
+DEFERRED = "deferred"
+
+EVENTS = (ACQUIRED, WAITING, RELEASED, UNBLOCKED, DEADLOCK_FORMED, DEADLOCK_RESOLVED,
+          REJECTED, DEFERRED)
+
+# Level each event is logged at by attach_logging()
+EVENT_LEVELS = {
+    ACQUIRED: logging.INFO,
+    WAITING: logging.INFO,
+    RELEASED: logging.INFO,
+    UNBLOCKED: logging.DEBUG,
+    DEADLOCK_FORMED: logging.WARNING,
+    DEADLOCK_RESOLVED: logging.WARNING,
+    REJECTED: logging.WARNING,
+    DEFERRED: logging.INFO,
+}
+
+
+class EventEmitter:
+    """Mixin giving a core subscribe/unsubscribe and a cheap _emit"""
+
+    _handlers = {}   # replaced per instance on first subscribe
+
+    def subscribe(self, event, callback):
+        if event not in EVENTS:
+            raise ValueError(f"unknown event '{event}'")
+        handlers = dict(self._handlers)
+        handlers[event] = handlers.get(event, ()) + (callback,)
+        self._handlers = handlers
+        return callback
+
+    def unsubscribe(self, event, callback):
+        handlers = dict(self._handlers)
+        remaining = tuple(h for h in handlers.get(event, ()) if h != callback)
+        if remaining:
+            handlers[event] = remaining
+        else:
+            handlers.pop(event, None)
+        self._handlers = handlers
+
+    def _emit(self, event, *args):
+        for handler in self._handlers.get(event, ()):
+            handler(*args)
+
+
+def attach_logging(core, logger=None, level=None):
+    """Log core events through `logger` (default: the "deadlock" logger).
+
+    Only events at or above the logger's effective level (or `level`) are
+    subscribed, so filtered-out events cost nothing.
+    """
+    if logger is None:
+        logger = logging.getLogger("deadlock")
+    if level is None:
+        level = logger.getEffectiveLevel()
+
+    formats = {
+        ACQUIRED: lambda p, r: f"{p} acquired {r}",
+        WAITING: lambda p, r, holder: f"{p} is waiting for {r}",
+        RELEASED: lambda p, r: f"{p} released {r}",
+        UNBLOCKED: lambda p, r: f"{p} stopped waiting for {r}",
+        DEADLOCK_FORMED: lambda cycle: "Deadlock formed: " + " -> ".join(cycle),
+        DEADLOCK_RESOLVED: lambda cycle: "Deadlock resolved: " + " -> ".join(cycle),
+        REJECTED: lambda p, r, cycle: f"{p} refused {r}: would close " + " -> ".join(cycle),
+        DEFERRED: lambda p, r, cycle: f"{p} deferred {r}: would close " + " -> ".join(cycle),
+    }
+
+    subscribed = []
+    for event, event_level in EVENT_LEVELS.items():
+        if event_level < level:
+            continue
+        fmt = formats[event]
+
+        def handler(*args, _fmt=fmt, _level=event_level):
+            logger.log(_level, _fmt(*args))
+
+        core.subscribe(event, handler)
+        subscribed.append((event, handler))
+
+    return subscribed
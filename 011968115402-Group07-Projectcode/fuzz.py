@@ -0,0 +1,810 @@
+"""Differential fuzzing of the engines against the reference semantics.
+
+The reference is a frozen copy of the original core and detector (list
+holdings, the inline release loop, recursive DFS) kept in this file, so
+changes to deadlock_core.py and deadlock_detector.py are checked against
+it rather than against themselves. Handoff mode, which came later, is
+added to the copy in the most direct way. Each engine replays the same
+random trace and must agree at every step on:
+
+    state      what each process holds (in order) and waits for, and
+               who holds each resource
+    deadlock   the path detect_deadlock() reports
+    cycles     every deadlocked cycle (found by following the single wait
+               edge of each process)
+    events     the events emitted by the step (cores only; the original
+               core has none, so DeadlockCore's events are the reference)
+
+Engines:
+    core            DeadlockCore's own incremental detection
+    detector        DeadlockDetector (iterative DFS and Tarjan SCC) over a
+                    DeadlockCore; its first_deadlock / find_deadlock_cycles
+                    are also run on the union of all wait-for graphs so
+                    far (several holders per waiter), against the frozen
+                    DFS and a brute-force reachability check
+    core_batch      DeadlockCore.apply_batch
+    compact         CompactDeadlockCore
+    compact_batch   CompactDeadlockCore.apply_batch
+    replay          TraceReplayer seeks, to every step in random order
+    avoid           DeadlockCore(avoidance="reject"): never deadlocked, and
+                    a request is refused exactly when the reference core
+                    would deadlock on it
+    matrix          MatrixDeadlockDetector (NumPy and plain Python) on a
+                    MultiInstanceCore, against a direct Available /
+                    Allocation / Request check, on separate traces with
+                    counts and capacities; with NumPy installed both
+                    must also build the same matrices
+    components      parallel_detector's edge encoding and component
+                    grouping on each step's wait-for graph (and on the
+                    union of all graphs so far, for several holders per
+                    waiter), against a direct computation; with NumPy
+                    installed its vectorized paths must give the same
+                    arrays as the plain ones
+    sharded         parallel_detector.ParallelDeadlockDetector, one pool per
+                    trace (slow; not in the default set)
+
+Traces are small: a few processes and resources, so requests pile up
+into cycles, with repeated requests, releases of resources that are not
+held and the hold action mixed in. Each trace runs in plain and in
+handoff mode. A failing trace is shrunk (chunks of operations removed,
+then names simplified) while the same engine keeps failing, and written
+as a CSV that main.py can load.
+
+    python fuzz.py --seeds 1000
+    python fuzz.py --time-budget 60          # CI: as many seeds as fit
+"""
+import argparse
+import copy
+import csv
+import os
+import random
+import sys
+import time
+from array import array
+from collections import defaultdict
+
+from benchmark import write_trace
+from compact_core import CompactDeadlockCore
+from csv_loader import ACTIONS
+from deadlock_core import REJECT, REQUEST_REJECTED, DeadlockCore
+from deadlock_detector import DeadlockDetector, find_deadlock_cycles, first_deadlock
+from events import EVENTS
+from matrix_detector import MatrixDeadlockDetector, np
+from multi_instance_core import MultiInstanceCore, apply_operations
+from parallel_detector import component_labels, encode_graph, group_by_component
+from replay import TraceReplayer
+
+DEFAULT_ENGINES = ("core", "detector", "core_batch", "compact", "compact_batch", "replay",
+                   "avoid", "matrix", "components")
+ALL_ENGINES = DEFAULT_ENGINES + ("sharded",)
+
+
+# Frozen reference: the original Resource / Process / DeadlockCore and
+# DeadlockDetector, without the prints. Do not optimize these.
+
+class _BaselineResource:
+    def __init__(self, name):
+        self.name = name
+        self.allocated_to = None
+
+
+class _BaselineProcess:
+    def __init__(self, name):
+        self.name = name
+        self.holding = []
+        self.waiting_for = None
+        self.waiting_since = 0      # handoff only: arrival order of waiters
+
+
+class _BaselineCore:
+    def __init__(self, handoff=False):
+        self.processes = {}
+        self.resources = {}
+        self.handoff = handoff
+        self.clock = 0
+
+    def create_process(self, name):
+        self.processes[name] = _BaselineProcess(name)
+
+    def create_resource(self, name):
+        self.resources[name] = _BaselineResource(name)
+
+    def request_resource(self, process_name, resource_name):
+        process = self.processes[process_name]
+        resource = self.resources[resource_name]
+
+        if resource.allocated_to is None:
+            resource.allocated_to = process
+            process.holding.append(resource)
+        else:
+            if process.waiting_for is not resource:
+                self.clock += 1
+                process.waiting_since = self.clock
+            process.waiting_for = resource
+
+    def release_resource(self, process_name, resource_name):
+        process = self.processes.get(process_name)
+        resource = self.resources.get(resource_name)
+        if not process or not resource:
+            return
+
+        if resource in process.holding:
+            process.holding.remove(resource)
+
+        if self.handoff:
+            self._hand_off(process, resource)
+            return
+
+        if resource.allocated_to == process:
+            resource.allocated_to = None
+
+        # clear waiting_for for any processes waiting for this resource
+        for proc in self.processes.values():
+            if proc.waiting_for == resource:
+                proc.waiting_for = None
+
+    def _hand_off(self, process, resource):
+        if resource.allocated_to != process:
+            # A waiter releasing the resource only withdraws its own claim
+            if process.waiting_for == resource:
+                process.waiting_for = None
+            return
+
+        resource.allocated_to = None
+        waiters = [p for p in self.processes.values() if p.waiting_for == resource]
+        if waiters:
+            nxt = min(waiters, key=lambda p: p.waiting_since)
+            nxt.waiting_for = None
+            resource.allocated_to = nxt
+            nxt.holding.append(resource)
+
+
+class _BaselineDetector:
+    def __init__(self, core):
+        self.core = core
+
+    def build_wait_for_graph(self):
+        graph = defaultdict(list)
+        for process_name in sorted(self.core.processes.keys()):
+            process = self.core.processes[process_name]
+            if process.waiting_for:
+                holder = process.waiting_for.allocated_to
+                if holder:
+                    graph[process.name].append(holder.name)
+        return graph
+
+    def detect_deadlock(self):
+        graph = self.build_wait_for_graph()
+
+        visited = set()
+        rec_stack = set()
+        cycle_nodes = set()
+
+        def dfs(node):
+            visited.add(node)
+            rec_stack.add(node)
+
+            for neighbor in sorted(graph[node]):
+                if neighbor not in visited:
+                    if dfs(neighbor):
+                        cycle_nodes.add(node)
+                        return True
+                elif neighbor in rec_stack:
+                    cycle_nodes.add(node)
+                    return True
+
+            rec_stack.remove(node)
+            return False
+
+        for node in sorted(graph.keys()):
+            if node not in visited:
+                if dfs(node):
+                    return True, sorted(list(cycle_nodes))
+
+        return False, []
+
+    def detect_all_deadlocks(self):
+        """Each cycle from its smallest member, by following the one wait edge"""
+        graph = self.build_wait_for_graph()
+        cycles = set()
+        for start in graph:
+            path = [start]
+            node = graph[start][0]
+            while node in graph and node not in path:
+                path.append(node)
+                node = graph[node][0]
+            if node in path:
+                cycle = path[path.index(node):]
+                first = cycle.index(min(cycle))
+                cycles.add(tuple(cycle[first:] + cycle[:first]))
+        return [list(c) for c in sorted(cycles)]
+
+
+def random_trace(rnd, max_ops=60):
+    """A random list of operation dicts"""
+    processes = [f"P{i}" for i in range(1, rnd.randint(1, 12) + 1)]
+    resources = [f"R{i}" for i in range(1, rnd.randint(1, 8) + 1)]
+    release_ratio = rnd.uniform(0.1, 0.5)
+
+    ops = []
+    for _ in range(rnd.randint(1, max_ops)):
+        if ops and rnd.random() < 0.15:
+            # Same operation again: repeated request, double release
+            ops.append(dict(ops[-1]))
+            continue
+        if rnd.random() < release_ratio:
+            action = "release"
+        else:
+            action = "hold" if rnd.random() < 0.25 else "request"
+        ops.append({"process": rnd.choice(processes), "action": action,
+                    "resource": rnd.choice(resources)})
+    return ops
+
+
+def _encode(ops):
+    ids = {}
+    codes = array("B", (ACTIONS.index(op["action"]) for op in ops))
+    process_ids = array("i", (ids.setdefault(op["process"], len(ids)) for op in ops))
+    resource_ids = array("i", (ids.setdefault(op["resource"], len(ids)) for op in ops))
+    return list(ids), codes, process_ids, resource_ids
+
+
+def _apply(core, op):
+    process = op["process"]
+    resource = op["resource"]
+    if process not in core.processes:
+        core.create_process(process)
+    if resource not in core.resources:
+        core.create_resource(resource)
+    if op["action"] == "release":
+        core.release_resource(process, resource)
+    else:
+        return core.request_resource(process, resource)
+
+
+def _state(core):
+    processes = tuple(
+        (name, tuple(r.name for r in p.holding), p.waiting_for.name if p.waiting_for else None)
+        for name, p in sorted(core.processes.items())
+    )
+    resources = tuple(
+        (name, r.allocated_to.name if r.allocated_to else None)
+        for name, r in sorted(core.resources.items())
+    )
+    return processes, resources
+
+
+def _record_events(core):
+    log = []
+    for event in EVENTS:
+        core.subscribe(event, lambda *args, _event=event: log.append((_event, args)))
+    return log
+
+
+class _CoreEngine:
+    """A core stepped one operation at a time, answering with its own detection"""
+
+    def __init__(self, core, ops):
+        self.core = core
+        self.ops = ops
+        self.events = _record_events(core)
+
+    def step(self, i):
+        _apply(self.core, self.ops[i])
+
+    def observe(self):
+        core = self.core
+        observation = {"state": _state(core), "deadlock": list(core.detect_deadlock()),
+                       "cycles": [list(c) for c in core.deadlock_cycles()],
+                       "events": list(self.events)}
+        self.events.clear()
+        return observation
+
+    def close(self):
+        pass
+
+
+class _BatchEngine(_CoreEngine):
+    """The same, with every operation going through apply_batch"""
+
+    def __init__(self, core, ops):
+        super().__init__(core, ops)
+        self.encoded = _encode(ops)
+
+    def step(self, i):
+        self.core.apply_batch(*self.encoded, start=i, stop=i + 1)
+
+
+class _ShardedEngine(_CoreEngine):
+    def __init__(self, core, ops):
+        from parallel_detector import ParallelDeadlockDetector
+        super().__init__(core, ops)
+        self.detector = ParallelDeadlockDetector(core, workers=2, serial_threshold=0)
+
+    def observe(self):
+        self.events.clear()
+        found, path = self.detector.detect_deadlock()
+        return {"deadlock": path if found else [],
+                "cycles": self.detector.detect_all_deadlocks()}
+
+    def close(self):
+        self.detector.close()
+
+
+def _make_engine(name, ops, handoff):
+    if name == "core":
+        return _CoreEngine(DeadlockCore(handoff=handoff), ops)
+    if name == "core_batch":
+        return _BatchEngine(DeadlockCore(handoff=handoff), ops)
+    if name == "compact":
+        return _CoreEngine(CompactDeadlockCore(handoff=handoff), ops)
+    if name == "compact_batch":
+        return _BatchEngine(CompactDeadlockCore(handoff=handoff), ops)
+    if name == "sharded":
+        return _ShardedEngine(DeadlockCore(handoff=handoff), ops)
+    raise ValueError(f"unknown engine '{name}'")
+
+
+def reference_run(ops, handoff=False):
+    """Observations after steps 0..len(ops) from the frozen original core"""
+    core = _BaselineCore(handoff=handoff)
+    detector = _BaselineDetector(core)
+    # Events only exist in DeadlockCore, so they come from there
+    events_core = DeadlockCore(handoff=handoff)
+    events = _record_events(events_core)
+
+    observations = []
+    for i in range(len(ops) + 1):
+        if i:
+            _apply(core, ops[i - 1])
+            _apply(events_core, ops[i - 1])
+        found, path = detector.detect_deadlock()
+        observations.append({"state": _state(core), "deadlock": path if found else [],
+                             "cycles": detector.detect_all_deadlocks(),
+                             "events": list(events)})
+        events.clear()
+    return observations
+
+
+def _compare(engine, step, expected, got):
+    for field, value in got.items():
+        if value != expected[field]:
+            return {"engine": engine, "step": step, "field": field,
+                    "expected": expected[field], "got": value}
+    return None
+
+
+def check_trace(ops, engines=DEFAULT_ENGINES, handoff=False):
+    """Run every engine against the reference; returns the first mismatch or None"""
+    reference = reference_run(ops, handoff)
+
+    for name in engines:
+        if name == "matrix":
+            continue    # pooled traces, see check_pools
+        if name in ("detector", "replay", "avoid", "components"):
+            check = {"detector": _check_detector, "replay": _check_replay,
+                     "avoid": _check_avoidance, "components": _check_components}[name]
+            mismatch = check(ops, reference, handoff)
+            if mismatch:
+                return mismatch
+            continue
+
+        engine = _make_engine(name, ops, handoff)
+        try:
+            for i in range(len(ops) + 1):
+                if i:
+                    engine.step(i - 1)
+                mismatch = _compare(name, i, reference[i], engine.observe())
+                if mismatch:
+                    mismatch["handoff"] = handoff
+                    return mismatch
+        finally:
+            engine.close()
+    return None
+
+
+def _check_replay(ops, reference, handoff):
+    replayer = TraceReplayer(ops, DeadlockCore(handoff=handoff), snapshot_every=3)
+    replayer.replay_all()
+
+    steps = list(range(len(ops) + 1))
+    random.Random(len(ops)).shuffle(steps)
+    for step in steps:
+        core = replayer.seek(step)
+        got = {"state": _state(core), "deadlock": list(core.detect_deadlock()),
+               "cycles": [list(c) for c in core.deadlock_cycles()]}
+        mismatch = _compare("replay", step, reference[step], got)
+        if mismatch:
+            mismatch["handoff"] = handoff
+            return mismatch
+    return None
+
+
+def _check_avoidance(ops, reference, handoff):
+    """Step DeadlockCore(avoidance=REJECT) next to a copy of the original
+    core that is rolled back whenever the operation deadlocks it"""
+    core = DeadlockCore(handoff=handoff, avoidance=REJECT)
+    shadow = _BaselineCore(handoff=handoff)
+
+    for i in range(len(ops) + 1):
+        refused = expected_refused = False
+        if i:
+            op = ops[i - 1]
+            before = copy.deepcopy(shadow)
+            _apply(shadow, op)
+            # The shadow never holds a deadlock, so one now was closed by op
+            expected_refused = _BaselineDetector(shadow).detect_deadlock()[0]
+            if expected_refused:
+                shadow = before
+            refused = _apply(core, op) == REQUEST_REJECTED
+
+        found, path = _BaselineDetector(core).detect_deadlock()
+        expected = {"state": _state(shadow), "deadlock": [], "refused": expected_refused}
+        got = {"state": _state(core), "deadlock": path if found else [], "refused": refused}
+        mismatch = _compare("avoid", i, expected, got)
+        if mismatch:
+            mismatch["handoff"] = handoff
+            return mismatch
+    return None
+
+
+def _grouped(graph, use_numpy):
+    names, src, dst = encode_graph(graph, use_numpy)
+    labels = component_labels(len(names), src, dst)
+    src, dst, offsets = group_by_component(labels, src, dst, use_numpy)
+    return names, labels, src.tolist(), dst.tolist(), offsets.tolist()
+
+
+def _expected_grouping(graph, labels):
+    """Edges per component, straight from the graph, in label order"""
+    ids = {name: i for i, name in enumerate(sorted(graph))}
+    edges = [(ids[w], ids[h]) for w, holders in graph.items() for h in holders if h in ids]
+    return [[e for e in edges if labels[e[0]] == label]
+            for label in sorted({labels[a] for a, _ in edges})]
+
+
+def _step_graphs(ops, handoff):
+    """Yield (step, core, wait-for graph, union of the graphs so far).
+
+    The union gives waiters several holders, which the cores never do;
+    its holder lists are sorted, as the frozen DFS visits them.
+    """
+    core = DeadlockCore(handoff=handoff)
+    union = defaultdict(set)
+
+    for i in range(len(ops) + 1):
+        if i:
+            _apply(core, ops[i - 1])
+        graph = core.wait_for_graph()
+        for waiter, holders in graph.items():
+            union[waiter].update(holders)
+        yield i, core, graph, {waiter: sorted(union[waiter]) for waiter in sorted(union)}
+
+
+class _GraphDetector(_BaselineDetector):
+    """The frozen DFS on a given graph instead of a core's"""
+
+    def __init__(self, graph):
+        super().__init__(None)
+        self.graph = graph
+
+    def build_wait_for_graph(self):
+        return defaultdict(list, {node: list(nodes) for node, nodes in self.graph.items()})
+
+
+def _reference_groups(graph):
+    """Deadlocked groups by brute-force reachability, in find_deadlock_cycles' order"""
+    nodes = set(graph).union(*graph.values())
+    reach = {}
+    for node in nodes:
+        seen = set()
+        todo = list(graph.get(node, ()))
+        while todo:
+            n = todo.pop()
+            if n not in seen:
+                seen.add(n)
+                todo.extend(graph.get(n, ()))
+        reach[node] = seen
+
+    groups = {frozenset(m for m in reach[n] if n in reach[m]) for n in nodes if n in reach[n]}
+    result = []
+    for members in groups:
+        successors = {m: [n for n in graph.get(m, ()) if n in members] for m in members}
+        if all(len(s) == 1 for s in successors.values()):
+            # A strongly connected group with one edge out of each member is one cycle
+            order = [min(members)]
+            while len(order) < len(members):
+                order.append(successors[order[-1]][0])
+            result.append(order)
+        else:
+            result.append(sorted(members))
+    return sorted(result)
+
+
+def _check_detector(ops, reference, handoff):
+    for i, core, _, union in _step_graphs(ops, handoff):
+        detector = DeadlockDetector(core)
+        found, path = detector.detect_deadlock()
+        got = {"deadlock": path if found else [], "cycles": detector.detect_all_deadlocks()}
+        mismatch = _compare("detector", i, reference[i], got)
+        if mismatch is None:
+            found, path = _GraphDetector(union).detect_deadlock()
+            first = first_deadlock(union)
+            mismatch = _compare(
+                "detector", i,
+                {"deadlock (union)": path if found else [], "cycles (union)": _reference_groups(union)},
+                {"deadlock (union)": first[1] if first else [],
+                 "cycles (union)": find_deadlock_cycles(union)},
+            )
+        if mismatch:
+            mismatch["handoff"] = handoff
+            return mismatch
+    return None
+
+
+def _check_components(ops, reference, handoff):
+    for i, _, graph, union in _step_graphs(ops, handoff):
+        for kind, g in (("graph", graph), ("union", union)):
+            names, labels, src, dst, offsets = got = _grouped(g, use_numpy=False)
+            blocks = [list(zip(src[a:b], dst[a:b])) for a, b in zip(offsets, offsets[1:])]
+            if not src:
+                blocks = []
+            expected = {"names": sorted(g), "components": _expected_grouping(g, labels)}
+            mismatch = _compare("components", i, expected,
+                                {"names": names, "components": blocks})
+            if mismatch is None and np is not None:
+                mismatch = _compare("components", i, {"numpy": got},
+                                    {"numpy": _grouped(g, use_numpy=True)})
+            if mismatch:
+                mismatch.update(handoff=handoff, field=f"{mismatch['field']} ({kind})")
+                return mismatch
+    return None
+
+
+def random_pool_trace(rnd, max_ops=60):
+    """Random (capacities, operations with counts) for MultiInstanceCore"""
+    processes = [f"P{i}" for i in range(1, rnd.randint(1, 8) + 1)]
+    capacities = {f"R{i}": rnd.randint(1, 4) for i in range(1, rnd.randint(1, 5) + 1)}
+    resources = sorted(capacities)
+    release_ratio = rnd.uniform(0.1, 0.5)
+
+    ops = []
+    for _ in range(rnd.randint(1, max_ops)):
+        resource = rnd.choice(resources)
+        op = {"process": rnd.choice(processes), "resource": resource}
+        if rnd.random() < release_ratio:
+            op["action"] = "release"
+            if rnd.random() < 0.5:
+                op["count"] = rnd.randint(1, capacities[resource])
+        else:
+            op["action"] = "hold" if rnd.random() < 0.25 else "request"
+            # Mostly single units; large counts also test the refusal of
+            # requests that cannot fit with what is already held
+            op["count"] = rnd.randint(1, capacities[resource]) if rnd.random() < 0.3 else 1
+        ops.append(op)
+    return capacities, ops
+
+
+def _reference_pools(core):
+    """Processes that can never finish, from the core's dicts directly"""
+    work = {name: r.available for name, r in core.resources.items()}
+    unfinished = {name for name, p in core.processes.items() if p.allocation or p.request}
+
+    progress = True
+    while progress:
+        progress = False
+        for name in sorted(unfinished):
+            p = core.processes[name]
+            if all(units <= work[r] for r, units in p.request.items()):
+                for r, units in p.allocation.items():
+                    work[r] += units
+                unfinished.discard(name)
+                progress = True
+    return sorted(unfinished)
+
+
+def _pool_state(core):
+    """None if the units add up and no queued request fits, else the problem"""
+    for name, r in sorted(core.resources.items()):
+        held = {p.name: p.allocation[name] for p in core.processes.values() if name in p.allocation}
+        if held != r.allocation or r.available + sum(held.values()) != r.capacity:
+            return f"{name}: available {r.available}, allocation {r.allocation}, held {held}"
+        queued = sorted(p.name for p in core.processes.values() if name in p.request)
+        if queued != sorted(r.queue):
+            return f"{name}: queue {list(r.queue)}, requesting {queued}"
+        for p in queued:
+            if core.processes[p].request[name] <= r.available:
+                return f"{name}: {p} waits for units that are free"
+    return None
+
+
+def check_pools(capacities, ops):
+    """Replay a pooled trace; returns the first mismatch or None.
+
+    Requests that could never fit their pool are refused with ValueError
+    (main.py reports them as CSV errors); the trace goes on without them.
+    """
+    core = MultiInstanceCore(capacities)
+    detectors = [("python", MatrixDeadlockDetector(core, use_numpy=False))]
+    if np is not None:
+        detectors.append(("numpy", MatrixDeadlockDetector(core, use_numpy=True)))
+
+    for i in range(len(ops) + 1):
+        if i:
+            op = ops[i - 1]
+            try:
+                apply_operations(core, (op,))
+            except ValueError:
+                p = core.processes[op["process"]]
+                r = op["resource"]
+                if p.allocation.get(r, 0) + p.request.get(r, 0) + op["count"] <= capacities[r]:
+                    return {"engine": "matrix", "step": i, "field": "refused",
+                            "expected": False, "got": True}
+
+        problem = _pool_state(core)
+        if problem:
+            return {"engine": "matrix", "step": i, "field": "state",
+                    "expected": None, "got": problem}
+        expected = _reference_pools(core)
+        for name, detector in detectors:
+            found, processes = detector.detect_deadlock()
+            if processes != expected or found != bool(expected):
+                return {"engine": "matrix", "step": i, "field": f"deadlock ({name})",
+                        "expected": expected, "got": processes}
+        if len(detectors) > 1:
+            plain = _dense_matrices(detectors[0][1].build_matrices())
+            vectorized = _dense_matrices(detectors[1][1].build_matrices())
+            if vectorized != plain:
+                return {"engine": "matrix", "step": i, "field": "matrices (numpy)",
+                        "expected": plain, "got": vectorized}
+    return None
+
+
+def _dense_matrices(matrices):
+    """build_matrices() output as plain lists, from either representation"""
+    processes, resources, available, allocation, request = matrices
+    if np is not None and isinstance(allocation, np.ndarray):
+        return processes, resources, available.tolist(), allocation.tolist(), request.tolist()
+
+    def dense(rows):
+        return [[row.get(j, 0) for j in range(len(resources))] for row in rows]
+
+    return processes, resources, list(available), dense(allocation), dense(request)
+
+
+def _write_pool_trace(ops, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["process", "action", "resource", "count"])
+        for op in ops:
+            writer.writerow([op["process"], op["action"], op["resource"], op.get("count", "")])
+
+
+def shrink(ops, fails, rename=True):
+    """Smallest trace found for which fails(trace) still holds.
+
+    Removes chunks of operations, halving the chunk size whenever nothing
+    can be removed, then tries names in order of first use (P1, R1, ...)
+    unless `rename` is false.
+    """
+    chunk = max(1, len(ops) // 2)
+    while True:
+        i = 0
+        removed = False
+        while i < len(ops):
+            candidate = ops[:i] + ops[i + chunk:]
+            if candidate and fails(candidate):
+                ops = candidate
+                removed = True
+            else:
+                i += chunk
+        if not removed:
+            if chunk == 1:
+                break
+            chunk //= 2
+
+    renamed = _canonical_names(ops) if rename else ops
+    if renamed != ops and fails(renamed):
+        ops = renamed
+    return ops
+
+
+def _canonical_names(ops):
+    names = {}
+    counts = {"P": 0, "R": 0}
+
+    def rename(name, prefix):
+        if name not in names:
+            counts[prefix] += 1
+            names[name] = f"{prefix}{counts[prefix]}"
+        return names[name]
+
+    return [{"process": rename(op["process"], "P"), "action": op["action"],
+             "resource": rename(op["resource"], "R")} for op in ops]
+
+
+def fuzz(seeds=None, time_budget=None, start_seed=0, max_ops=60,
+         engines=DEFAULT_ENGINES, output_dir="output/fuzz"):
+    """Check traces seed by seed until `seeds` are done or `time_budget`
+    seconds have passed. Returns (traces checked, failure or None); a
+    failure carries the shrunk trace and the path it was written to."""
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    seed = start_seed
+    checked = 0
+
+    while (seeds is None or checked < seeds) and (deadline is None or time.monotonic() < deadline):
+        ops = random_trace(random.Random(seed), max_ops)
+        for handoff in (False, True):
+            mismatch = check_trace(ops, engines, handoff)
+            if mismatch:
+                engine = mismatch["engine"]
+
+                def fails(candidate):
+                    found = check_trace(candidate, (engine,), handoff)
+                    return found is not None
+
+                small = shrink(ops, fails)
+                mismatch = check_trace(small, (engine,), handoff)
+                os.makedirs(output_dir, exist_ok=True)
+                path = os.path.join(output_dir, f"seed{seed}_{engine}.csv")
+                write_trace(small, path)
+                mismatch.update(seed=seed, trace=small, path=path)
+                return checked, mismatch
+
+        if "matrix" in engines:
+            capacities, pool_ops = random_pool_trace(random.Random(-seed - 1), max_ops)
+            if check_pools(capacities, pool_ops):
+                small = shrink(pool_ops, lambda candidate: check_pools(capacities, candidate) is not None,
+                               rename=False)
+                mismatch = check_pools(capacities, small)
+                os.makedirs(output_dir, exist_ok=True)
+                path = os.path.join(output_dir, f"seed{seed}_matrix.csv")
+                _write_pool_trace(small, path)
+                mismatch.update(seed=seed, trace=small, path=path, handoff=False,
+                                capacities=capacities)
+                return checked, mismatch
+        checked += 1
+        seed += 1
+
+    return checked, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuzz the engines against the reference detector")
+    parser.add_argument("--seeds", type=int, help="number of traces (default 200 without a budget)")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS",
+                        help="keep checking new traces until this much time has passed")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--max-ops", type=int, default=60)
+    parser.add_argument("--engines", nargs="+", choices=ALL_ENGINES, default=list(DEFAULT_ENGINES))
+    parser.add_argument("--output-dir", default="output/fuzz",
+                        help="where shrunk failing traces are written")
+    args = parser.parse_args(argv)
+
+    seeds = args.seeds
+    if seeds is None and args.time_budget is None:
+        seeds = 200
+
+    start = time.perf_counter()
+    checked, failure = fuzz(seeds, args.time_budget, args.seed, args.max_ops,
+                            tuple(args.engines), args.output_dir)
+    elapsed = time.perf_counter() - start
+
+    if failure is None:
+        print(f"{checked} traces agree with the reference ({', '.join(args.engines)}) "
+              f"in {elapsed:.1f}s")
+        return 0
+
+    print(f"MISMATCH in {failure['engine']} (seed {failure['seed']}, "
+          f"handoff={failure['handoff']}) at step {failure['step']}, {failure['field']}:")
+    print(f"  expected {failure['expected']}")
+    print(f"  got      {failure['got']}")
+    print(f"Shrunk to {len(failure['trace'])} operations: {failure['path']}")
+    if "capacities" in failure:
+        print("  capacities: " + " ".join(f"--capacity {name}={units}"
+                                         for name, units in sorted(failure["capacities"].items())))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,448 @@
+"""Wait-for graph view for the GUI, with level of detail for large models.
+
+The graph is split into weakly connected components. Each component is
+laid out on its own in a square cell, and the layout is cached until the
+component's edges change, so moving the step slider only lays out again
+the components that changed. Cells sit on a grid, deadlocked components
+first.
+
+Inside a cell:
+    deadlocked   cycle members on a circle (red), the processes directly
+                 waiting for them (or waited for) around it (orange), and
+                 everything further away as one "+n" node
+    small        every process, in rows by distance to the holder the
+                 waits end at
+    large        the holder(s) and one aggregated node for the waiters
+
+Only cells that intersect the viewport are drawn, in more or less detail
+depending on how large a cell is on screen: nodes and edges, then one
+square per component, then only the deadlocked components. While the
+view is dragged or zoomed the canvas moves and scales the items it
+already has; the view is rebuilt once the pointer settles.
+"""
+import math
+import tkinter as tk
+from tkinter import ttk
+
+from deadlock_detector import find_deadlock_cycles
+
+CELL = 200               # cell size, in layout units
+NODE_RADIUS = 9
+SMALL_COMPONENT = 12     # components up to this many processes are drawn in full
+MAX_NEIGHBOURS = 16      # neighbours drawn around a cycle; the rest are aggregated
+
+DETAIL_PX = 80           # cell size on screen from which nodes and edges are drawn
+BLOCK_PX = 10            # ... from which each component is one square
+LABEL_PX = 14            # node diameter on screen from which names are shown
+MAX_SCALE = 8.0
+SETTLE_MS = 60           # redraw this long after the last drag/zoom/update
+
+# Node kinds
+PROCESS = "process"
+CYCLE = "cycle"
+NEIGHBOUR = "neighbour"
+AGGREGATE = "aggregate"
+
+NODE_COLORS = {
+    PROCESS: "#9ec5fe",
+    CYCLE: "#e35d6a",
+    NEIGHBOUR: "#fd9843",
+    AGGREGATE: "#ced4da",
+}
+
+
+class Component:
+    """One weakly connected component, laid out in a CELL x CELL box.
+
+    nodes: [(x, y, label, kind)]; links: [(from index, to index, in a cycle)]
+    """
+
+    __slots__ = ("key", "edges", "size", "deadlocked", "nodes", "links")
+
+    def __init__(self, key, edges, size, deadlocked, nodes, links):
+        self.key = key
+        self.edges = edges
+        self.size = size
+        self.deadlocked = deadlocked
+        self.nodes = nodes
+        self.links = links
+
+
+def split_components(graph):
+    """Group the edges of a wait-for graph by weakly connected component.
+
+    Returns {key: [(waiter, holder), ...]}, the key being the smallest
+    process name in the component. Union-find, near linear.
+    """
+    parent = {}
+
+    def find(node):
+        root = node
+        while True:
+            up = parent.setdefault(root, root)
+            if up == root:
+                break
+            root = up
+        while node != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for waiter, holders in graph.items():
+        for holder in holders:
+            a = find(waiter)
+            b = find(holder)
+            if a < b:
+                parent[b] = a
+            elif b < a:
+                parent[a] = b
+
+    groups = {}
+    for waiter, holders in graph.items():
+        edges = groups.setdefault(find(waiter), [])
+        for holder in holders:
+            edges.append((waiter, holder))
+    return groups
+
+
+def layout_component(key, edges):
+    """Lay out one component; edges is an iterable of (waiter, holder)"""
+    out = {}
+    into = {}
+    for waiter, holder in edges:
+        out.setdefault(waiter, []).append(holder)
+        into.setdefault(holder, []).append(waiter)
+    names = set(out) | set(into)
+
+    cycles = find_deadlock_cycles(out)
+    if cycles:
+        nodes, links = _layout_deadlocked(out, into, names, cycles)
+    elif len(names) <= SMALL_COMPONENT:
+        nodes, links = _layout_small(out, into, names)
+    else:
+        nodes, links = _layout_collapsed(out, names)
+    return Component(key, frozenset(edges), len(names), bool(cycles), nodes, links)
+
+
+def _links(out, index, hot=frozenset()):
+    links = []
+    for waiter, holders in out.items():
+        i = index.get(waiter)
+        if i is None:
+            continue
+        for holder in holders:
+            j = index.get(holder)
+            if j is not None:
+                links.append((i, j, waiter in hot and holder in hot))
+    return links
+
+
+def _layout_deadlocked(out, into, names, cycles):
+    center = CELL / 2
+    ring = [name for cycle in cycles for name in cycle]
+    on_ring = set(ring)
+
+    nodes = []
+    radius = CELL * 0.28
+    for k, name in enumerate(ring):
+        angle = 2 * math.pi * k / len(ring) - math.pi / 2
+        nodes.append((center + radius * math.cos(angle), center + radius * math.sin(angle),
+                      name, CYCLE))
+
+    # Immediate neighbours, in ring order so they sit near their member
+    neighbours = []
+    seen = set(on_ring)
+    for name in ring:
+        for other in sorted(into.get(name, ())) + sorted(out.get(name, ())):
+            if other not in seen:
+                seen.add(other)
+                neighbours.append(other)
+
+    shown = neighbours[:MAX_NEIGHBOURS]
+    radius = CELL * 0.44
+    for k, name in enumerate(shown):
+        angle = 2 * math.pi * (k + 0.5) / len(shown) - math.pi / 2
+        nodes.append((center + radius * math.cos(angle), center + radius * math.sin(angle),
+                      name, NEIGHBOUR))
+
+    rest = len(names) - len(ring) - len(shown)
+    if rest:
+        nodes.append((center, center, f"+{rest}", AGGREGATE))
+
+    index = {node[2]: i for i, node in enumerate(nodes) if node[3] != AGGREGATE}
+    return nodes, _links(out, index, on_ring)
+
+
+def _sinks(out, names):
+    return sorted(name for name in names if name not in out)
+
+
+def _layout_small(out, into, names):
+    # Rows by distance to a sink (a process that waits for nobody)
+    depth = dict.fromkeys(_sinks(out, names), 0)
+    frontier = list(depth)
+    while frontier:
+        following = []
+        for node in frontier:
+            for waiter in into.get(node, ()):
+                if waiter not in depth:
+                    depth[waiter] = depth[node] + 1
+                    following.append(waiter)
+        frontier = following
+
+    rows = {}
+    for name in sorted(names):
+        rows.setdefault(depth[name], []).append(name)
+
+    margin = CELL * 0.15
+    row_height = (CELL - 2 * margin) / max(1, len(rows) - 1)
+    nodes = []
+    for d in sorted(rows):
+        row = rows[d]
+        for k, name in enumerate(row):
+            x = margin + (CELL - 2 * margin) * (k + 0.5) / len(row)
+            nodes.append((x, margin + d * row_height, name, PROCESS))
+
+    index = {node[2]: i for i, node in enumerate(nodes)}
+    return nodes, _links(out, index)
+
+
+def _layout_collapsed(out, names):
+    sinks = _sinks(out, names)
+    if len(sinks) == 1:
+        nodes = [(CELL / 2, CELL * 0.3, sinks[0], PROCESS)]
+    else:
+        nodes = [(CELL / 2, CELL * 0.3, f"{len(sinks)} holders", AGGREGATE)]
+    nodes.append((CELL / 2, CELL * 0.7, f"{len(names) - len(sinks)} waiting", AGGREGATE))
+    return nodes, [(1, 0, False)]
+
+
+class GraphLayout:
+    """Cell grid of component layouts, cached across updates"""
+
+    def __init__(self):
+        self.components = []
+        self.columns = 1
+        self.relaid = 0
+        self._cache = {}
+
+    def update(self, graph):
+        """Take a new wait-for graph; returns how many components were laid out"""
+        cache = {}
+        relaid = 0
+        for key, edges in split_components(graph).items():
+            component = self._cache.get(key)
+            if component is None or component.edges != frozenset(edges):
+                component = layout_component(key, edges)
+                relaid += 1
+            cache[key] = component
+
+        self._cache = cache
+        self.components = sorted(cache.values(), key=lambda c: (not c.deadlocked, c.key))
+        self.columns = max(1, math.ceil(math.sqrt(len(self.components))))
+        self.relaid = relaid
+        return relaid
+
+    @property
+    def extent(self):
+        rows = max(1, math.ceil(len(self.components) / self.columns))
+        return self.columns * CELL, rows * CELL
+
+    def deadlocked(self):
+        """Number of deadlocked components (they come first)"""
+        n = 0
+        for component in self.components:
+            if not component.deadlocked:
+                break
+            n += 1
+        return n
+
+    def cells_in(self, x0, y0, x1, y1):
+        """Yield (component, left, top) for cells that intersect the box"""
+        n = len(self.components)
+        first_col = max(0, int(x0 // CELL))
+        last_col = min(self.columns - 1, int(x1 // CELL))
+        first_row = max(0, int(y0 // CELL))
+        last_row = int(y1 // CELL)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                slot = row * self.columns + col
+                if slot >= n:
+                    return
+                yield self.components[slot], col * CELL, row * CELL
+
+
+def draw_list(layout, left, top, width, height, scale):
+    """Canvas items for the part of the layout in view, in screen coordinates.
+
+    (left, top) is the layout point at the canvas origin and `scale` the
+    pixels per layout unit. Returns [(kind, coords, options)] with kind
+    "line", "oval", "rectangle" or "text".
+    """
+    items = []
+    cells = layout.cells_in(left, top, left + width / scale, top + height / scale)
+    cell_px = CELL * scale
+
+    def screen(x, y):
+        return (x - left) * scale, (y - top) * scale
+
+    if cell_px >= DETAIL_PX:
+        r = NODE_RADIUS * scale
+        labels = 2 * r >= LABEL_PX
+        for component, cx, cy in cells:
+            x, y = screen(cx, cy)
+            items.append(("rectangle", (x + 2, y + 2, x + cell_px - 2, y + cell_px - 2),
+                          {"outline": "#f1aeb5" if component.deadlocked else "#e9ecef"}))
+            points = [screen(cx + nx, cy + ny) for nx, ny, _, _ in component.nodes]
+            for i, j, hot in component.links:
+                (x1, y1), (x2, y2) = points[i], points[j]
+                d = math.hypot(x2 - x1, y2 - y1) or 1
+                # Stop at the rim of the target node so the arrow shows
+                x2 -= (x2 - x1) * r / d
+                y2 -= (y2 - y1) * r / d
+                items.append(("line", (x1, y1, x2, y2),
+                              {"arrow": tk.LAST, "fill": "#dc3545" if hot else "#adb5bd",
+                               "width": 2 if hot else 1}))
+            for (x, y), (_, _, label, kind) in zip(points, component.nodes):
+                items.append(("oval", (x - r, y - r, x + r, y + r),
+                              {"fill": NODE_COLORS[kind], "outline": ""}))
+                if labels:
+                    items.append(("text", (x + r + 2, y), {"text": label, "anchor": tk.W}))
+    elif cell_px >= BLOCK_PX:
+        pad = cell_px * 0.1
+        for component, cx, cy in cells:
+            x, y = screen(cx, cy)
+            items.append(("rectangle", (x + pad, y + pad, x + cell_px - pad, y + cell_px - pad),
+                          {"fill": NODE_COLORS[CYCLE] if component.deadlocked else "#dee2e6",
+                           "outline": ""}))
+    else:
+        # Whole grid as one outline; only deadlocked cells are drawn
+        w, h = layout.extent
+        x, y = screen(0, 0)
+        items.append(("rectangle", (x, y, x + w * scale, y + h * scale),
+                      {"outline": "#adb5bd", "fill": "#f8f9fa"}))
+        size = max(3, cell_px * 0.8)
+        for component, cx, cy in cells:
+            if not component.deadlocked:
+                break
+            x, y = screen(cx, cy)
+            items.append(("rectangle", (x, y, x + size, y + size),
+                          {"fill": NODE_COLORS[CYCLE], "outline": ""}))
+    return items
+
+
+class GraphView:
+    """Toplevel window with a pannable, zoomable wait-for graph"""
+
+    def __init__(self, master, on_close=None):
+        self.layout = GraphLayout()
+        self.scale = 1.0
+        self.left = 0.0
+        self.top = 0.0
+        self._drag = None
+        self._pending = None
+        self._graph = None
+        self._on_close = on_close
+
+        self.window = tk.Toplevel(master)
+        self.window.title("Wait-for Graph")
+        self.window.geometry("900x600")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        bar = ttk.Frame(self.window, padding=5)
+        bar.pack(fill=tk.X)
+        ttk.Button(bar, text="Fit", command=self.fit).pack(side=tk.LEFT)
+        ttk.Button(bar, text="Deadlocks", command=self.show_deadlocks).pack(side=tk.LEFT, padx=5)
+        self.status = ttk.Label(bar, text="", foreground="gray")
+        self.status.pack(side=tk.LEFT, padx=10)
+
+        self.canvas = tk.Canvas(self.window, background="white", highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<ButtonPress-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<MouseWheel>", lambda e: self._zoom(e.x, e.y, 1.25 if e.delta > 0 else 0.8))
+        self.canvas.bind("<Button-4>", lambda e: self._zoom(e.x, e.y, 1.25))
+        self.canvas.bind("<Button-5>", lambda e: self._zoom(e.x, e.y, 0.8))
+        self.canvas.bind("<Configure>", lambda e: self._schedule())
+
+    def set_graph(self, graph):
+        """Show a new wait-for graph; calls close together are merged"""
+        self._graph = graph
+        self._schedule()
+
+    def close(self):
+        if self._pending is not None:
+            self.window.after_cancel(self._pending)
+            self._pending = None
+        self.window.destroy()
+        if self._on_close is not None:
+            self._on_close()
+
+    def lift(self):
+        self.window.deiconify()
+        self.window.lift()
+
+    def fit(self):
+        w, h = self.layout.extent
+        self.scale = min(MAX_SCALE, self.canvas.winfo_width() / w, self.canvas.winfo_height() / h)
+        self.left = self.top = 0.0
+        self._render()
+
+    def show_deadlocks(self):
+        # Deadlocked components come first: start at the origin, one cell
+        # tall at the detail level
+        self.scale = max(1.0, DETAIL_PX * 1.5 / CELL)
+        self.left = self.top = 0.0
+        self._render()
+
+    def _schedule(self):
+        if self._pending is not None:
+            self.window.after_cancel(self._pending)
+        self._pending = self.window.after(SETTLE_MS, self._render)
+
+    def _render(self):
+        self._pending = None
+        if self._graph is not None:
+            self.layout.update(self._graph)
+            self._graph = None
+            total = sum(c.size for c in self.layout.components)
+            self.status.config(text=(
+                f"{len(self.layout.components)} components, {total} processes in wait "
+                f"chains, {self.layout.deadlocked()} deadlocked "
+                f"({self.layout.relaid} laid out again)"
+            ))
+
+        canvas = self.canvas
+        canvas.delete("all")
+        create = {"line": canvas.create_line, "oval": canvas.create_oval,
+                  "rectangle": canvas.create_rectangle, "text": canvas.create_text}
+        for kind, coords, options in draw_list(self.layout, self.left, self.top,
+                                               canvas.winfo_width(), canvas.winfo_height(),
+                                               self.scale):
+            create[kind](*coords, **options)
+
+    def _on_press(self, event):
+        self._drag = (event.x, event.y)
+
+    def _on_drag(self, event):
+        dx = event.x - self._drag[0]
+        dy = event.y - self._drag[1]
+        self._drag = (event.x, event.y)
+        self.canvas.move("all", dx, dy)
+        self.left -= dx / self.scale
+        self.top -= dy / self.scale
+        self._schedule()
+
+    def _zoom(self, x, y, factor):
+        w, h = self.layout.extent
+        floor = min(self.canvas.winfo_width() / w, self.canvas.winfo_height() / h, 1.0) / 2
+        scale = min(MAX_SCALE, max(floor, self.scale * factor))
+        factor = scale / self.scale
+        if factor == 1:
+            return
+        # Keep the point under the pointer in place
+        self.left += x / self.scale - x / scale
+        self.top += y / self.scale - y / scale
+        self.scale = scale
+        self.canvas.scale("all", x, y, factor, factor)
+        self._schedule()
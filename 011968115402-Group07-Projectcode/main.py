@@ -1,17 +1,54 @@
+"""Command line entry point.
+
+    python main.py analyze input/case1.csv [-o output/result.db] [--quiet] [--metrics m.prom]
+    python main.py analyze pools.csv --pools --capacity db=4 [--default-capacity 2]
+    python main.py gui [input/case1.csv]
+    python main.py batch input/ --workers 4       (see batch.py)
+    python main.py bench --sizes 1000 10000       (see benchmark.py)
+    python main.py serve --port 7070              (see monitor.py)
+    python main.py timeline input/case1.csv --at 4   (see timeline.py)
+    python main.py fuzz --time-budget 60          (see fuzz.py)
+
+Without a subcommand it works as before: `python main.py case.csv
+[result.csv]` analyzes the file and opens the GUI, and with no arguments
+it first asks which input case to use.
+
+Only the core and the CSV modules are imported up front. tkinter, the
+visualization and the other tools are imported by the subcommand that
+uses them, so `analyze` starts quickly in containers and cron jobs
+(`python main.py bench --startup` measures it).
+"""
+import argparse
+import importlib
+import logging
 import os
 import sys
-from pathlib import Path
 
+import metrics
 from deadlock_core import DeadlockCore          # Đức
-from csv_loader import load_csv                 # Trọng
-from deadlock_detector import DeadlockDetector  # Phát
-from csv_export import CSVLogger                # Kiệt
-from GUI import DeadlockVisualizer              # Huy
+from csv_loader import CSVFormatError, iter_batches, iter_operations  # Trọng
+# deadlock_detector.py                         # Phát
+from csv_export import result_logger            # Kiệt
+# GUI.py (imported by the gui subcommand)       # Huy
+from events import attach_logging
 # visualization.py                              # Bảo
 
+# Subcommands that run another module's main(argv), imported on use
+DELEGATED = {
+    "batch": ("batch", "analyze a directory of traces in parallel"),
+    "bench": ("benchmark", "benchmark the engines on synthetic traces"),
+    "serve": ("monitor", "live deadlock monitoring over a socket"),
+    "timeline": ("timeline", "when each deadlock formed and was resolved"),
+    "fuzz": ("fuzz", "check the engines against the reference detector"),
+}
+
+COMMANDS = ("analyze", "gui") + tuple(DELEGATED)
+
 
 def select_csv_file():
     """Let user select a CSV file from input folder"""
+    from pathlib import Path
+
     script_dir = Path(__file__).parent
     input_dir = script_dir / "input"
     
@@ -50,84 +87,227 @@ def select_csv_file():
             print(f"Invalid input. Please enter a number between 1 and {len(csv_files)}")
 
 
-def main():
-    # In thư mục chạy (debug đường dẫn)
-    print("Current working directory:", os.getcwd())
+def analyze(csv_file, output_path=None, log_events=True, cache_dir=None):
+    """Replay csv_file into a new core, writing one result row per step.
 
-    # Khởi tạo Core
+    Prints the deadlock check at the end. Returns the core, or None if
+    the file is not a valid trace. With `cache_dir` the trace is read
+    through csv_loader.load_trace's compiled cache.
+    """
+    # Khởi tạo Core; its events go to the console through logging
     core = DeadlockCore()
+    if log_events:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        attach_logging(core)
 
-    # Load CSV input - with selection menu
-    csv_file = None
-    
-    # If a command line argument is provided, use it
-    if len(sys.argv) > 1:
-        csv_file = sys.argv[1]
-    else:
-        # Otherwise, let user select
-        csv_file = select_csv_file()
-    
-    if not csv_file:
-        return
-
+    # Operations are streamed in encoded batches: memory depends on live
+    # processes/resources, not on the length of the trace
     try:
-        operations = load_csv(csv_file)
+        batches = iter_batches(csv_file, cache_dir=cache_dir)
     except Exception as e:
         print("CSV ERROR:", e)
-        return
-
-    # Khởi tạo Detector & Logger
-    detector = DeadlockDetector(core)
-    logger = CSVLogger(core)
-
-    # Áp dụng từng thao tác + log
-    for op in operations:
-        process = op["process"]
-        action = op["action"]
-        resource = op["resource"]
-
-        # Tạo process / resource nếu chưa tồn tại
-        if process not in core.processes:
-            core.create_process(process)
-        if resource not in core.resources:
-            core.create_resource(resource)
-
-        # Thực hiện action
-        if action in ("request", "hold"):
-            core.request_resource(process, resource)
-        elif action == "release":
-            r = core.resources[resource]
-            p = core.processes[process]
-
-            if r in p.holding:
-                p.holding.remove(r)
-            if r.allocated_to == p:
-                r.allocated_to = None
-
-            for proc in core.processes.values():
-                if proc.waiting_for == r:
-                    proc.waiting_for = None
-
-        # Log trạng thái sau mỗi bước
-        logger.log_step(process, action, resource)
-
-    # Detect deadlock
-    has_deadlock, cycle = detector.detect_deadlock()
+        return None
+
+    # The logger keeps result.csv open and flushes it on exit, also on
+    # error. A .db/.sqlite output path writes an indexed delta store instead.
+    with result_logger(core, output_path) as logger:
+        try:
+            # Áp dụng từng thao tác + log trạng thái sau mỗi bước
+            for names, codes, process_ids, resource_ids in batches:
+                core.apply_batch(names, codes, process_ids, resource_ids,
+                                 on_step=logger.log_step)
+        except CSVFormatError as e:
+            print("CSV ERROR:", e)
+            return None
+
+    # Detect deadlock (same answer as DeadlockDetector; the core caches
+    # it, so the visualization reuses the result)
+    cycle = core.detect_deadlock()
 
     print("\n=== DEADLOCK CHECK ===")
-    if has_deadlock:
+    if cycle:
         print("DEADLOCK DETECTED:", " -> ".join(cycle))
+        # Gợi ý tiến trình cần preempt (không áp dụng vào core)
+        from recovery import cost_function, plan_recovery
+        victims = plan_recovery(core.wait_for_graph(), cost_function(core))
+        print("Suggested victims (fewest resources held):", ", ".join(victims))
     else:
         print("No deadlock detected.")
 
-    # Print visualization statistics
-    from visualization import run_visualization
-    run_visualization(core)
-    
+    return core
+
+
+def analyze_pools(csv_file, capacities=None, default_capacity=1):
+    """Replay a trace with a count column into a MultiInstanceCore.
+
+    Resources are pools of `capacities[name]` (or `default_capacity`)
+    units. Prints the matrix deadlock check and returns the core, or None
+    if the file is not a valid trace or a request does not fit its pool.
+    """
+    from multi_instance_core import MultiInstanceCore, apply_operations
+
+    core = MultiInstanceCore(capacities, default_capacity)
+    try:
+        for line_num, op in iter_operations(csv_file, numbered=True):
+            try:
+                apply_operations(core, (op,))
+            except ValueError as e:
+                # The pools are part of the input: report it like a bad row
+                raise CSVFormatError(f"Line {line_num}: {e}") from e
+    except (CSVFormatError, OSError) as e:
+        print("CSV ERROR:", e)
+        return None
+
+    deadlocked = core.detect_deadlock()
+
+    print("\n=== DEADLOCK CHECK (pooled resources) ===")
+    if deadlocked:
+        print("DEADLOCK DETECTED:", ", ".join(deadlocked))
+    else:
+        print("No deadlock detected.")
+
+    return core
+
+
+def _capacity(text):
+    """argparse type for --capacity NAME=UNITS"""
+    name, sep, units = text.rpartition("=")
+    try:
+        units = int(units)
+    except ValueError:
+        units = 0
+    if not sep or not name or units < 1:
+        raise argparse.ArgumentTypeError(f"expected NAME=UNITS with UNITS >= 1, got '{text}'")
+    return name, units
+
+
+def launch_gui(core, csv_file=None, cache_dir=None):
+    from GUI import DeadlockVisualizer
+
     # Run GUI (this will block)
     print("\nLaunching GUI...")
-    app = DeadlockVisualizer(core)
+    app = DeadlockVisualizer(core, csv_file, cache_dir)
     app.run()
 
+
+def legacy_main(argv):
+    """`python main.py [case.csv [result.csv]]`: analyze, print, open the GUI"""
+    # In thư mục chạy (debug đường dẫn)
+    print("Current working directory:", os.getcwd())
+
+    # If a command line argument is provided, use it
+    # (an optional second one sets the result file)
+    if argv:
+        csv_file = argv[0]
+        output_path = argv[1] if len(argv) > 1 else None
+    else:
+        # Otherwise, let user select
+        csv_file = select_csv_file()
+        output_path = None
+
+    if not csv_file:
+        return 0
+
+    core = analyze(csv_file, output_path)
+    if core is None:
+        return 1
+
+    # Print visualization statistics
+    from visualization import run_visualization
+    run_visualization(core)
+
+    launch_gui(core, csv_file)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Deadlock detection on CSV traces. Without a command: "
+                    "main.py [case.csv [result.csv]] analyzes and opens the GUI.",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    p = commands.add_parser("analyze", help="replay a trace without a GUI and report deadlocks")
+    p.add_argument("csv_file")
+    p.add_argument("-o", "--output",
+                   help="result file; .db/.sqlite writes a delta store (default output/result.csv)")
+    p.add_argument("-q", "--quiet", action="store_true", help="do not log every event")
+    p.add_argument("--graph", action="store_true",
+                   help="also print the wait-for graph and the detection time")
+    p.add_argument("--cache-dir", metavar="DIR",
+                   help="keep a compiled copy of the trace in DIR and reuse it while the CSV is unchanged")
+    p.add_argument("--metrics", metavar="PATH",
+                   help="write counters and histograms for the run (.prom for Prometheus text, else JSON)")
+    p.add_argument("--pools", action="store_true",
+                   help="resources have several units; honours the count column (matrix detection)")
+    p.add_argument("--capacity", metavar="NAME=UNITS", type=_capacity, action="append", default=[],
+                   help="units of one pooled resource (repeatable, implies --pools)")
+    p.add_argument("--default-capacity", metavar="UNITS", type=int, default=1,
+                   help="units of pooled resources without --capacity (default 1)")
+
+    p = commands.add_parser("gui", help="open the GUI, optionally on an analyzed trace")
+    p.add_argument("csv_file", nargs="?")
+    p.add_argument("-o", "--output", help="result file when a trace is given")
+    p.add_argument("--cache-dir", metavar="DIR",
+                   help="keep compiled copies of the traces loaded in the GUI in DIR")
+
+    for name, (module, text) in DELEGATED.items():
+        commands.add_parser(name, help=f"{text} (options: main.py {name} --help)")
+
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    if not argv or (argv[0] not in COMMANDS and not argv[0].startswith("-")):
+        return legacy_main(argv)
+
+    if argv[0] in DELEGATED:
+        module = importlib.import_module(DELEGATED[argv[0]][0])
+        return module.main(argv[1:])
+
+    args = build_parser().parse_args(argv)
+
+    if args.command == "gui":
+        if not args.csv_file:
+            launch_gui(DeadlockCore(), cache_dir=args.cache_dir)
+            return 0
+        core = analyze(args.csv_file, args.output, log_events=False,
+                       cache_dir=args.cache_dir)
+        if core is None:
+            return 1
+        launch_gui(core, args.csv_file, args.cache_dir)
+        return 0
+
+    if args.metrics:
+        registry = metrics.enable()
+
+    if args.pools or args.capacity:
+        if args.output:
+            build_parser().error("--output is not supported with --pools")
+        if args.default_capacity < 1:
+            build_parser().error("--default-capacity must be at least 1")
+        core = analyze_pools(args.csv_file, dict(args.capacity), args.default_capacity)
+    else:
+        core = analyze(args.csv_file, args.output, log_events=not args.quiet,
+                       cache_dir=args.cache_dir)
+
+    # Written for failed runs too: the rows read before the error are in it
+    if args.metrics:
+        metrics.write(registry, args.metrics)
+    if core is None:
+        return 1
+    if args.pools or args.capacity:
+        if args.graph:
+            core.show_state()
+        return 0
+    if args.graph:
+        from visualization import run_visualization
+        run_visualization(core)
+    return 0
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,112 @@
+try:
+    import numpy as np
+except ImportError:     # NumPy is optional: fall back to plain Python
+    np = None
+
+
+class MatrixDeadlockDetector:
+    """Deadlock detection for multi-instance resources.
+
+    Uses the Available / Allocation / Request matrix algorithm. A process
+    with nothing held and nothing requested is done. Any other process
+    whose outstanding request fits in Work can finish and return its
+    allocation to Work; MultiInstanceCore grants every request that fits,
+    so this is also the order it would run them in. A process that only
+    waits (holds nothing) for units that are never freed is reported
+    too. With NumPy, each round finishes every such process at once
+    with vector operations. Processes left unfinished are deadlocked.
+    """
+
+    def __init__(self, core, use_numpy=None):
+        self.core = core
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy and np is None:
+            raise ImportError("NumPy is not installed")
+
+    def build_matrices(self):
+        """Return (process names, resource names, available, allocation, request)"""
+        process_names = sorted(self.core.processes)
+        resource_names = sorted(self.core.resources)
+        p_index = {name: i for i, name in enumerate(process_names)}
+        r_index = {name: i for i, name in enumerate(resource_names)}
+
+        available = [self.core.resources[name].available for name in resource_names]
+        alloc_cells = []
+        request_cells = []
+        for name in process_names:
+            process = self.core.processes[name]
+            i = p_index[name]
+            for resource, units in process.allocation.items():
+                alloc_cells.append((i, r_index[resource], units))
+            for resource, units in process.request.items():
+                request_cells.append((i, r_index[resource], units))
+
+        shape = (len(process_names), len(resource_names))
+        if self.use_numpy:
+            available = np.array(available, dtype=np.int64)
+            allocation = _dense(alloc_cells, shape)
+            request = _dense(request_cells, shape)
+        else:
+            allocation = _rows(alloc_cells, shape[0])
+            request = _rows(request_cells, shape[0])
+
+        return process_names, resource_names, available, allocation, request
+
+    def detect_deadlock(self):
+        names, _, available, allocation, request = self.build_matrices()
+        if self.use_numpy:
+            finished = _finish_numpy(available, allocation, request)
+        else:
+            finished = _finish_python(available, allocation, request)
+
+        deadlocked = [name for name, done in zip(names, finished) if not done]
+        return bool(deadlocked), deadlocked
+
+
+def _dense(cells, shape):
+    matrix = np.zeros(shape, dtype=np.int64)
+    if cells:
+        rows, cols, values = zip(*cells)
+        matrix[list(rows), list(cols)] = values
+    return matrix
+
+
+def _rows(cells, n_rows):
+    rows = [{} for _ in range(n_rows)]
+    for i, j, units in cells:
+        rows[i][j] = units
+    return rows
+
+
+def _finish_numpy(available, allocation, request):
+    work = available.copy()
+    finished = ~allocation.any(axis=1) & ~request.any(axis=1)
+
+    while True:
+        runnable = ~finished & (request <= work).all(axis=1)
+        if not runnable.any():
+            return finished.tolist()
+        work += allocation[runnable].sum(axis=0)
+        finished |= runnable
+
+
+def _finish_python(available, allocation, request):
+    work = list(available)
+    finished = [not row and not wanted for row, wanted in zip(allocation, request)]
+    pending = [i for i, done in enumerate(finished) if not done]
+
+    progress = True
+    while progress and pending:
+        progress = False
+        still_pending = []
+        for i in pending:
+            if all(units <= work[j] for j, units in request[i].items()):
+                for j, units in allocation[i].items():
+                    work[j] += units
+                finished[i] = True
+                progress = True
+            else:
+                still_pending.append(i)
+        pending = still_pending
+
+    return finished
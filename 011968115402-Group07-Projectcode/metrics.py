@@ -0,0 +1,175 @@
+"""Built-in counters and histograms for the loader, cores, detector and logger.
+
+Collection is off by default. Every instrumented spot reads
+`metrics.active` and does nothing when it is None, so a disabled run
+pays one attribute lookup per spot. Turn it on with:
+
+    import metrics
+    registry = metrics.enable()
+    ...replay...
+    print(registry.to_prometheus())
+
+Metrics:
+    deadlock_csv_rows_total              rows yielded by the CSV reader
+    deadlock_csv_errors_total            rows rejected as malformed
+    deadlock_trace_cache_total{result}   binary trace cache hits/misses
+    deadlock_trace_compile_seconds       time to compile a trace
+    deadlock_ops_total{op}               operations applied to the core, per
+                                         op (request, hold, release)
+    deadlock_wait_edges_added_total
+    deadlock_wait_edges_removed_total
+    deadlock_cycle_check_nodes           nodes followed per incremental check
+    deadlock_cycles_formed_total
+    deadlock_detect_seconds{detector}    detection latency
+    deadlock_detect_nodes{detector}      nodes visited per detection
+    deadlock_logger_rows_total
+    deadlock_logger_bytes_total          bytes written to result files
+"""
+from bisect import bisect_left
+
+# Upper bounds for latency histograms, in seconds
+LATENCY_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0)
+
+# Upper bounds for size histograms (nodes visited, ...)
+SIZE_BUCKETS = tuple(4 ** i for i in range(11))
+
+# Registry that instrumented code records into; None while disabled
+active = None
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms keyed by (name, labels).
+
+    `labels` is a tuple of (key, value) pairs, e.g. (("op", "request"),).
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def to_dict(self):
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "buckets": list(h.buckets),
+                 "counts": list(h.counts), "sum": h.sum, "count": h.count}
+                for (name, labels), h in sorted(self.histograms.items())
+            ],
+        }
+
+    def merge(self, data):
+        """Add the metrics from a to_dict() result (e.g. from a worker)"""
+        for c in data["counters"]:
+            self.inc(c["name"], c["value"], tuple(sorted(c["labels"].items())))
+        for h in data["histograms"]:
+            key = (h["name"], tuple(sorted(h["labels"].items())))
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(h["buckets"])
+            elif list(histogram.buckets) != list(h["buckets"]):
+                raise ValueError(f"bucket mismatch for {h['name']}")
+            histogram.counts = [a + b for a, b in zip(histogram.counts, h["counts"])]
+            histogram.sum += h["sum"]
+            histogram.count += h["count"]
+
+    def to_json(self, indent=2):
+        import json
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self):
+        """Render in the Prometheus text exposition format"""
+        lines = []
+        typed = set()
+
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        for (name, labels), h in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(h.buckets + ("+Inf",), h.counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(h.sum)}")
+            lines.append(f"{name}_count{_labels(labels)} {h.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _number(value):
+    # repr of a float round-trips exactly; :g would keep 6 digits
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def enable():
+    """Start collecting (if not already) and return the registry"""
+    global active
+    if active is None:
+        active = Metrics()
+    return active
+
+
+def disable():
+    """Stop collecting; returns the registry that was active, if any"""
+    global active
+    registry, active = active, None
+    return registry
+
+
+def write(registry, path):
+    """Write metrics to `path`: Prometheus text for .prom/.txt, JSON otherwise"""
+    if path.endswith((".prom", ".txt")):
+        text = registry.to_prometheus()
+    else:
+        text = registry.to_json() + "\n"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
@@ -0,0 +1,357 @@
+"""Live deadlock monitoring over a local socket.
+
+Clients send one JSON object per line:
+
+    {"process": "P1", "action": "request", "resource": "R1"}
+
+Events from all connections go through one ordered queue and are applied
+to a single DeadlockCore. The core checks each new wait edge for a cycle,
+so alerts come out as soon as a deadlock forms or is broken:
+
+    {"event": "deadlock_formed", "cycle": ["P1", "P2"], "step": 42}
+    {"event": "deadlock_resolved", "cycle": ["P1", "P2"], "step": 57}
+
+A connection that sends {"subscribe": true} receives these alerts. A bad
+line is answered with {"error": ...} and skipped.
+
+The queue is bounded. When it is full, the server stops reading from
+clients and the kernel socket buffers push back on the senders. Alerts
+raised while a batch is applied go to each subscriber in one write,
+without waiting; a subscriber that stops reading is disconnected instead
+of stalling the queue.
+
+    python monitor.py --port 7070
+    python monitor.py --unix /tmp/deadlock.sock
+    python monitor.py --load-test 1000000 --clients 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from csv_loader import ACTIONS, VALID_ACTIONS
+from deadlock_core import DeadlockCore
+from events import DEADLOCK_FORMED, DEADLOCK_RESOLVED
+
+READ_SIZE = 1 << 16          # bytes read from a client at a time
+QUEUE_BATCHES = 64           # queue capacity, in batches of up to READ_SIZE bytes
+SUBSCRIBER_BUFFER = 1 << 20  # unsent alert bytes before a subscriber is dropped
+
+_encode = json.JSONEncoder().encode
+_raw_decode = json.JSONDecoder().raw_decode
+_CODE_OF = {action: code for code, action in enumerate(ACTIONS)}
+
+
+class MonitorServer:
+    """Apply events from socket clients to one core and publish alerts"""
+
+    def __init__(self, core=None, queue_size=QUEUE_BATCHES):
+        self.core = core if core is not None else DeadlockCore()
+        self.queue = asyncio.Queue(queue_size)
+        self.step = 0
+        self.errors = 0
+        self._servers = []
+        self._clients = set()        # StreamWriters of every open connection
+        self._subscribers = set()    # StreamWriters of subscribed connections
+        self._outbox = []            # encoded alerts not yet sent to subscribers
+        self._listeners = []         # in-process callbacks
+        self._consumer = None
+
+        self.core.subscribe(DEADLOCK_FORMED, lambda cycle: self._alert(DEADLOCK_FORMED, cycle))
+        self.core.subscribe(DEADLOCK_RESOLVED, lambda cycle: self._alert(DEADLOCK_RESOLVED, cycle))
+
+    async def start_tcp(self, host="127.0.0.1", port=7070):
+        server = await asyncio.start_server(self._handle_client, host, port)
+        return self._started(server)
+
+    async def start_unix(self, path):
+        server = await asyncio.start_unix_server(self._handle_client, path)
+        return self._started(server)
+
+    def _started(self, server):
+        self._servers.append(server)
+        if self._consumer is None:
+            self._consumer = asyncio.create_task(self._consume())
+        return server
+
+    def add_listener(self, callback):
+        """Call callback(alert) in-process for every alert"""
+        self._listeners.append(callback)
+        return callback
+
+    async def drain(self):
+        """Wait until every queued event has been applied"""
+        await self.queue.join()
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+        if self._consumer is not None:
+            await self.drain()
+            self._consumer.cancel()
+            self._consumer = None
+        # From Python 3.12 wait_closed() also waits for open connections,
+        # so drop subscribers and clients before waiting on the servers
+        for writer in list(self._clients):
+            writer.close()
+        self._clients.clear()
+        self._subscribers.clear()
+        for server in self._servers:
+            if hasattr(server, "close_clients"):
+                server.close_clients()
+            await server.wait_closed()
+        self._servers.clear()
+
+    async def _handle_client(self, reader, writer):
+        self._clients.add(writer)
+        pending = b""
+        try:
+            while True:
+                chunk = await reader.read(READ_SIZE)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                batch = self._parse(lines, writer)
+                if batch:
+                    # Blocks while the queue is full: that is the backpressure
+                    await self.queue.put(batch)
+            if pending.strip():
+                batch = self._parse([pending], writer)
+                if batch:
+                    await self.queue.put(batch)
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            self._subscribers.discard(writer)
+            writer.close()
+
+    def _parse(self, lines, writer):
+        lines = [line.strip() for line in lines]
+        lines = [line for line in lines if line]
+        if not lines:
+            return []
+        try:
+            # Decode the chunk to text once, then each line in place. The
+            # value decoded at a line's start must end exactly at its end,
+            # so "[{...}" / "{...}]" or "{...}, {...}" lines are rejected.
+            text = b"\n".join(lines).decode("utf-8")
+        except UnicodeDecodeError:
+            text = None
+
+        batch = []
+        start = 0
+        for line in lines:
+            try:
+                if text is None:
+                    message = json.loads(line)
+                else:
+                    end = text.find("\n", start)
+                    if end < 0:
+                        end = len(text)
+                    try:
+                        message, stop = _raw_decode(text, start)
+                        if stop != end:
+                            raise ValueError("extra data")
+                    except ValueError:
+                        # Decode the line alone: the error then points into it
+                        message = json.loads(line)
+                    finally:
+                        start = end + 1
+                if message.get("subscribe"):
+                    self._subscribers.add(writer)
+                    continue
+                action = message["action"]
+                if action not in VALID_ACTIONS:
+                    raise ValueError(f"invalid action '{action}'")
+                batch.append((str(message["process"]), action, str(message["resource"])))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self.errors += 1
+                self._send(writer, {"error": f"{type(e).__name__}: {e}"})
+        return batch
+
+    async def _consume(self):
+        core = self.core
+        processes = core.processes
+        resources = core.resources
+        while True:
+            batch = await self.queue.get()
+            try:
+                for process, action, resource in batch:
+                    if process not in processes:
+                        core.create_process(process)
+                    if resource not in resources:
+                        core.create_resource(resource)
+
+                    self.step += 1
+                    if action == "release":
+                        core.release_resource(process, resource)
+                    else:
+                        core.request_resource(process, resource, _CODE_OF[action])
+            finally:
+                self._flush_alerts()
+                self.queue.task_done()
+            # queue.get() does not yield while batches are waiting; let
+            # readers and subscriber writes make progress between batches
+            await asyncio.sleep(0)
+
+    def _alert(self, event, cycle):
+        if self._listeners:
+            alert = {"event": event, "cycle": list(cycle), "step": self.step}
+            for callback in self._listeners:
+                callback(alert)
+        if self._subscribers:
+            # Same text as _encode(alert), without building the dict
+            self._outbox.append(
+                f'{{"event": "{event}", "cycle": {_encode(list(cycle))}, "step": {self.step}}}\n'
+            )
+
+    def _flush_alerts(self):
+        """Send the alerts raised by one batch as a single write per subscriber"""
+        if not self._outbox:
+            return
+        data = "".join(self._outbox).encode()
+        self._outbox.clear()
+        for writer in list(self._subscribers):
+            self._send(writer, data)
+
+    def _send(self, writer, message):
+        if writer.is_closing():
+            self._subscribers.discard(writer)
+            return
+        if writer.transport.get_write_buffer_size() > SUBSCRIBER_BUFFER:
+            # Too slow to keep up; never let one reader stall the queue
+            self._subscribers.discard(writer)
+            writer.close()
+            return
+        if isinstance(message, dict):
+            message = _encode(message).encode() + b"\n"
+        writer.write(message)
+
+
+async def open_client(host="127.0.0.1", port=7070, path=None):
+    """Connect a stand-in client; returns (reader, writer)"""
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+def encode_events(events, lines_per_chunk=1000):
+    """Encode operation dicts as chunks of JSON lines, ready to send"""
+    chunks = []
+    buffer = []
+    for event in events:
+        buffer.append(json.dumps(event))
+        if len(buffer) == lines_per_chunk:
+            chunks.append(("\n".join(buffer) + "\n").encode())
+            buffer = []
+    if buffer:
+        chunks.append(("\n".join(buffer) + "\n").encode())
+    return chunks
+
+
+async def send_events(events, host="127.0.0.1", port=7070, path=None):
+    """Send operation dicts (or chunks from encode_events) from one connection"""
+    if not isinstance(events, list) or not events or not isinstance(events[0], bytes):
+        events = encode_events(events)
+    _, writer = await open_client(host, port, path)
+    for chunk in events:
+        writer.write(chunk)
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _count_lines(reader):
+    count = 0
+    while True:
+        chunk = await reader.read(READ_SIZE)
+        if not chunk:
+            return count
+        count += chunk.count(b"\n")
+
+
+async def load_test(n_events, clients=4):
+    """Push n_events from `clients` connections through a fresh server.
+
+    Each client works on its own processes and resources and closes a
+    two-process deadlock every six events, so alerts flow too. Events are
+    encoded before the clock starts. Returns (events per second, alerts
+    received by a subscriber).
+    """
+    from benchmark import ring_trace
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "monitor.sock")
+        server = MonitorServer()
+        await server.start_unix(path)
+
+        reader, writer = await open_client(path=path)
+        writer.write(b'{"subscribe": true}\n')
+        await writer.drain()
+        counting = asyncio.create_task(_count_lines(reader))
+
+        per_client = n_events // clients
+        payloads = [
+            encode_events(
+                {"process": f"C{c}.{op['process']}", "action": op["action"],
+                 "resource": f"C{c}.{op['resource']}"}
+                for op in ring_trace(per_client, ring_size=2)
+            )
+            for c in range(clients)
+        ]
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send_events(p, path=path) for p in payloads))
+        await server.drain()
+        elapsed = time.perf_counter() - start
+
+        await server.close()
+        alerts = await counting
+        writer.close()
+
+    return server.step / elapsed, alerts
+
+
+async def serve(args):
+    server = MonitorServer(queue_size=args.queue)
+    server.add_listener(lambda alert: print(json.dumps(alert), flush=True))
+    if args.unix:
+        await server.start_unix(args.unix)
+        print(f"Listening on {args.unix}", file=sys.stderr)
+    else:
+        await server.start_tcp(args.host, args.port)
+        print(f"Listening on {args.host}:{args.port}", file=sys.stderr)
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live deadlock monitoring server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--queue", type=int, default=QUEUE_BATCHES,
+                        help="queue capacity in batches")
+    parser.add_argument("--load-test", type=int, metavar="N",
+                        help="send N events through a local server and report throughput")
+    parser.add_argument("--clients", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    if args.load_test:
+        rate, alerts = asyncio.run(load_test(args.load_test, args.clients))
+        print(f"{rate:.0f} events/s, {alerts} alerts")
+        return 0
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
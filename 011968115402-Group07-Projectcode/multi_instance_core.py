@@ -0,0 +1,141 @@
+class PoolResource:
+    def __init__(self, name, capacity=1):
+        if capacity < 1:
+            raise ValueError(f"capacity of {name} must be at least 1")
+        self.name = name
+        self.capacity = capacity
+        self.available = capacity
+        self.allocation = {}      # process name -> units held
+        self.queue = {}           # process name -> None, FIFO of waiters
+
+    def __repr__(self):
+        return (f"PoolResource({self.name}, available={self.available}/"
+                f"{self.capacity}, allocation={self.allocation})")
+
+
+class PoolProcess:
+    def __init__(self, name):
+        self.name = name
+        self.allocation = {}      # resource name -> units held
+        self.request = {}         # resource name -> units still wanted
+
+    def __repr__(self):
+        return (f"PoolProcess({self.name}, holding={self.allocation}, "
+                f"requesting={self.request})")
+
+
+class MultiInstanceCore:
+    """Resources with several identical instances (connection slots,
+    worker tokens, ...).
+
+    A request is granted whenever enough units are free. Otherwise the
+    units are recorded as an outstanding request and the process queues
+    for them. Releases go through the queue in FIFO order and grant every
+    request that fits, so a large request at the head does not hold back
+    smaller ones behind it. No queued request ever fits the free units,
+    which is what the matrix algorithm in matrix_detector assumes (a
+    wait-for graph cannot decide deadlock here).
+    """
+
+    def __init__(self, capacities=None, default_capacity=1):
+        self.processes = {}
+        self.resources = {}
+        self.capacities = dict(capacities or {})
+        self.default_capacity = default_capacity
+
+    def create_process(self, name):
+        self.processes[name] = PoolProcess(name)
+
+    def create_resource(self, name, capacity=None):
+        if capacity is None:
+            capacity = self.capacities.get(name, self.default_capacity)
+        self.resources[name] = PoolResource(name, capacity)
+
+    def request_resource(self, process_name, resource_name, count=1):
+        process = self.processes[process_name]
+        resource = self.resources[resource_name]
+        # Units held plus units still wanted can never exceed the pool,
+        # otherwise the request could never be granted
+        wanted = process.request.get(resource.name, 0) + count
+        held = process.allocation.get(resource.name, 0)
+        if count < 1 or held + wanted > resource.capacity:
+            raise ValueError(f"{process_name} requests {count} units of {resource_name} "
+                             f"(holding {held}, waiting for {wanted - count}), "
+                             f"which has {resource.capacity}")
+
+        if resource.name not in process.request and resource.available >= count:
+            self._grant(process, resource, count)
+        else:
+            # Already queued for this resource: the request grows in place
+            process.request[resource.name] = wanted
+            resource.queue[process.name] = None
+
+    def release_resource(self, process_name, resource_name, count=None):
+        process = self.processes.get(process_name)
+        resource = self.resources.get(resource_name)
+        if not process or not resource:
+            return
+
+        held = process.allocation.get(resource.name, 0)
+        units = held if count is None else min(count, held)
+        if units:
+            if units == held:
+                del process.allocation[resource.name]
+                del resource.allocation[process.name]
+            else:
+                process.allocation[resource.name] = held - units
+                resource.allocation[process.name] = held - units
+            resource.available += units
+
+        self._serve_queue(resource)
+
+    def detect_deadlock(self):
+        from matrix_detector import MatrixDeadlockDetector
+
+        has_deadlock, processes = MatrixDeadlockDetector(self).detect_deadlock()
+        return processes if has_deadlock else []
+
+    def show_state(self):
+        print("\n PROCESS STATE ")
+        for p in self.processes.values():
+            print(p)
+
+        print("\n RESOURCE STATE")
+        for r in self.resources.values():
+            print(r)
+
+    def _grant(self, process, resource, count):
+        resource.available -= count
+        process.allocation[resource.name] = process.allocation.get(resource.name, 0) + count
+        resource.allocation[process.name] = resource.allocation.get(process.name, 0) + count
+
+    def _serve_queue(self, resource):
+        for name in list(resource.queue):
+            if not resource.available:
+                break
+            process = self.processes[name]
+            wanted = process.request[resource.name]
+            if wanted > resource.available:
+                continue
+
+            del resource.queue[name]
+            del process.request[resource.name]
+            self._grant(process, resource, wanted)
+
+
+def apply_operations(core, operations):
+    """Apply operations (dicts, optionally with "count") to a MultiInstanceCore"""
+    for op in operations:
+        process = op["process"]
+        resource = op["resource"]
+
+        if process not in core.processes:
+            core.create_process(process)
+        if resource not in core.resources:
+            core.create_resource(resource)
+
+        if op["action"] in ("request", "hold"):
+            core.request_resource(process, resource, op.get("count", 1))
+        elif op["action"] == "release":
+            # Without a count column a release frees everything held
+            core.release_resource(process, resource, op.get("count"))
@@ -0,0 +1,367 @@
+"""Component-sharded deadlock detection for very large wait-for graphs.
+
+Processes in different weakly connected components of the wait-for
+graph cannot be in the same cycle, and a DFS in one component never
+touches another. The parent interns the names to int ids once, labels
+the components with union-find and groups the edges by component. The
+edge arrays and the component offsets go into shared memory; a task
+only carries a range of components and reads its own slice.
+
+Waiters are numbered in name order, so the smallest id is the smallest
+name. That makes the merged answers identical to DeadlockDetector:
+detect_deadlock() gives the same (found, path) and detect_all_deadlocks()
+the same cycles. Edges to processes that wait for nothing are dropped:
+such a process cannot be on a cycle.
+
+    python parallel_detector.py --clusters 200000 --cluster-size 10 --workers 4
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, compress, repeat
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import numpy as np
+except ImportError:     # plain arrays and sorted() instead
+    np = None
+
+from deadlock_detector import DeadlockDetector, find_deadlock_cycles, first_deadlock
+
+# Below this many edges one process is faster than starting a pool
+SERIAL_THRESHOLD = 50000
+
+# Batches per worker, so a few large components do not leave workers idle
+BATCHES_PER_WORKER = 4
+
+
+class ParallelDeadlockDetector(DeadlockDetector):
+    """DeadlockDetector that shards the wait-for graph over a process pool.
+
+    One sharded run answers both detect_deadlock() and
+    detect_all_deadlocks(); it is reused until the core changes (cores
+    with a `generation` counter). The pool is started on first use and
+    kept until close().
+    """
+
+    def __init__(self, core, workers=None, serial_threshold=SERIAL_THRESHOLD):
+        super().__init__(core)
+        self.workers = workers or os.cpu_count() or 1
+        self.serial_threshold = serial_threshold
+        self._pool = None
+        self._result = None      # (generation, detect_sharded result)
+
+    def detect(self):
+        """The detect_sharded() result for the core's current state"""
+        generation = getattr(self.core, "generation", None)
+        if generation is not None and self._result and self._result[0] == generation:
+            return self._result[1]
+
+        graph = self.build_wait_for_graph()
+        if self._pool is None and graph and len(graph) >= self.serial_threshold:
+            self._pool = start_pool(self.workers)
+        result = detect_sharded(graph, self.workers, self.serial_threshold, self._pool)
+        self._result = (generation, result)
+        return result
+
+    def detect_deadlock(self):
+        return self.detect()["deadlock"]
+
+    def detect_all_deadlocks(self):
+        return self.detect()["cycles"]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def start_pool(workers):
+    """A ProcessPoolExecutor whose workers share this process's resource
+    tracker, so attaching to a segment does not register it again"""
+    resource_tracker.ensure_running()
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def _numpy_wanted(use_numpy):
+    if use_numpy is None:
+        return np is not None
+    if use_numpy and np is None:
+        raise ImportError("NumPy is not installed")
+    return use_numpy
+
+
+def encode_graph(graph, use_numpy=None):
+    """Intern a wait-for graph; returns (names, src, dst).
+
+    names are the waiters in sorted order, src/dst are array("i") edges
+    in graph order. Edges to processes that are not waiters are left out.
+    use_numpy (default: when installed) picks the vectorized path; both
+    give the same arrays.
+    """
+    names = sorted(graph)
+    ids = dict(zip(names, range(len(names))))
+    holders = chain.from_iterable(graph.values())
+    if _numpy_wanted(use_numpy):
+        counts = np.fromiter(map(len, graph.values()), np.int32, len(graph))
+        s = np.repeat(np.fromiter(map(ids.__getitem__, graph), np.int32, len(graph)), counts)
+        d = np.fromiter(map(ids.get, holders, repeat(-1)), np.int32, len(s))
+        keep = d >= 0
+        return names, array("i", s[keep].tobytes()), array("i", d[keep].tobytes())
+
+    src = array("i", chain.from_iterable(map(repeat, map(ids.__getitem__, graph),
+                                             map(len, graph.values()))))
+    dst = list(map(ids.get, holders, repeat(-1)))
+    if -1 in dst:
+        keep = [d >= 0 for d in dst]
+        src = array("i", compress(src, keep))
+        dst = compress(dst, keep)
+    return names, src, array("i", dst)
+
+
+def component_labels(n_nodes, src, dst):
+    """Union-find over the edges; returns the root of every node"""
+    parent = list(range(n_nodes))
+    for a, b in zip(src, dst):
+        while parent[a] != a:
+            parent[a] = a = parent[parent[a]]
+        while parent[b] != b:
+            parent[b] = b = parent[parent[b]]
+        if a != b:
+            if a < b:
+                parent[b] = a
+            else:
+                parent[a] = b
+
+    for i in range(n_nodes):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        parent[i] = root
+    return parent
+
+
+def group_by_component(labels, src, dst, use_numpy=None):
+    """Reorder the edges so each component is contiguous.
+
+    Returns (src, dst, offsets): the edges of the i-th component are
+    offsets[i]:offsets[i + 1]. The order of a node's edges is kept.
+    Components come in label order, with or without NumPy.
+    """
+    if _numpy_wanted(use_numpy):
+        s = np.frombuffer(src, dtype=np.int32)
+        d = np.frombuffer(dst, dtype=np.int32)
+        keys = np.asarray(labels, dtype=np.int32)[s]
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.diff(keys)) + 1
+        offsets = array("i", [0])
+        offsets.extend(starts.tolist())
+        offsets.append(len(keys))
+        return array("i", s[order].tobytes()), array("i", d[order].tobytes()), offsets
+
+    keys = [labels[a] for a in src]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    offsets = array("i", [0])
+    for i in range(1, len(order)):
+        if keys[order[i]] != keys[order[i - 1]]:
+            offsets.append(i)
+    offsets.append(len(order))
+    return (array("i", map(src.__getitem__, order)), array("i", map(dst.__getitem__, order)),
+            offsets)
+
+
+def _functional_cycles(successor):
+    # Every node waits for at most one other: walking from each root in
+    # id order finds the same cycles as Tarjan, and the first walk that
+    # closes one is what first_deadlock() stops at
+    owner = {}
+    cycles = []
+    first = None
+    for root in sorted(successor):
+        if root in owner:
+            continue
+        path = []
+        node = root
+        while node is not None and node not in owner:
+            owner[node] = root
+            path.append(node)
+            node = successor.get(node)
+        if node is not None and owner[node] == root:
+            cycle = path[path.index(node):]
+            i = cycle.index(min(cycle))
+            cycles.append(cycle[i:] + cycle[:i])
+            if first is None:
+                first = (root, sorted(path))
+    cycles.sort()
+    return cycles, first
+
+
+def _detect_edges(src, dst):
+    successor = dict(zip(src, dst))
+    if len(successor) == len(src):
+        return _functional_cycles(successor)
+
+    graph = {}
+    for w, h in zip(src, dst):
+        holders = graph.get(w)
+        if holders is None:
+            graph[w] = [h]
+        else:
+            holders.append(h)
+    return find_deadlock_cycles(graph), first_deadlock(graph)
+
+
+def _detect_components(shm_name, n_edges, lo, hi):
+    """Worker: detect deadlocks in components lo..hi-1 of the shared arrays"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # src, dst, then the component offsets, all int32
+        ints = shm.buf.cast("i")
+        try:
+            start, stop = ints[2 * n_edges + lo], ints[2 * n_edges + hi]
+            src = ints[start:stop].tolist()
+            dst = ints[n_edges + start:n_edges + stop].tolist()
+        finally:
+            ints.release()
+    finally:
+        shm.close()
+    return _detect_edges(src, dst)
+
+
+def _batches(offsets, n_batches):
+    """Split the components into ranges with about the same number of edges"""
+    n_components = len(offsets) - 1
+    n_edges = offsets[-1]
+    bounds = [0]
+    for k in range(1, n_batches):
+        lo = bounds[-1] + 1
+        if lo >= n_components:
+            break
+        bounds.append(bisect_left(offsets, n_edges * k // n_batches, lo, n_components - 1))
+    bounds.append(n_components)
+    return list(zip(bounds, bounds[1:]))
+
+
+def detect_sharded(graph, workers=None, serial_threshold=SERIAL_THRESHOLD, pool=None):
+    """Detect deadlocks in `graph` component by component.
+
+    Pass `pool` (from start_pool) to reuse it across calls.
+    Returns {"deadlock": (found, path), "cycles": [...], "components": n,
+    "batches": n}, where the first two match DeadlockDetector.
+    """
+    if not graph or len(graph) < serial_threshold:
+        first = first_deadlock(graph)
+        return {"deadlock": (True, first[1]) if first else (False, []),
+                "cycles": find_deadlock_cycles(graph), "components": None, "batches": None}
+
+    workers = workers or os.cpu_count() or 1
+    names, src, dst = encode_graph(graph)
+    if not src:
+        return {"deadlock": (False, []), "cycles": [], "components": 0, "batches": 0}
+    src, dst, offsets = group_by_component(component_labels(len(names), src, dst), src, dst)
+    n_edges = len(src)
+    n_components = len(offsets) - 1
+    batches = _batches(offsets, workers * BATCHES_PER_WORKER)
+
+    shm = shared_memory.SharedMemory(create=True, size=4 * (2 * n_edges + len(offsets)))
+    owned = pool is None
+    try:
+        shm.buf[:4 * n_edges] = src.tobytes()
+        shm.buf[4 * n_edges:8 * n_edges] = dst.tobytes()
+        shm.buf[8 * n_edges:] = offsets.tobytes()
+        if owned:
+            pool = start_pool(workers)
+        futures = [pool.submit(_detect_components, shm.name, n_edges, lo, hi)
+                   for lo, hi in batches]
+        results = [f.result() for f in futures]
+    finally:
+        if owned and pool is not None:
+            pool.shutdown()
+        shm.close()
+        shm.unlink()
+
+    cycles = []
+    first = None
+    for batch_cycles, batch_first in results:
+        cycles.extend(batch_cycles)
+        if batch_first is not None and (first is None or batch_first[0] < first[0]):
+            first = batch_first
+
+    # Ids follow name order, so sorting ids sorts the names
+    cycles.sort()
+    return {
+        "deadlock": (True, [names[n] for n in first[1]]) if first else (False, []),
+        "cycles": [[names[n] for n in cycle] for cycle in cycles],
+        "components": n_components,
+        "batches": len(batches),
+    }
+
+
+def clustered_graph(clusters, cluster_size, deadlocked=0.1, seed=0):
+    """Wait-for graph of independent clusters; some end in a cycle"""
+    rnd = random.Random(seed)
+    graph = {}
+    for c in range(clusters):
+        members = [f"P{c}.{i}" for i in range(cluster_size)]
+        # Random in-tree: each member but the first waits for an earlier one
+        for i in range(1, cluster_size):
+            graph[members[i]] = [members[rnd.randrange(i)]]
+        if rnd.random() < deadlocked:
+            graph[members[0]] = [members[-1]]
+    return dict(sorted(graph.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure sharded vs serial detection")
+    parser.add_argument("--clusters", type=int, default=100000)
+    parser.add_argument("--cluster-size", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    args = parser.parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+
+    graph = clustered_graph(args.clusters, args.cluster_size, seed=args.seed)
+    print(f"{len(graph)} edges in {args.clusters} clusters, {workers} workers")
+
+    serial_s = sharded_s = float("inf")
+    # The pool is started once, as ParallelDeadlockDetector keeps it
+    with start_pool(workers) as pool:
+        list(pool.map(abs, range(workers)))
+        for _ in range(max(1, args.repeat)):
+            start = time.perf_counter()
+            serial = first_deadlock(graph)
+            serial_cycles = find_deadlock_cycles(graph)
+            serial_s = min(serial_s, time.perf_counter() - start)
+            serial = (True, serial[1]) if serial else (False, [])
+
+            start = time.perf_counter()
+            result = detect_sharded(graph, workers, serial_threshold=0, pool=pool)
+            sharded_s = min(sharded_s, time.perf_counter() - start)
+
+            if result["deadlock"] != serial or result["cycles"] != serial_cycles:
+                print("MISMATCH between sharded and serial results", file=sys.stderr)
+                return 1
+
+    print(f"serial  {serial_s:8.3f} s")
+    print(f"sharded {sharded_s:8.3f} s  ({result['components']} components in "
+          f"{result['batches']} batches, speed-up {serial_s / sharded_s:.2f}x)")
+    print(f"{len(result['cycles'])} cycles")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Time travel over a trace: periodic snapshots plus the operation log.
+
+    replayer = TraceReplayer(iter_operations("input/case1.csv"))
+    core = replayer.seek(3)     # state after the first 3 operations
+
+The operations are kept packed (an interned name table plus op-code and
+ID arrays, like csv_loader's compiled traces). While replaying, the core
+takes a snapshot every `snapshot_every` steps. seek(step) restores the
+nearest snapshot at or before `step`, or keeps going from the current
+position if that is closer, and applies only the remaining operations.
+
+A snapshot costs one entry per process and resource, so the interval
+adapts to the state:
+    - by default it is never shorter than the state is wide, which keeps
+      snapshotting within a constant factor of the replay itself;
+    - the snapshots together hold at most `snapshot_budget` entries. Past
+      that, the interval doubles and every other snapshot is dropped.
+Memory therefore stays bounded however long the trace is; a wide state
+gets fewer, further apart snapshots and longer seeks instead.
+"""
+import bisect
+from array import array
+
+from csv_loader import ACTIONS, CompiledTrace
+from deadlock_core import DeadlockCore
+
+
+SNAPSHOT_EVERY = 10000
+SNAPSHOT_BUDGET = 1 << 20    # process and resource entries held across snapshots
+
+
+class TraceReplayer:
+    def __init__(self, operations, core=None, snapshot_every=None,
+                 snapshot_budget=SNAPSHOT_BUDGET):
+        self.core = core if core is not None else DeadlockCore()
+        # None: start at SNAPSHOT_EVERY and widen with the state
+        self.adaptive = snapshot_every is None
+        self.snapshot_every = SNAPSHOT_EVERY if self.adaptive else max(1, snapshot_every)
+        self.snapshot_budget = snapshot_budget
+
+        if isinstance(operations, CompiledTrace):
+            self.names = operations.names
+            self.codes = operations.codes
+            self.process_ids = operations.processes
+            self.resource_ids = operations.resources
+        else:
+            self._encode(operations)
+
+        self.step = 0
+        self._snapshot_steps = [0]
+        self._snapshots = [self.core.snapshot()]
+        self._snapshot_sizes = [self._state_size()]
+
+    def _encode(self, operations):
+        ids = {}
+        self.codes = array("B")
+        self.process_ids = array("i")
+        self.resource_ids = array("i")
+        code_of = {action: code for code, action in enumerate(ACTIONS)}
+
+        for op in operations:
+            self.codes.append(code_of[op["action"]])
+            self.process_ids.append(ids.setdefault(op["process"], len(ids)))
+            self.resource_ids.append(ids.setdefault(op["resource"], len(ids)))
+
+        self.names = list(ids)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def operation(self, step):
+        """Return the operation that moves the trace from step-1 to step"""
+        i = step - 1
+        return {
+            "process": self.names[self.process_ids[i]],
+            "action": ACTIONS[self.codes[i]],
+            "resource": self.names[self.resource_ids[i]]
+        }
+
+    def seek(self, step):
+        """Bring the core to the state after `step` operations and return it"""
+        if not 0 <= step <= len(self):
+            raise IndexError(f"step {step} out of range 0..{len(self)}")
+
+        i = bisect.bisect_right(self._snapshot_steps, step) - 1
+        base = self._snapshot_steps[i]
+        if not base <= self.step <= step:
+            self.core.restore(self._snapshots[i])
+            self.step = base
+
+        self._advance(step)
+        return self.core
+
+    @property
+    def snapshot_steps(self):
+        """Steps that currently have a snapshot"""
+        return tuple(self._snapshot_steps)
+
+    @property
+    def snapshot_entries(self):
+        """Process and resource entries held by the stored snapshots"""
+        return sum(self._snapshot_sizes)
+
+    def replay_all(self):
+        """Replay to the end, taking every snapshot on the way"""
+        return self.seek(len(self))
+
+    def _advance(self, target):
+        core = self.core
+        every = self.snapshot_every
+
+        # Apply up to each snapshot boundary in one batch
+        step = self.step
+        while step < target:
+            stop = min(target, (step // every + 1) * every)
+            core.apply_batch(self.names, self.codes, self.process_ids,
+                             self.resource_ids, step, stop)
+            step = stop
+            if step % every == 0 and step > self._snapshot_steps[-1]:
+                self._take_snapshot(step)
+                every = self.snapshot_every
+
+        self.step = target
+
+    def _state_size(self):
+        return len(self.core.processes) + len(self.core.resources)
+
+    def _take_snapshot(self, step):
+        size = self._state_size()
+        self._snapshot_steps.append(step)
+        self._snapshots.append(self.core.snapshot())
+        self._snapshot_sizes.append(size)
+
+        every = self.snapshot_every
+        if self.adaptive:
+            while every < size:
+                every *= 2
+        while sum(self._snapshot_sizes) > self.snapshot_budget and len(self._snapshots) > 1:
+            every *= 2
+            # Keep step 0 and the snapshots on the new, wider grid
+            keep = [i for i, s in enumerate(self._snapshot_steps) if s % every == 0]
+            self._snapshot_steps = [self._snapshot_steps[i] for i in keep]
+            self._snapshots = [self._snapshots[i] for i in keep]
+            self._snapshot_sizes = [self._snapshot_sizes[i] for i in keep]
+        self.snapshot_every = every
@@ -0,0 +1,236 @@
+"""Deadlock timeline: when each cycle formed, what closed it, when it broke.
+
+One pass over a trace with a DeadlockCore, listening to its
+deadlock_formed / deadlock_resolved events. The core checks each new
+wait edge incrementally, so the pass is linear in the trace plus the
+length of the cycles found:
+
+    timeline = build_timeline(iter_batches("input/case1.csv"))
+    timeline.active_at(4)          # intervals open after step 4
+    timeline.involving("P1")
+    timeline.formed_between(1, 100)
+
+Steps are 1-based, as in result.csv. An interval is open after steps
+formed_step .. resolved_step - 1; resolved_step is None if the cycle was
+never broken.
+
+Stabbing queries (active_at) use intervals grouped by length, in powers
+of two, each group sorted by formed step. Only intervals that formed
+within twice the group's length before the step are looked at, and most
+of those are open by construction. No per-step state is kept.
+
+    python timeline.py input/case1.csv --at 4
+    python timeline.py big.csv --save big.timeline.json
+"""
+import argparse
+import json
+import sys
+from bisect import bisect_left, bisect_right
+
+from deadlock_core import DeadlockCore
+from events import DEADLOCK_FORMED, DEADLOCK_RESOLVED
+
+
+class DeadlockInterval:
+    __slots__ = ("members", "formed_step", "closed_by", "resolved_step")
+
+    def __init__(self, members, formed_step, closed_by, resolved_step=None):
+        self.members = members              # cycle, from its smallest member
+        self.formed_step = formed_step
+        self.closed_by = closed_by          # (process, action, resource)
+        self.resolved_step = resolved_step
+
+    def to_dict(self):
+        return {
+            "members": list(self.members),
+            "formed_step": self.formed_step,
+            "closed_by": list(self.closed_by),
+            "resolved_step": self.resolved_step,
+        }
+
+    def __repr__(self):
+        end = self.resolved_step if self.resolved_step is not None else "-"
+        return f"<Deadlock {' -> '.join(self.members)} steps {self.formed_step}..{end}>"
+
+
+class TimelineBuilder:
+    """Collect deadlock intervals from a core's events.
+
+    Pass log_step as the on_step callback of apply_batch (it keeps the
+    step count and fills in the closing operation), then call finish().
+    """
+
+    def __init__(self, core):
+        self.core = core
+        self.step = 0
+        self.intervals = []
+        self._open = {}          # cycle as emitted -> interval
+        self._closing = []       # formed during the current step
+        self._handlers = [
+            (DEADLOCK_FORMED, self._formed),
+            (DEADLOCK_RESOLVED, self._resolved),
+        ]
+        for event, handler in self._handlers:
+            core.subscribe(event, handler)
+
+    def _formed(self, cycle):
+        i = cycle.index(min(cycle))
+        interval = DeadlockInterval(cycle[i:] + cycle[:i], self.step + 1, None)
+        self._open[cycle] = interval
+        self.intervals.append(interval)
+        self._closing.append(interval)
+
+    def _resolved(self, cycle):
+        interval = self._open.pop(cycle, None)
+        if interval is not None:
+            interval.resolved_step = self.step + 1
+
+    def log_step(self, process, action, resource):
+        self.step += 1
+        if self._closing:
+            for interval in self._closing:
+                interval.closed_by = (process, action, resource)
+            self._closing.clear()
+
+    def finish(self):
+        for event, handler in self._handlers:
+            self.core.unsubscribe(event, handler)
+        return DeadlockTimeline(self.intervals, self.step)
+
+
+def build_timeline(batches, core=None):
+    """Replay (names, codes, process_ids, resource_ids) batches, as from
+    csv_loader.iter_batches, and return their DeadlockTimeline"""
+    core = core if core is not None else DeadlockCore()
+    builder = TimelineBuilder(core)
+    for names, codes, process_ids, resource_ids in batches:
+        core.apply_batch(names, codes, process_ids, resource_ids, on_step=builder.log_step)
+    return builder.finish()
+
+
+class DeadlockTimeline:
+    """Query index over DeadlockInterval objects, ordered by formed step"""
+
+    def __init__(self, intervals, steps):
+        self.intervals = sorted(intervals, key=lambda d: d.formed_step)
+        self.steps = steps
+        self._formed = [d.formed_step for d in self.intervals]
+
+        self._by_process = {}
+        for i, d in enumerate(self.intervals):
+            for member in d.members:
+                self._by_process.setdefault(member, []).append(i)
+
+        # Unresolved intervals, and resolved ones by length class
+        # (length in [2^c, 2^(c+1))), each list sorted by formed step
+        self._unresolved = []
+        self._classes = {}
+        for i, d in enumerate(self.intervals):
+            if d.resolved_step is None:
+                self._unresolved.append(i)
+            else:
+                length = d.resolved_step - d.formed_step
+                self._classes.setdefault(max(length, 1).bit_length() - 1, []).append(i)
+        self._class_formed = {c: [self._formed[i] for i in ids] for c, ids in self._classes.items()}
+        self._unresolved_formed = [self._formed[i] for i in self._unresolved]
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __iter__(self):
+        return iter(self.intervals)
+
+    def active_at(self, step):
+        """Intervals open after `step` operations"""
+        found = self._unresolved[:bisect_right(self._unresolved_formed, step)]
+        for c, ids in self._classes.items():
+            formed = self._class_formed[c]
+            # Longer than 2^(c+1) steps is impossible in this class
+            lo = bisect_left(formed, step - (1 << (c + 1)) + 1)
+            hi = bisect_right(formed, step)
+            for i in ids[lo:hi]:
+                if self.intervals[i].resolved_step > step:
+                    found.append(i)
+        return [self.intervals[i] for i in sorted(found)]
+
+    def involving(self, process):
+        """Intervals in which `process` is a cycle member"""
+        return [self.intervals[i] for i in self._by_process.get(process, ())]
+
+    def formed_between(self, since=None, until=None):
+        """Intervals formed at steps since..until (inclusive)"""
+        lo = 0 if since is None else bisect_left(self._formed, since)
+        hi = len(self._formed) if until is None else bisect_right(self._formed, until)
+        return self.intervals[lo:hi]
+
+    def to_dict(self):
+        return {"steps": self.steps, "intervals": [d.to_dict() for d in self.intervals]}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        intervals = [
+            DeadlockInterval(tuple(d["members"]), d["formed_step"], tuple(d["closed_by"]),
+                             d["resolved_step"])
+            for d in data["intervals"]
+        ]
+        return cls(intervals, data["steps"])
+
+
+def print_intervals(intervals, file=None):
+    for d in intervals:
+        resolved = d.resolved_step if d.resolved_step is not None else "never"
+        process, action, resource = d.closed_by
+        print(f"{' -> '.join(d.members)}: formed at step {d.formed_step} "
+              f"({process} {action} {resource}), resolved at {resolved}", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index when each deadlock formed and resolved")
+    parser.add_argument("source", help="CSV trace, or a timeline saved with --save (.json)")
+    parser.add_argument("--at", type=int, help="only deadlocks open after this step")
+    parser.add_argument("--process", help="only deadlocks this process is part of")
+    parser.add_argument("--since", type=int, help="only deadlocks formed at or after this step")
+    parser.add_argument("--until", type=int, help="only deadlocks formed at or before this step")
+    parser.add_argument("--save", help="write the whole timeline as JSON")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="keep a compiled copy of the trace in DIR for the next run")
+    args = parser.parse_args(argv)
+
+    if args.source.endswith(".json"):
+        timeline = DeadlockTimeline.load(args.source)
+    else:
+        from csv_loader import CSVFormatError, iter_batches
+        try:
+            timeline = build_timeline(iter_batches(args.source, cache_dir=args.cache_dir))
+        except (OSError, CSVFormatError) as e:
+            print("CSV ERROR:", e, file=sys.stderr)
+            return 1
+
+    if args.save:
+        timeline.save(args.save)
+
+    if args.at is not None:
+        intervals = timeline.active_at(args.at)
+    elif args.since is not None or args.until is not None:
+        intervals = timeline.formed_between(args.since, args.until)
+    elif args.process:
+        intervals = timeline.involving(args.process)
+    else:
+        intervals = timeline.intervals
+    if args.process:
+        intervals = [d for d in intervals if args.process in d.members]
+
+    print_intervals(intervals)
+    print(f"\n{len(intervals)} of {len(timeline)} deadlocks, {timeline.steps} steps",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,36 +1,34 @@
 import time
-from collections import defaultdict
+
+# Edges printed before the list is cut short; the GUI's Graph View shows
+# large graphs
+MAX_EDGES = 50
 
 
 def run_visualization(core):
     print("\n=== WAIT-FOR GRAPH ===")
 
-    graph = defaultdict(list)
-    for p in core.processes.values():
-        if p.waiting_for and p.waiting_for.allocated_to:
-            graph[p.name].append(p.waiting_for.allocated_to.name)
+    # Cached by the core until the next operation
+    graph = core.wait_for_graph()
 
     if not graph:
         print("No waiting edges.")
     else:
-        for p, waits in graph.items():
-            for w in waits:
-                print(f"{p} -> {w}")
+        edges = [(p, w) for p, waits in graph.items() for w in waits]
+        for p, w in edges[:MAX_EDGES]:
+            print(f"{p} -> {w}")
+        if len(edges) > MAX_EDGES:
+            print(f"... {len(edges) - MAX_EDGES} more edges ({len(edges)} in total)")
 
     print("\n=== DEADLOCK CHECK ===")
-    start = time.time()
+    start = time.perf_counter()
     deadlock = core.detect_deadlock()
-    end = time.time()
+    end = time.perf_counter()
 
     print("Deadlock detected:", bool(deadlock))
     print("Detection time:", round((end - start) * 1000, 3), "ms")
 
-    print("\n=== STRESS TEST ===")
-    for n in (5, 10, 30):
-        start = time.time()
-        core.detect_deadlock()
-        end = time.time()
-        print(f"{n} processes: {round((end - start) * 1000, 3)} ms")
+    # Throughput/latency numbers on real workloads: see benchmark.py
 
 
 if __name__ == "__main__":